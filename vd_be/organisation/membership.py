@@ -0,0 +1,25 @@
+from django.core.cache import cache
+
+from organisation.models import ProjectEmployee
+
+# Upper bound on staleness where the cache is per process (LocMemCache); shared
+# backends see the signal-driven invalidation immediately
+MEMBERSHIP_CACHE_TTL = 300
+
+
+def _cache_key(user_id):
+    return f'project_roles:{user_id}'
+
+
+def get_project_roles(user_id):
+    """{project_id: role} for every project the user works on, cached per user."""
+    key = _cache_key(user_id)
+    roles = cache.get(key)
+    if roles is None:
+        roles = dict(ProjectEmployee.objects.filter(user_id=user_id).values_list('project_id', 'role'))
+        cache.set(key, roles, MEMBERSHIP_CACHE_TTL)
+    return roles
+
+
+def invalidate_project_roles(user_id):
+    cache.delete(_cache_key(user_id))
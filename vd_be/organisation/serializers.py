@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from organisation.models import Organisation, ProjectEmployee, Project, Spec, SpecValue, Vehicle, VehicleSpec
+from vd_be.row_serializers import RowSerializer
 
 User = get_user_model()
 
@@ -55,4 +56,32 @@ class OrganisationSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-    
\ No newline at end of file
+# values()-based serializers for sparse fieldsets (?fields= / ?include=) on list endpoints
+
+SpecRowSerializer = RowSerializer(Spec, {
+    'id': 'id', 'organisation': 'organisation_id', 'category': 'category', 'title': 'title',
+    'createdAt': 'createdAt', 'updatedAt': 'updatedAt',
+})
+
+SpecValueRowSerializer = RowSerializer(SpecValue, {
+    'id': 'id', 'spec': 'spec_id', 'value': 'value', 'value_type': 'value_type',
+    'createdAt': 'createdAt', 'updatedAt': 'updatedAt',
+}, related={'spec': ('spec', SpecRowSerializer)})
+
+VehicleSpecRowSerializer = RowSerializer(VehicleSpec, {
+    'id': 'id', 'vehicle': 'vehicle_id', 'spec': 'spec_id', 'default': 'default',
+    'createdAt': 'createdAt', 'updatedAt': 'updatedAt',
+}, related={'spec': ('spec', SpecValueRowSerializer)})
+
+# Credentials and permission flags are deliberately not selectable
+UserRowSerializer = RowSerializer(User, {
+    'id': 'id', 'username': 'username', 'first_name': 'first_name', 'last_name': 'last_name',
+    'full_name': 'full_name', 'email': 'email', 'organisation': 'organisation_id',
+    'phone_number': 'phone_number', 'gender': 'gender', 'profile_picture_url': 'profile_picture_url',
+    'createdAt': 'createdAt', 'updatedAt': 'updatedAt',
+}, default_fields=['id', 'username', 'full_name', 'email', 'organisation', 'profile_picture_url'])
+
+ProjectEmployeeRowSerializer = RowSerializer(ProjectEmployee, {
+    'id': 'id', 'project': 'project_id', 'user': 'user_id', 'role': 'role',
+    'createdAt': 'createdAt', 'updatedAt': 'updatedAt',
+}, related={'user': ('user', UserRowSerializer)})
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from organisation.membership import invalidate_project_roles
+from organisation.models import ProjectEmployee
+
+
+@receiver(post_save, sender=ProjectEmployee)
+@receiver(post_delete, sender=ProjectEmployee)
+def project_employee_changed(sender, instance, **kwargs):
+    invalidate_project_roles(instance.user_id)
@@ -1,3 +1,133 @@
+from datetime import datetime, timedelta, timezone
+from itertools import combinations
+from unittest import mock
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from organisation.models import Organisation, Project, ProjectEmployee, User, Vehicle
+from organisation.serializers import ProjectEmployeeRowSerializer, UserRowSerializer
+from vd_be import middleware
+from vd_be.row_serializers import PLAN_CACHE_SIZE
+
+
+def auth_cookie(user, expires_in=timedelta(hours=1)):
+    payload = {'user_id': user.id, 'exp': datetime.now(timezone.utc) + expires_in}
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
+
+
+class ProjectFixtureTestCase(TestCase):
+    """
+    An organisation with a vehicle and a project, and a user working on the project
+    as ROLE, signed in through the client's JWT cookie.
+    """
+    ROLE = 'tester'
+
+    def setUp(self):
+        # Ids are reused after each test's rollback, so drop cached tokens and lookups
+        middleware.token_cache.clear()
+        cache.clear()
+        self.organisation = Organisation.objects.create(name='Org')
+        self.vehicle = Vehicle.objects.create(
+            organisation=self.organisation, name='Vehicle', body_number='BN1', manufacturer='M', year=2025
+        )
+        self.project = self.create_project('P1')
+        self.user = self.add_member(self.ROLE)
+        self.client.cookies['jwt'] = auth_cookie(self.user)
+
+    def create_project(self, code):
+        return Project.objects.create(
+            organisation=self.organisation, name=f'Project {code}', code=code, parent_code='P0', vehicle=self.vehicle
+        )
+
+    def add_member(self, username, project=None):
+        user = User.objects.create(username=username, organisation=self.organisation)
+        ProjectEmployee.objects.create(project=project or self.project, user=user, role=self.ROLE)
+        return user
+
+
+class JWTAuthenticationTests(ProjectFixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        self.projects = [self.project]
+        for code in ('P2', 'P3'):
+            project = self.create_project(code)
+            ProjectEmployee.objects.create(project=project, user=self.user, role=self.ROLE)
+            self.projects.append(project)
+
+    def test_warm_token_is_not_verified_again(self):
+        self.client.cookies['jwt'] = auth_cookie(self.user)
+        with mock.patch.object(middleware.jwt, 'decode', wraps=jwt.decode) as decode:
+            for _ in range(3):
+                self.assertEqual(self.client.get('/user/').status_code, 200)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_cached_token_still_expires(self):
+        self.client.cookies['jwt'] = auth_cookie(self.user, expires_in=timedelta(seconds=30))
+        self.assertEqual(self.client.get('/user/').status_code, 200)
+        later = middleware.time.time() + 60
+        # Past exp the cached claims are dropped and the token is verified (and rejected) again
+        with mock.patch.object(middleware.time, 'time', return_value=later), \
+                mock.patch.object(middleware.jwt, 'decode', side_effect=jwt.ExpiredSignatureError) as decode:
+            response = self.client.get('/user/')
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(response.status_code, 401)
+
+    def test_user_projects_come_from_the_principal_memberships(self):
+        self.client.cookies['jwt'] = auth_cookie(self.user)
+        # memberships, projects with their vehicles
+        with self.assertNumQueries(2):
+            response = self.client.get('/user/projects/')
+        self.assertEqual(len(response.json()['projects']), 3)
+
+    def test_memberships_are_cached_until_they_change(self):
+        self.client.cookies['jwt'] = auth_cookie(self.user)
+        self.client.get('/user/projects/')
+        # projects with their vehicles
+        with self.assertNumQueries(1):
+            self.client.get('/user/projects/')
+
+        ProjectEmployee.objects.filter(project=self.projects[0]).delete()
+        response = self.client.get('/user/projects/')
+        self.assertEqual(len(response.json()['projects']), 2)
+        self.assertEqual(self.client.get(f'/project/{self.projects[0].id}/employees/').status_code, 403)
+
+
+class ProjectEmployeesFieldsetTests(ProjectFixtureTestCase):
+    ROLE = 'manager'
+
+    def get_employees(self, **params):
+        return self.client.get(f'/project/{self.project.id}/employees/', params).json()['project_employees']
+
+    def test_sparse_output_matches_the_full_serializer(self):
+        full = self.get_employees()[0]
+        sparse = self.get_employees(fields='updatedAt,createdAt,id,createdAt')[0]
+        self.assertEqual(list(sparse), ['id', 'createdAt', 'updatedAt'])
+        self.assertEqual(sparse, {name: full[name] for name in sparse})
+        self.assertRegex(sparse['createdAt'], r'\.\d{6}Z$')
+
+    def test_equivalent_fieldsets_share_one_bounded_plan_cache(self):
+        plan = ProjectEmployeeRowSerializer.compile(['role', 'id'], ['user', 'user'])
+        self.assertIs(ProjectEmployeeRowSerializer.compile(['id', 'role', 'role'], ['user']), plan)
+        for fields in combinations(UserRowSerializer.available_fields, 3):
+            UserRowSerializer.compile(fields)
+        self.assertEqual(UserRowSerializer._compile_plan.cache_info().currsize, PLAN_CACHE_SIZE)
+
+
+class ProjectEmployeesConditionalGetTests(ProjectFixtureTestCase):
+    ROLE = 'manager'
+
+    def test_removing_the_newest_employee_changes_the_etag(self):
+        url = f'/project/{self.project.id}/employees/'
+        newest = self.add_member('newest')
+        response = self.client.get(url)
+        # The latest updatedAt would move backwards after the delete below
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        ProjectEmployee.objects.filter(user=newest).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['project_employees']), 1)
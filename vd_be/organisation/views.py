@@ -8,13 +8,19 @@ from django.views.decorators.csrf import csrf_exempt
 import json
 from django.views.decorators.http import require_http_methods
 from pydantic import ValidationError as PydanticValidationError
-from django.db.models import F
+from django.db.models import Count, F, Max
 
+from testing.access import project_access
 from testing.models import Test
 from .dto import LoginRequest, SignupRequest
 from vd_be.middleware import jwt_authentication
 from organisation.models import ProjectEmployee, Project, Vehicle, VehicleSpec
-from .serializers import ProjectSerializer, UserSerializer, ProjectEmployeeSerializer, VehicleSpecSerializer
+from vd_be.conditional import fingerprint_condition
+from vd_be.row_serializers import FieldsetError, parse_fieldset
+from .serializers import (
+    ProjectSerializer, UserSerializer, ProjectEmployeeSerializer, VehicleSpecSerializer,
+    ProjectEmployeeRowSerializer, VehicleSpecRowSerializer
+)
 
 User = get_user_model()
 
@@ -73,7 +79,7 @@ def signup_view(request):
 @jwt_authentication
 def user_details_view(request):
     try:
-        user = User.get_by_id(request.user_id)
+        user = request.principal.user
         user_data = UserSerializer(user).data
         return JsonResponse({'user': user_data}, status=200)
     except User.DoesNotExist:
@@ -86,36 +92,66 @@ def user_details_view(request):
 @jwt_authentication
 def user_projects_view(request):
     try:
-        user = User.get_by_id(request.user_id)
-        project_employees = ProjectEmployee.objects.filter(user=user)
-        projects_data = ProjectSerializer([pe.project for pe in project_employees], many=True).data
+        # A deleted account has no memberships left, so it gets an empty list
+        projects = Project.objects.filter(id__in=list(request.principal.project_roles)).select_related('vehicle').order_by('id')
+        projects_data = ProjectSerializer(projects, many=True).data
         
         return JsonResponse({'projects': projects_data}, status=200)
-    except User.DoesNotExist:
-        return JsonResponse({'message': 'User not found'}, status=404)
     except Exception as e:
         return JsonResponse({'message': 'Something went wrong: ' + str(e)}, status=500)
 
+def project_employees_fingerprint(request, project_id):
+    stats = ProjectEmployee.objects.filter(project_id=project_id).aggregate(
+        count=Count('id'), latest=Max('updatedAt'), user_latest=Max('user__updatedAt')
+    )
+    changes = [timestamp for timestamp in (stats['latest'], stats['user_latest']) if timestamp is not None]
+    return stats['count'], max(changes) if changes else None, None
+
 @csrf_exempt
 @require_http_methods(["GET"])
-@jwt_authentication   
+@jwt_authentication
+@project_access('project')
+@fingerprint_condition(project_employees_fingerprint, last_modified=False)
 def project_employees_view(request, project_id):
     try:
         project = Project.get_by_id(project_id)
         project_employees = ProjectEmployee.objects.filter(project=project)
-        project_employees_data = ProjectEmployeeSerializer(project_employees, many=True).data
+        fields, include = parse_fieldset(request)
+        if fields is not None or include is not None:
+            project_employees_data = ProjectEmployeeRowSerializer.serialize(project_employees.order_by('id'), fields, include)
+        else:
+            project_employees_data = ProjectEmployeeSerializer(project_employees, many=True).data
         return JsonResponse({'project_employees': project_employees_data}, status=200)
+    except FieldsetError as e:
+        return JsonResponse({'message': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'message': 'Something went wrong: ' + str(e)}, status=500)
     
+def vehicle_specs_fingerprint(request, vehicle_id):
+    stats = VehicleSpec.objects.filter(vehicle_id=vehicle_id).aggregate(
+        count=Count('id'),
+        latest=Max('updatedAt'),
+        spec_value_latest=Max('spec__updatedAt'),
+        spec_latest=Max('spec__spec__updatedAt'),
+    )
+    changes = [stats[key] for key in ('latest', 'spec_value_latest', 'spec_latest') if stats[key] is not None]
+    return stats['count'], max(changes) if changes else None, None
+
 @csrf_exempt
 @require_http_methods(["GET"])
 @jwt_authentication   
+@fingerprint_condition(vehicle_specs_fingerprint, last_modified=False)
 def vehicle_specs_view(request, vehicle_id):
     try:
         vehicle = Vehicle.get_by_id(vehicle_id)
         vehicle_specs = VehicleSpec.objects.filter(vehicle=vehicle)
-        vehicle_specs_data = VehicleSpecSerializer(vehicle_specs, many=True).data
+        fields, include = parse_fieldset(request)
+        if fields is not None or include is not None:
+            vehicle_specs_data = VehicleSpecRowSerializer.serialize(vehicle_specs.order_by('id'), fields, include)
+        else:
+            vehicle_specs_data = VehicleSpecSerializer(vehicle_specs, many=True).data
         return JsonResponse({'vehicle_specs': vehicle_specs_data}, status=200)
+    except FieldsetError as e:
+        return JsonResponse({'message': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'message': 'Something went wrong: ' + str(e)}, status=500)
\ No newline at end of file
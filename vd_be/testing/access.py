@@ -0,0 +1,159 @@
+import json
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import JsonResponse
+
+from organisation.models import Vehicle
+from testing.models import Session, Test
+
+# test -> project and session -> (project, driver) are invalidated by testing/signals.py
+# when a test is deleted or a session re-linked or deleted. With a per-process cache
+# (LocMemCache, see CACHES in settings) that only reaches the process that made the
+# change, so entries also expire after ACCESS_CACHE_TTL seconds, bounding how long
+# another worker can use a stale owner. Misses are not cached, since the id may be
+# taken by a row created later.
+ACCESS_CACHE_TTL = 60
+TEST_PROJECT_KEY = 'test_project:{}'
+SESSION_PROJECT_KEY = 'session_project:{}'
+
+
+def _cached_lookup(key, load):
+    value = cache.get(key)
+    if value is None:
+        value = load()
+        if value is not None:
+            cache.set(key, value, ACCESS_CACHE_TTL)
+    return value
+
+
+def project_for_test(test_id):
+    """Project id of a test, or None if it does not exist. Warm lookups cost no query."""
+    return _cached_lookup(
+        TEST_PROJECT_KEY.format(test_id),
+        lambda: Test.objects.filter(id=test_id).values_list('project_id', flat=True).first(),
+    )
+
+
+def projects_for_tests(test_ids):
+    """{test_id: project_id} for the tests that exist, with at most one query."""
+    keys = {TEST_PROJECT_KEY.format(test_id): test_id for test_id in set(test_ids)}
+    found = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = [test_id for test_id in keys.values() if test_id not in found]
+    if missing:
+        loaded = dict(Test.objects.filter(id__in=missing).values_list('id', 'project_id'))
+        cache.set_many(
+            {TEST_PROJECT_KEY.format(test_id): project_id for test_id, project_id in loaded.items()}, ACCESS_CACHE_TTL
+        )
+        found.update(loaded)
+    return found
+
+
+def session_owner(session_id):
+    """
+    (project_id, driver_id) of a session, or None if it does not exist. project_id is
+    None while the session is not linked to a test.
+    """
+    value = _cached_lookup(
+        SESSION_PROJECT_KEY.format(session_id),
+        lambda: Session.objects.filter(id=session_id).values_list('test__project_id', 'driver_id').first(),
+    )
+    return tuple(value) if value is not None else None
+
+
+def forget_test(test_id):
+    cache.delete(TEST_PROJECT_KEY.format(test_id))
+
+
+def forget_session(session_id):
+    cache.delete(SESSION_PROJECT_KEY.format(session_id))
+
+
+def has_project_access(request, project_id):
+    return project_id in request.principal.project_roles
+
+
+def session_access(principal, session_id):
+    """Whether the principal may use a session; unknown sessions are allowed (the caller answers 404)."""
+    owner = session_owner(session_id)
+    if owner is None:
+        return True
+    project_id, driver_id = owner
+    if project_id is None:
+        # Not linked to a test yet: only the driver who started it
+        return str(driver_id) == str(principal.user_id)
+    return project_id in principal.project_roles
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def url_arg(name):
+    return lambda request, kwargs: kwargs.get(name)
+
+
+def json_field(name):
+    def read(request, kwargs):
+        try:
+            data = json.loads(request.body)
+        except (ValueError, UnicodeDecodeError):
+            return None
+        return data.get(name) if isinstance(data, dict) else None
+    return read
+
+
+def form_field(name):
+    return lambda request, kwargs: request.POST.get(name)
+
+
+def project_access(kind, source=None):
+    """
+    Only let members of the owning project through (apply below jwt_authentication).
+    kind is 'project', 'test' or 'session'; source reads the id from the
+    request, by default the URL argument '<kind>_id' (see url_arg, json_field and
+    form_field). The project is resolved through cached lookups and the principal's
+    cached membership map, so a warm check runs no queries.
+
+    Missing, malformed or unknown ids are passed through for the view to report (400
+    or 404); a known object in another project gets 403.
+    """
+    source = source or url_arg(f'{kind}_id')
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            object_id = _as_int(source(request, kwargs))
+            if object_id is None:
+                return view_func(request, *args, **kwargs)
+
+            if kind == 'project':
+                allowed = has_project_access(request, object_id)
+            elif kind == 'test':
+                project_id = project_for_test(object_id)
+                allowed = project_id is None or has_project_access(request, project_id)
+            else:
+                allowed = session_access(request.principal, object_id)
+
+            if not allowed:
+                return JsonResponse({'error': 'You do not have access to this project'}, status=403)
+            return view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
+
+
+def vehicle_access(view_func):
+    """
+    Only let users of the vehicle's organisation through (apply below
+    jwt_authentication); for everyone else the vehicle does not exist (404).
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        vehicle_id = kwargs.get('vehicle_id')
+        if not Vehicle.objects.filter(id=vehicle_id, organisation_id=request.principal.organisation_id).exists():
+            return JsonResponse({'error': 'Vehicle not found'}, status=404)
+        return view_func(request, *args, **kwargs)
+    return _wrapped_view
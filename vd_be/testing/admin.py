@@ -1,16 +1,29 @@
 from django.contrib import admin
 from .models import (
- Feedback, Session, Test, TestParticipant, TestGPSCoordinate, FeedbackAnswer, CategoryScore, Report, TestSpecValue, TestingBenchmarkParams, FeedbackQuestion
+ Feedback, Session, Test, TestParticipant, TestGPSCoordinate, FeedbackAnswer, CategoryScore, Report, TestSpecValue, TestingBenchmarkParams, FeedbackQuestion, ProjectSummary,
+ CategoryKeyword, FeedbackTag, QuestionnaireBundle, ProjectTestsVersion,
+ IdempotencyKey, TestGPSTrack, TestGPSTrackPyramid, TrackSection, FeedbackHeatCell, TelemetryChannel
 )
 
 admin.site.register(Test)
 admin.site.register(TestParticipant)
 admin.site.register(TestGPSCoordinate)
+admin.site.register(TestGPSTrack)
+admin.site.register(TestGPSTrackPyramid)
 admin.site.register(FeedbackAnswer)
 admin.site.register(CategoryScore)
 admin.site.register(Report)
 admin.site.register(TestSpecValue)
 admin.site.register(Feedback)
 admin.site.register(Session)
+admin.site.register(TelemetryChannel)
 admin.site.register(TestingBenchmarkParams)
 admin.site.register(FeedbackQuestion)
+admin.site.register(ProjectSummary)
+admin.site.register(CategoryKeyword)
+admin.site.register(TrackSection)
+admin.site.register(FeedbackTag)
+admin.site.register(FeedbackHeatCell)
+admin.site.register(QuestionnaireBundle)
+admin.site.register(ProjectTestsVersion)
+admin.site.register(IdempotencyKey)
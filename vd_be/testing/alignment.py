@@ -0,0 +1,154 @@
+import numpy as np
+from django.db import transaction
+from django.db.models.functions import Coalesce
+
+from testing import geohash
+from testing.heatmap import refresh_feedback
+from testing.models import Feedback, TestGPSCoordinate
+from testing.tracks import from_epoch_ms, load_track, rows_track, to_epoch_ms
+from testing.trip_metrics import haversine_m
+
+# A comment between two fixes further apart than this is in a signal gap: it is only
+# placed if a fix lies within MAX_NEAREST_MS of it, and gets no speed
+MAX_BRACKET_MS = 30_000
+MAX_NEAREST_MS = 5_000
+# Speed at a moment is the distance covered from SPEED_WINDOW_MS before to after it
+SPEED_WINDOW_MS = 1_000
+BATCH_SIZE = 1000
+ALIGNED_FIELDS = ['track_latitude', 'track_longitude', 'track_speed_kmh', 'track_gap_ms', 'geohash']
+
+
+def _interpolate(track, times):
+    return np.interp(times, track.timestamp_ms, track.lat), np.interp(times, track.timestamp_ms, track.lon)
+
+
+def align_times(track, times_ms):
+    """
+    Position and speed on a Track at each of times_ms (epoch ms), found with one
+    searchsorted over the sorted fixes and linear interpolation between the two that
+    bracket each time. Returns (lat, lon, speed_kmh, gap_ms) arrays; gap_ms is the
+    time to the nearest fix. Times the track does not cover are NaN.
+    """
+    times = np.asarray(times_ms, dtype=np.int64)
+    count = len(times)
+    lat, lon, speed = np.full(count, np.nan), np.full(count, np.nan), np.full(count, np.nan)
+    gap = np.full(count, np.nan)
+    if not len(track) or not count:
+        return lat, lon, speed, gap
+
+    ts = track.timestamp_ms
+    after = np.clip(np.searchsorted(ts, times, side='left'), 0, len(ts) - 1)
+    before = np.clip(after - 1, 0, len(ts) - 1)
+    to_before, to_after = np.abs(times - ts[before]), np.abs(ts[after] - times)
+    nearest = np.where(to_before <= to_after, before, after)
+    gap = np.minimum(to_before, to_after).astype(np.float64)
+
+    bracketed = (ts[before] <= times) & (times <= ts[after]) & (ts[after] - ts[before] <= MAX_BRACKET_MS)
+    bracketed |= gap == 0
+    placed = bracketed | (gap <= MAX_NEAREST_MS)
+
+    lat_at, lon_at = _interpolate(track, times)
+    lat = np.where(bracketed, lat_at, np.where(placed, track.lat[nearest], np.nan))
+    lon = np.where(bracketed, lon_at, np.where(placed, track.lon[nearest], np.nan))
+
+    start = np.maximum(times - SPEED_WINDOW_MS, ts[0])
+    end = np.minimum(times + SPEED_WINDOW_MS, ts[-1])
+    start_lat, start_lon = _interpolate(track, start)
+    end_lat, end_lon = _interpolate(track, end)
+    span = (end - start) / 1000.0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        metres_per_second = haversine_m(start_lat, start_lon, end_lat, end_lon) / span
+    speed = np.where(bracketed & (span > 0), metres_per_second * 3.6, np.nan)
+    gap = np.where(placed, gap, np.nan)
+    return lat, lon, speed, gap
+
+
+def _optional(value, digits=None):
+    if np.isnan(value):
+        return None
+    return round(float(value), digits) if digits is not None else float(value)
+
+
+def _align_group(feedbacks, track):
+    """Set the track_* fields (and geohash) of Feedback instances from one track."""
+    times = [to_epoch_ms(feedback.recorded_time()) for feedback in feedbacks]
+    lat, lon, speed, gap = align_times(track, times)
+    for index, feedback in enumerate(feedbacks):
+        feedback.track_latitude = _optional(lat[index])
+        feedback.track_longitude = _optional(lon[index])
+        feedback.track_speed_kmh = _optional(speed[index], 2)
+        feedback.track_gap_ms = int(gap[index]) if not np.isnan(gap[index]) else None
+    placed = np.isfinite(lat)
+    best_lat = np.array([f.latitude if f.latitude is not None else np.nan for f in feedbacks], dtype=np.float64)
+    best_lon = np.array([f.longitude if f.longitude is not None else np.nan for f in feedbacks], dtype=np.float64)
+    best_lat, best_lon = np.where(placed, lat, best_lat), np.where(placed, lon, best_lon)
+    known = np.isfinite(best_lat) & np.isfinite(best_lon)
+    cells = geohash.encode(np.where(known, best_lat, 0.0), np.where(known, best_lon, 0.0))
+    for index, feedback in enumerate(feedbacks):
+        feedback.geohash = str(cells[index]) if known[index] else None
+    return int(np.count_nonzero(placed))
+
+
+def align_instances(feedbacks):
+    """
+    Place Feedback instances (with their session loaded) on their sessions' GPS
+    tracks: the test's whole track for a session linked to a test, otherwise the
+    session's own points. Each track is loaded once and all its feedback is aligned
+    in one pass, then written back with bulk_update. Returns the number placed.
+    """
+    # bulk_update sends no signals, so the heatmap cells a comment leaves or enters are refreshed here
+    old_cells = [(feedback.session.test_id, feedback.__dict__.get('geohash')) for feedback in feedbacks]
+    groups = {}
+    for feedback in feedbacks:
+        test_id = feedback.session.test_id
+        key = ('test', test_id) if test_id is not None else ('session', feedback.session_id)
+        groups.setdefault(key, []).append(feedback)
+
+    placed = 0
+    for (kind, owner_id), group in groups.items():
+        if kind == 'test':
+            track = load_track(owner_id)
+        else:
+            track = rows_track(TestGPSCoordinate.objects.filter(session_id=owner_id))
+        placed += _align_group(group, track)
+    with transaction.atomic():
+        for start in range(0, len(feedbacks), BATCH_SIZE):
+            Feedback.objects.bulk_update(feedbacks[start:start + BATCH_SIZE], ALIGNED_FIELDS)
+    refresh_feedback([
+        cell for old, feedback in zip(old_cells, feedbacks) if old[1] != feedback.geohash
+        for cell in (old, (feedback.session.test_id, feedback.geohash))
+    ])
+    return placed
+
+
+def align_feedback(queryset):
+    """align_instances over a queryset. Returns (feedback processed, feedback placed)."""
+    feedbacks = list(queryset.select_related('session').only(
+        'id', 'recorded_at', 'timestamp', 'latitude', 'longitude', 'geohash', 'session__id', 'session__test_id',
+    ).order_by('session__test_id', 'session_id', 'timestamp'))
+    return len(feedbacks), align_instances(feedbacks)
+
+
+def _recorded_near(queryset, start_ms, end_ms):
+    """
+    The feedback recorded from MAX_BRACKET_MS before start_ms to MAX_BRACKET_MS after
+    end_ms (all of it when start_ms is None). Fixes added in [start_ms, end_ms] can
+    only change the placement of these: a comment further from every new fix neither
+    gets a new bracketing pair nor a new nearest fix.
+    """
+    if start_ms is None:
+        return queryset
+    return queryset.alias(recorded=Coalesce('recorded_at', 'timestamp')).filter(
+        recorded__gte=from_epoch_ms(start_ms - MAX_BRACKET_MS),
+        recorded__lte=from_epoch_ms(end_ms + MAX_BRACKET_MS),
+    )
+
+
+def align_test_feedback(test_id, start_ms=None, end_ms=None):
+    """Re-align a test's feedback after fixes in [start_ms, end_ms] (epoch ms; all of it when omitted) changed."""
+    return align_feedback(_recorded_near(Feedback.objects.filter(session__test_id=test_id), start_ms, end_ms))
+
+
+def align_session_feedback(session_id, start_ms=None, end_ms=None):
+    """align_test_feedback for the feedback of one session."""
+    return align_feedback(_recorded_near(Feedback.objects.filter(session_id=session_id), start_ms, end_ms))
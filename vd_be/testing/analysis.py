@@ -0,0 +1,148 @@
+import hashlib
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from testing.listing import tests_versions
+from testing.models import CategoryScore
+
+SPEC_IMPACT_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _scope_filter(project_id=None, vehicle_id=None, project_ids=None):
+    if project_id is not None:
+        return {'test__project_id': project_id}
+    return {'test__project__vehicle_id': vehicle_id, 'test__project_id__in': project_ids}
+
+
+def spec_impact_analysis(project_id=None, vehicle_id=None, project_ids=()):
+    """
+    Compare category scores between tests that used different values of the
+    same testing parameter (TestSpecValue.isTestingParam), for a project or
+    for the given projects of a vehicle (those the user works on).
+
+    Cached per scope until the scores or the tests' spec values change; the cache
+    key includes the count and latest updatedAt of the scope's CategoryScores and
+    the projects' ProjectTestsVersions (bumped by spec value swaps, isTestingParam
+    changes and Spec/SpecValue edits), which costs two aggregate queries to check.
+    """
+    scope = _scope_filter(project_id, vehicle_id, project_ids)
+    fingerprint = CategoryScore.objects.filter(**scope).aggregate(count=Count('id'), latest=Max('updatedAt'))
+    latest = fingerprint['latest'].timestamp() if fingerprint['latest'] else 0
+    if project_id is not None:
+        scope_key = f'project:{project_id}'
+        version_count, version_total, version_at = tests_versions([project_id])
+    else:
+        projects = hashlib.sha1(','.join(map(str, sorted(project_ids))).encode()).hexdigest()
+        scope_key = f'vehicle:{vehicle_id}:{projects}'
+        version_count, version_total, version_at = tests_versions(project_ids)
+    versions = f'{version_count}:{version_total}:{version_at.timestamp() if version_at else 0}'
+    cache_key = f'spec_impact:{scope_key}:{fingerprint["count"]}:{latest}:{versions}'
+
+    result = cache.get(cache_key)
+    if result is None:
+        result = _compute_spec_impact(scope)
+        cache.set(cache_key, result, SPEC_IMPACT_CACHE_TIMEOUT)
+    return result
+
+
+def _compute_spec_impact(scope):
+    # One query: each score joined to every testing-parameter spec value of its test
+    rows = list(
+        CategoryScore.objects.filter(
+            test__testspecvalue__isTestingParam=True,
+            **scope
+        ).values_list(
+            'test_id',
+            'category',
+            'score',
+            'test__testspecvalue__spec_id',
+            'test__testspecvalue__spec__value',
+            'test__testspecvalue__spec__spec_id',
+            'test__testspecvalue__spec__spec__title',
+            'test__testspecvalue__spec__spec__category',
+        )
+    )
+    if not rows:
+        return {'total_tests': 0, 'parameters': []}
+
+    categories = sorted({row[1] for row in rows})
+    category_index = {category: idx for idx, category in enumerate(categories)}
+    spec_values = {}
+    specs = {}
+    for row in rows:
+        spec_values.setdefault(row[3], (row[4], row[5]))
+        specs.setdefault(row[5], (row[6], row[7]))
+
+    n = len(rows)
+    score = np.fromiter((row[2] for row in rows), dtype=np.float64, count=n)
+    category = np.fromiter((category_index[row[1]] for row in rows), dtype=np.int64, count=n)
+    spec_value = np.fromiter((row[3] for row in rows), dtype=np.int64, count=n)
+    spec = np.fromiter((row[5] for row in rows), dtype=np.int64, count=n)
+
+    # Per (spec value, category): count, sum and sum of squares
+    variant_key = (spec_value << 16) | category
+    variant_keys, variant_inverse = np.unique(variant_key, return_inverse=True)
+    v_count = np.bincount(variant_inverse)
+    v_sum = np.bincount(variant_inverse, weights=score)
+    v_sumsq = np.bincount(variant_inverse, weights=score * score)
+
+    # Per (spec, category) totals, used to compare each variant with the other variants
+    group_key = (spec << 16) | category
+    group_keys, group_inverse = np.unique(group_key, return_inverse=True)
+    g_count = np.bincount(group_inverse)
+    g_sum = np.bincount(group_inverse, weights=score)
+    g_sumsq = np.bincount(group_inverse, weights=score * score)
+
+    variant_spec = np.zeros(len(variant_keys), dtype=np.int64)
+    variant_spec[variant_inverse] = spec
+    variant_group = np.zeros(len(variant_keys), dtype=np.int64)
+    variant_group[variant_inverse] = group_inverse
+
+    mean = v_sum / v_count
+    variance = np.where(v_count > 1, (v_sumsq - v_count * mean ** 2) / np.maximum(v_count - 1, 1), 0.0)
+    variance = np.maximum(variance, 0.0)
+
+    # Cohen's d of the variant against all other variants of the same parameter
+    r_count = g_count[variant_group] - v_count
+    r_sum = g_sum[variant_group] - v_sum
+    r_sumsq = g_sumsq[variant_group] - v_sumsq
+    r_mean = np.divide(r_sum, r_count, out=np.zeros_like(r_sum), where=r_count > 0)
+    r_ss = np.maximum(r_sumsq - r_count * r_mean ** 2, 0.0)
+    v_ss = variance * np.maximum(v_count - 1, 0)
+    dof = v_count + r_count - 2
+    pooled_sd = np.sqrt(np.divide(v_ss + r_ss, dof, out=np.zeros_like(v_ss), where=dof > 0))
+    valid = (r_count > 0) & (pooled_sd > 0)
+    effect_size = np.divide(mean - r_mean, pooled_sd, out=np.zeros_like(mean), where=valid)
+
+    parameters = {}
+    for idx, key in enumerate(variant_keys.tolist()):
+        spec_value_id = key >> 16
+        category_name = categories[key & 0xFFFF]
+        spec_id = int(variant_spec[idx])
+        parameter = parameters.setdefault(spec_id, {
+            'spec_id': spec_id,
+            'title': specs[spec_id][0],
+            'category': specs[spec_id][1],
+            'variants': {},
+        })
+        variant = parameter['variants'].setdefault(spec_value_id, {
+            'spec_value_id': spec_value_id,
+            'value': spec_values[spec_value_id][0],
+            'scores': {},
+        })
+        variant['scores'][category_name] = {
+            'tests': int(v_count[idx]),
+            'mean': round(float(mean[idx]), 2),
+            'variance': round(float(variance[idx]), 2),
+            'effect_size': round(float(effect_size[idx]), 2) if valid[idx] else None,
+        }
+
+    return {
+        'total_tests': len({row[0] for row in rows}),
+        'parameters': [
+            {**parameter, 'variants': list(parameter['variants'].values())}
+            for parameter in parameters.values()
+        ],
+    }
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TestingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'testing'
+
+    def ready(self):
+        from testing import signals  # noqa: F401
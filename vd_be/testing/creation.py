@@ -0,0 +1,117 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from organisation.models import ProjectEmployee, SpecValue, User
+from testing.models import Test, TestParticipant, TestSpecValue
+from testing.summary import apply_summary_delta
+
+
+class TestCreationError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def validate_participants(project_id, user_ids):
+    """
+    Check that every user exists and works on the project, with one query however
+    many participants there are.
+    """
+    members = dict(User.objects.filter(id__in=set(user_ids)).annotate(
+        is_member=Exists(ProjectEmployee.objects.filter(project_id=project_id, user_id=OuterRef('pk')))
+    ).values_list('id', 'is_member'))
+    for user_id in user_ids:
+        if user_id not in members:
+            raise TestCreationError(f'User with id {user_id} does not exist')
+        if not members[user_id]:
+            raise TestCreationError(f'User {user_id} is not part of the project', status=403)
+
+
+def validate_spec_values(spec_value_ids):
+    """
+    Check that every SpecValue exists, with one query. Returns
+    {spec_value_id: spec_id} for the given ids.
+    """
+    specs = dict(SpecValue.objects.filter(id__in=set(spec_value_ids)).values_list('id', 'spec_id'))
+    for spec_value_id in spec_value_ids:
+        if spec_value_id not in specs:
+            raise TestCreationError(f'SpecValue with id {spec_value_id} does not exist')
+    return specs
+
+
+def create_test(project, participants, spec_values):
+    """
+    Validate and create a pending test with its participants and spec values.
+    Everything is validated before the first write and inserted with bulk_create
+    in one transaction, so the query count does not depend on the list sizes and
+    a failure leaves nothing behind. Raises TestCreationError.
+    """
+    validate_participants(project.id, [participant.user for participant in participants])
+    validate_spec_values([spec_value.spec for spec_value in spec_values])
+
+    with transaction.atomic():
+        test = Test.objects.create(project=project, status='pending', notes='', isReviewed=False)
+        TestParticipant.objects.bulk_create([
+            TestParticipant(test=test, user_id=participant.user, role=participant.role)
+            for participant in participants
+        ])
+        TestSpecValue.objects.bulk_create([
+            TestSpecValue(test=test, spec_id=spec_value.spec, isTestingParam=spec_value.isTestingParam)
+            for spec_value in spec_values
+        ])
+    return test
+
+
+def clone_source(project_id, test_id):
+    """
+    Participants [(user_id, role)] and spec values [(spec_value_id, isTestingParam)]
+    of an existing test of the project. Raises TestCreationError.
+    """
+    if not Test.objects.filter(id=test_id, project_id=project_id).exists():
+        raise TestCreationError(f'Test with id {test_id} not found in this project', status=404)
+    participants = list(TestParticipant.objects.filter(test_id=test_id).order_by('id').values_list('user_id', 'role'))
+    spec_values = list(
+        TestSpecValue.objects.filter(test_id=test_id).order_by('id').values_list('spec_id', 'isTestingParam')
+    )
+    return participants, spec_values
+
+
+def create_tests_from_template(project, participants, spec_values, overrides):
+    """
+    Create one pending test per entry of overrides, each with the template's
+    participants [(user_id, role)] and spec values [(spec_value_id, isTestingParam)].
+    An override [(spec_value_id, isTestingParam)] replaces the template's values of
+    the same Spec, e.g. a different tyre, and adds values of Specs the template lacks.
+
+    Validation takes one query per kind; the tests, participants and spec values are
+    then inserted with three bulk_creates in one transaction. Returns the new test ids
+    in the order of overrides. Raises TestCreationError.
+    """
+    validate_participants(project.id, [user_id for user_id, _ in participants])
+    spec_ids = validate_spec_values(
+        [spec_value_id for spec_value_id, _ in spec_values]
+        + [spec_value_id for override in overrides for spec_value_id, _ in override]
+    )
+
+    test_spec_values = []
+    for override in overrides:
+        replaced = {spec_ids[spec_value_id] for spec_value_id, _ in override}
+        test_spec_values.append(
+            [item for item in spec_values if spec_ids[item[0]] not in replaced] + list(override)
+        )
+
+    with transaction.atomic():
+        tests = Test.objects.bulk_create([
+            Test(project=project, status='pending', notes='', isReviewed=False) for _ in overrides
+        ])
+        TestParticipant.objects.bulk_create([
+            TestParticipant(test=test, user_id=user_id, role=role)
+            for test in tests for user_id, role in participants
+        ])
+        TestSpecValue.objects.bulk_create([
+            TestSpecValue(test=test, spec_id=spec_value_id, isTestingParam=is_testing_param)
+            for test, values in zip(tests, test_spec_values) for spec_value_id, is_testing_param in values
+        ])
+        # bulk_create does not send post_save, so update the dashboard counters here
+        apply_summary_delta(project.id, total_tests=len(tests), pending_tests=len(tests))
+    return [test.id for test in tests]
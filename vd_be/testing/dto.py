@@ -1,5 +1,13 @@
-from pydantic import BaseModel, field_validator
-from typing import List
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import List, Literal, Optional, Tuple
+from datetime import date, datetime, timezone
+import math
+
+# Largest area search: radius_m up to 50 km, or a bbox no wider or taller than the
+# square around such a circle
+MAX_SEARCH_RADIUS_M = 50000
+MAX_SEARCH_SPAN_M = 2 * MAX_SEARCH_RADIUS_M
+METRES_PER_DEGREE = 6371008.8 * math.pi / 180
 
 class TestParticipantDTO(BaseModel):
     user: int
@@ -19,7 +27,180 @@ class TestDTO(BaseModel):
     participants: List[TestParticipantDTO]
     spec_values: List[TestSpecValueDTO]
 
+class TestOverrideDTO(BaseModel):
+    spec_values: List[TestSpecValueDTO] = []
+
+class TestBatchCreateDTO(BaseModel):
+    template: Optional[TestDTO] = None
+    clone_from: Optional[int] = None
+    tests: List[TestOverrideDTO] = Field(min_length=1, max_length=200)
+
+    @model_validator(mode='after')
+    def validate_source(self):
+        if (self.template is None) == (self.clone_from is None):
+            raise ValueError('Provide exactly one of template or clone_from')
+        return self
+
+class TestOperationDTO(BaseModel):
+    type: Literal['status', 'review', 'spec']
+    test: int
+    status: Optional[str] = None
+    isReviewed: Optional[bool] = None
+    old_spec_id: Optional[int] = None
+    new_spec_id: Optional[int] = None
+    isTestingParam: bool = False
+
+    @model_validator(mode='after')
+    def validate_fields(self):
+        if self.type == 'status':
+            allowed = ['pending', 'yet_to_test', 'in_progress', 'completed', 'failed']
+            if self.status not in allowed:
+                raise ValueError(f'Status must be one of: {", ".join(allowed)}')
+        elif self.type == 'review':
+            if self.isReviewed is None:
+                raise ValueError('isReviewed is required')
+        elif self.old_spec_id is None or self.new_spec_id is None:
+            raise ValueError('old_spec_id and new_spec_id are required')
+        return self
+
+class TestBatchUpdateDTO(BaseModel):
+    operations: List[dict] = Field(min_length=1, max_length=500)
+    all_or_nothing: bool = False
+
 class TestSpecUpdateDTO(BaseModel):
     old_spec_id: int
     new_spec_id: int
-    isTestingParam: bool;
\ No newline at end of file
+    isTestingParam: bool;
+
+class ProjectTestsQueryDTO(BaseModel):
+    status: Optional[List[str]] = None
+    isReviewed: Optional[bool] = None
+    created_from: Optional[date] = None
+    created_to: Optional[date] = None
+    participant: Optional[int] = None
+    limit: Optional[int] = Field(default=None, ge=1, le=500)
+    cursor: Optional[str] = None
+
+    @field_validator('status', mode='before')
+    def split_status(cls, value):
+        if isinstance(value, str):
+            value = [status for status in value.split(',') if status]
+        return value
+
+    @field_validator('status')
+    def validate_status(cls, value):
+        allowed = ['pending', 'yet_to_test', 'in_progress', 'completed', 'failed']
+        for status in value or []:
+            if status not in allowed:
+                raise ValueError(f'Status must be one of: {", ".join(allowed)}')
+        return value
+
+class BBoxQueryDTO(BaseModel):
+    # GeoJSON order: min_lon,min_lat,max_lon,max_lat
+    bbox: Optional[Tuple[float, float, float, float]] = None
+
+    @field_validator('bbox', mode='before')
+    def split_bbox(cls, value):
+        if isinstance(value, str):
+            value = value.split(',')
+        return value
+
+    @field_validator('bbox')
+    def validate_bbox(cls, value):
+        if value is not None:
+            min_lon, min_lat, max_lon, max_lat = value
+            if not (-180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+                raise ValueError('bbox must be min_lon,min_lat,max_lon,max_lat within [-180, 180] and [-90, 90]')
+        return value
+
+class TimeWindowQueryDTO(BaseModel):
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    max_points: int = Field(default=2000, ge=2, le=20000)
+
+    @field_validator('start', 'end')
+    def assume_utc(cls, value):
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+
+    @model_validator(mode='after')
+    def validate_window(self):
+        if self.start is not None and self.end is not None and self.start > self.end:
+            raise ValueError('start must not be after end')
+        return self
+
+class TrackQueryDTO(BBoxQueryDTO, TimeWindowQueryDTO):
+    pass
+
+class TelemetryQueryDTO(TimeWindowQueryDTO):
+    pass
+
+class SpatialQueryDTO(BBoxQueryDTO):
+    """Area query: either a circle (lat, lon, radius_m) or a bbox."""
+    source: Literal['feedback', 'gps'] = 'feedback'
+    lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    lon: Optional[float] = Field(default=None, ge=-180, le=180)
+    radius_m: Optional[float] = Field(default=None, gt=0, le=MAX_SEARCH_RADIUS_M)
+    limit: int = Field(default=500, ge=1, le=5000)
+
+    @model_validator(mode='after')
+    def validate_area(self):
+        circle = (self.lat, self.lon, self.radius_m)
+        if any(value is not None for value in circle) and any(value is None for value in circle):
+            raise ValueError('lat, lon and radius_m must be given together')
+        if (self.radius_m is None) == (self.bbox is None):
+            raise ValueError('Give either lat, lon and radius_m or bbox')
+        if self.bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            # Width measured at the latitude of the bbox closest to the equator, where it is widest
+            widest_lat = 0.0 if min_lat <= 0 <= max_lat else min(abs(min_lat), abs(max_lat))
+            height_m = (max_lat - min_lat) * METRES_PER_DEGREE
+            width_m = (max_lon - min_lon) * METRES_PER_DEGREE * math.cos(math.radians(widest_lat))
+            if max(height_m, width_m) > MAX_SEARCH_SPAN_M:
+                raise ValueError(f'bbox must be at most {MAX_SEARCH_SPAN_M // 1000} km wide and tall')
+        return self
+
+class TrackSectionDTO(BaseModel):
+    name: str = Field(min_length=1, max_length=255)
+    # [[lon, lat], ...] in GeoJSON order
+    polygon: List[Tuple[float, float]]
+
+    @field_validator('polygon')
+    def validate_polygon(cls, value):
+        if len(value) > 1 and value[0] == value[-1]:
+            value = value[:-1]  # Closing vertex
+        if len(set(value)) < 3:
+            raise ValueError('polygon needs at least 3 distinct [lon, lat] vertices')
+        for lon, lat in value:
+            if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+                raise ValueError('polygon vertices must be [lon, lat] within [-180, 180] and [-90, 90]')
+        return value
+
+class TrackSectionUpdateDTO(BaseModel):
+    name: Optional[str] = Field(default=None, min_length=1, max_length=255)
+    polygon: Optional[List[Tuple[float, float]]] = None
+
+    @field_validator('polygon')
+    def validate_polygon(cls, value):
+        return TrackSectionDTO.validate_polygon(value) if value is not None else value
+
+class HeatmapTileDTO(BaseModel):
+    """A geohash tile of the feedback heatmap and the precision of the cells it is split into."""
+    tile: str = Field(min_length=1, max_length=7)
+    precision: Optional[int] = Field(default=None, ge=1, le=7)
+
+    @field_validator('tile')
+    def validate_tile(cls, value):
+        value = value.lower()
+        if any(char not in '0123456789bcdefghjkmnpqrstuvwxyz' for char in value):
+            raise ValueError('tile must be a geohash')
+        return value
+
+    @model_validator(mode='after')
+    def validate_precision(self):
+        if self.precision is None:
+            self.precision = min(len(self.tile) + 2, 7)
+        if not len(self.tile) <= self.precision <= len(self.tile) + 3:
+            raise ValueError('precision must be between the tile length and 3 more')
+        return self
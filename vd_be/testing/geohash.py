@@ -0,0 +1,95 @@
+import numpy as np
+
+# Geohash cells are interleaved lon/lat bisections named in this alphabet, which is
+# in ASCII order, so sorting geohash strings sorts cells along a Z-order curve and a
+# cell's sub-cells form one contiguous string range: a B-tree index answers area
+# queries as a few range scans.
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_ALPHABET = np.frombuffer(BASE32.encode(), dtype=np.uint8)
+PRECISION = 9  # ~4.8 m x 4.8 m cells
+# Query areas are covered with at most this many cells of the finest precision that fits
+MAX_COVER_CELLS = 32
+
+
+def _bits(precision):
+    """(lon_bits, lat_bits) of a geohash of this length; longitude takes the odd bit."""
+    total = 5 * precision
+    return (total + 1) // 2, total // 2
+
+
+def _cell_index(lat, lon, precision):
+    lon_bits, lat_bits = _bits(precision)
+    x = np.floor((np.asarray(lon, dtype=np.float64) + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64)
+    y = np.floor((np.asarray(lat, dtype=np.float64) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64)
+    return np.clip(x, 0, (1 << lon_bits) - 1), np.clip(y, 0, (1 << lat_bits) - 1)
+
+
+def _interleave(x, y, precision):
+    """Geohash cell numbers (int) of column/row indices."""
+    lon_bits, lat_bits = _bits(precision)
+    code = np.zeros(np.shape(x), dtype=np.int64)
+    for bit in range(lon_bits):
+        code |= ((x >> (lon_bits - 1 - bit)) & 1) << (5 * precision - 1 - 2 * bit)
+    for bit in range(lat_bits):
+        code |= ((y >> (lat_bits - 1 - bit)) & 1) << (5 * precision - 2 - 2 * bit)
+    return code
+
+
+def _to_strings(code, precision):
+    shifts = np.arange(precision - 1, -1, -1, dtype=np.int64) * 5
+    digits = (np.asarray(code)[:, None] >> shifts) & 31
+    return np.ascontiguousarray(_ALPHABET[digits]).view(f'S{precision}').ravel().astype(str)
+
+
+def encode(lat, lon, precision=PRECISION):
+    """Geohashes of arrays of points, as a NumPy array of str."""
+    x, y = _cell_index(np.atleast_1d(lat), np.atleast_1d(lon), precision)
+    return _to_strings(_interleave(x, y, precision), precision)
+
+
+def encode_point(lat, lon, precision=PRECISION):
+    """Geohash of one point, or None when either coordinate is missing."""
+    if lat is None or lon is None:
+        return None
+    return str(encode(lat, lon, precision)[0])
+
+
+def cover_ranges(min_lat, min_lon, max_lat, max_lon):
+    """
+    Inclusive (low, high) geohash string ranges that together contain every
+    PRECISION-length geohash inside the box. The box is covered with the cells of
+    the finest precision that needs at most MAX_COVER_CELLS of them, and cells that
+    are adjacent in geohash order are merged into one range.
+    """
+    for precision in range(PRECISION, 0, -1):
+        x0, y0 = _cell_index(min_lat, min_lon, precision)
+        x1, y1 = _cell_index(max_lat, max_lon, precision)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= MAX_COVER_CELLS:
+            break
+    xs, ys = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+    codes = np.unique(_interleave(xs.ravel(), ys.ravel(), precision))
+    starts = np.flatnonzero(np.diff(codes, prepend=-2) != 1)
+    ends = np.append(starts[1:] - 1, len(codes) - 1)
+    low, high = _to_strings(codes[starts], precision), _to_strings(codes[ends], precision)
+    # The last PRECISION-length cell inside a coarser cell is its geohash padded with 'z'
+    return [(str(lo), str(hi) + 'z' * (PRECISION - precision)) for lo, hi in zip(low, high)]
+
+
+def bounds(cell):
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell. Raises ValueError."""
+    precision = len(cell)
+    code = 0
+    for char in cell:
+        digit = BASE32.find(char)
+        if digit < 0:
+            raise ValueError(f'Invalid geohash character {char!r}')
+        code = (code << 5) | digit
+    lon_bits, lat_bits = _bits(precision)
+    x = y = 0
+    for bit in range(lon_bits):
+        x = (x << 1) | ((code >> (5 * precision - 1 - 2 * bit)) & 1)
+    for bit in range(lat_bits):
+        y = (y << 1) | ((code >> (5 * precision - 2 - 2 * bit)) & 1)
+    lon_size, lat_size = 360.0 / (1 << lon_bits), 180.0 / (1 << lat_bits)
+    min_lat, min_lon = y * lat_size - 90.0, x * lon_size - 180.0
+    return min_lat, min_lon, min_lat + lat_size, min_lon + lon_size
@@ -0,0 +1,420 @@
+import codecs
+import csv
+import json
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from testing import geohash
+from testing.alignment import align_session_feedback, align_test_feedback
+from testing.models import Session, TestGPSCoordinate
+from testing.pyramid import build_track_pyramid
+from testing.tracks import Track, append_to_track, merge_tracks, row_timestamps_within
+
+# Rows per INSERT; five columns each keeps SQLite well under its bound-variable limit
+CHUNK_SIZE = 2000
+# Rows parsed before they are converted and validated as arrays
+BLOCK_SIZE = 5000
+READ_SIZE = 64 * 1024
+MAX_POINTS = 500_000
+# A single JSON element or line larger than this is rejected instead of buffered
+MAX_RECORD_CHARS = 64 * 1024
+MAX_REPORTED_ERRORS = 50
+# Epoch numbers below this are seconds, above it milliseconds (1e11 s is the year 5138)
+EPOCH_MS_THRESHOLD = 1e11
+EARLIEST_MS = 946684800000  # 2000-01-01T00:00:00Z
+FUTURE_TOLERANCE_MS = 24 * 3600 * 1000
+
+CONTENT_TYPES = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'application/x-jsonlines': 'ndjson',
+    'text/csv': 'csv',
+}
+CSV_COLUMNS = {
+    'lat': 0, 'latitude': 0,
+    'lon': 1, 'lng': 1, 'longitude': 1,
+    'timestamp': 2, 'time': 2, 'ts': 2,
+}
+
+
+class GPSIngestError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def iter_text(stream):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            break
+        try:
+            text = decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise GPSIngestError('Request body is not valid UTF-8')
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_lines(chunks):
+    pending = ''
+    for chunk in chunks:
+        pending += chunk
+        lines = pending.split('\n')
+        pending = lines.pop()
+        if len(pending) > MAX_RECORD_CHARS:
+            raise GPSIngestError(f'Line longer than {MAX_RECORD_CHARS} characters')
+        yield from lines
+    if pending:
+        yield pending
+
+
+def iter_json_array(chunks):
+    """
+    Yield the elements of a top-level JSON array as they arrive, holding at most one
+    element (plus a read) in memory.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer, position = '', 0
+    state = 'start'  # start, first, value, next, end
+
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n':
+            position += 1
+        if position == len(buffer):
+            chunk = next(chunks, None)
+            if chunk is None:
+                if state == 'end':
+                    return
+                raise GPSIngestError('Unexpected end of JSON array')
+            buffer, position = chunk, 0
+            continue
+
+        char = buffer[position]
+        if state == 'start' and char == '[':
+            state = 'first'
+        elif state in ('first', 'next') and char == ']':
+            state = 'end'
+        elif state == 'next' and char == ',':
+            state = 'value'
+        elif state in ('first', 'value'):
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                # Most likely an element split across reads
+                if len(buffer) - position > MAX_RECORD_CHARS:
+                    raise GPSIngestError(f'JSON element longer than {MAX_RECORD_CHARS} characters')
+                chunk = next(chunks, None)
+                if chunk is None:
+                    raise GPSIngestError(f'Invalid JSON: {e.msg}')
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            yield value
+            position, state = end, 'next'
+            continue
+        else:
+            raise GPSIngestError(f'Unexpected {char!r} in JSON array')
+        position += 1
+
+
+def _record_from_json(value):
+    """(lat, lon, timestamp) from {"lat", "lon", "timestamp"} or [lat, lon, timestamp]."""
+    if isinstance(value, dict):
+        return value.get('lat'), value.get('lon'), value.get('timestamp')
+    if isinstance(value, list) and len(value) == 3:
+        return tuple(value)
+    return None
+
+
+def iter_records(stream, content_type):
+    """
+    Yield a (lat, lon, timestamp) tuple, or None for a malformed record, per input
+    record of a JSON array, NDJSON stream or CSV body. Values are not validated here.
+    """
+    kind = CONTENT_TYPES.get(content_type)
+    if kind is None:
+        raise GPSIngestError(
+            f'Unsupported content type; use one of {", ".join(sorted(CONTENT_TYPES))}', status=415
+        )
+    chunks = iter_text(stream)
+
+    if kind == 'json':
+        for value in iter_json_array(chunks):
+            yield _record_from_json(value)
+    elif kind == 'ndjson':
+        for line in iter_lines(chunks):
+            if line.strip():
+                try:
+                    yield _record_from_json(json.loads(line))
+                except ValueError:
+                    yield None
+    else:
+        columns = None
+        for row in csv.reader(iter_lines(chunks)):
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            if columns is None:
+                names = [cell.strip().lower() for cell in row]
+                columns = [0, 1, 2]
+                if any(name in CSV_COLUMNS for name in names):
+                    # Header row: columns may come in any order
+                    positions = {CSV_COLUMNS[name]: index for index, name in enumerate(names) if name in CSV_COLUMNS}
+                    if set(positions) != {0, 1, 2}:
+                        raise GPSIngestError('CSV header must name lat, lon and timestamp columns')
+                    columns = [positions[0], positions[1], positions[2]]
+                    continue
+            try:
+                yield tuple(row[index] for index in columns)
+            except IndexError:
+                yield None
+
+
+def parse_timestamp(value):
+    """Epoch milliseconds of an epoch number or ISO 8601 string (naive means UTC), or NaN."""
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            parsed = datetime.fromisoformat(value.strip())
+        except ValueError:
+            return np.nan
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=dt_timezone.utc)
+        return parsed.timestamp() * 1000.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    return np.nan
+
+
+def parse_moment(value, now_ms=None):
+    """
+    Epoch milliseconds of a single client time given like a fix timestamp (epoch
+    seconds or milliseconds, or ISO 8601), or None if unparseable or outside the
+    window validate_points accepts.
+    """
+    timestamp = parse_timestamp(value)
+    if not np.isfinite(timestamp):
+        return None
+    if abs(timestamp) < EPOCH_MS_THRESHOLD:
+        timestamp *= 1000.0
+    now_ms = time.time() * 1000.0 if now_ms is None else now_ms
+    if not EARLIEST_MS <= timestamp <= now_ms + FUTURE_TOLERANCE_MS:
+        return None
+    return int(round(timestamp))
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def float_column(values, convert):
+    """float64 array of values, converting one by one only if the fast path fails."""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.fromiter((convert(value) for value in values), dtype=np.float64, count=len(values))
+
+
+def _block_arrays(records):
+    """Parse a block of records into lat, lon and raw timestamp arrays (NaN where unparseable)."""
+    lats, lons, stamps = [], [], []
+    for record in records:
+        lat, lon, stamp = record if record is not None else (None, None, None)
+        lats.append(lat)
+        lons.append(lon)
+        stamps.append(stamp)
+    lat = float_column(lats, to_float)
+    lon = float_column(lons, to_float)
+    timestamp = float_column(stamps, parse_timestamp)
+    # Epoch seconds to milliseconds
+    timestamp = np.where(np.abs(timestamp) < EPOCH_MS_THRESHOLD, timestamp * 1000.0, timestamp)
+    return lat, lon, timestamp
+
+
+def validate_points(lat, lon, timestamp, now_ms):
+    """
+    Vectorised checks over whole arrays. Returns a boolean mask of valid rows and an
+    array of error codes (empty string where valid).
+    """
+    errors = np.full(len(lat), '', dtype=object)
+    finite = np.isfinite(lat) & np.isfinite(lon)
+    errors[~finite] = 'lat and lon must be numbers'
+    bad_range = finite & ((np.abs(lat) > 90) | (np.abs(lon) > 180))
+    errors[bad_range] = 'lat must be within [-90, 90] and lon within [-180, 180]'
+    no_time = (errors == '') & ~np.isfinite(timestamp)
+    errors[no_time] = 'timestamp must be an epoch number or ISO 8601 string'
+    out_of_window = (errors == '') & ((timestamp < EARLIEST_MS) | (timestamp > now_ms + FUTURE_TOLERANCE_MS))
+    errors[out_of_window] = 'timestamp is before 2000 or in the future'
+    return errors == '', errors
+
+
+def _store_rows(track, test_id, session_id):
+    """
+    Insert a time-sorted Track as TestGPSCoordinate rows, skipping timestamps the test
+    (or session) already has. Returns (inserted, already_stored).
+    """
+    owner = {'session_id': session_id} if session_id is not None else {'test_id': test_id}
+    stored = row_timestamps_within(TestGPSCoordinate.objects.filter(**owner), track)
+    new = track.select(~np.isin(track.timestamp_ms, stored))
+    lat, lon, instants = new.lat.tolist(), new.lon.tolist(), new.datetimes()
+    # bulk_create skips save(), so the spatial index keys are computed here for the whole block
+    geohashes = geohash.encode(new.lat, new.lon).tolist() if len(new) else []
+    with transaction.atomic():
+        for start in range(0, len(instants), CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            TestGPSCoordinate.objects.bulk_create([
+                TestGPSCoordinate(
+                    test_id=test_id, session_id=session_id, lat=point_lat, lon=point_lon, geohash=cell, timestamp=instant
+                )
+                for point_lat, point_lon, cell, instant in zip(
+                    lat[start:end], lon[start:end], geohashes[start:end], instants[start:end]
+                )
+            ])
+    return len(instants), len(track) - len(instants)
+
+
+def ingest_gps_points(stream, content_type, test_id=None, session_id=None):
+    """
+    Parse, validate and store a GPS track upload for a test or a session (when the
+    session is linked to a test, pass both). Records are (lat, lon, timestamp) in any
+    of the CONTENT_TYPES; timestamps are epoch seconds, epoch milliseconds or ISO 8601.
+
+    The body is parsed incrementally and converted to NumPy arrays in blocks, so
+    validation, ordering and de-duplication are array operations. Points are stored
+    in time order at millisecond precision: within an upload the last point for a
+    timestamp wins, and timestamps already stored for the track are skipped, which
+    makes retrying an upload safe. Test uploads are merged into the test's packed
+    track when GPS_TRACK_STORAGE is 'packed' (see testing/tracks.py); otherwise, and
+    for sessions, rows are inserted in CHUNK_SIZE batches inside one transaction.
+    The test's track pyramid is then rebuilt and its voice feedback re-aligned to the
+    track (testing/alignment.py). Raises GPSIngestError.
+
+    Returns a report of counts and timings.
+    """
+    started = time.perf_counter()
+    now_ms = time.time() * 1000.0
+    lat_blocks, lon_blocks, time_blocks = [], [], []
+    errors = []
+    received = 0
+
+    def flush(block):
+        lat, lon, timestamp = _block_arrays(block)
+        valid, codes = validate_points(lat, lon, timestamp, now_ms)
+        if len(errors) < MAX_REPORTED_ERRORS:
+            for index in np.flatnonzero(~valid)[:MAX_REPORTED_ERRORS - len(errors)]:
+                errors.append({'row': received - len(block) + int(index), 'error': codes[index]})
+        lat_blocks.append(lat[valid])
+        lon_blocks.append(lon[valid])
+        time_blocks.append(np.rint(timestamp[valid]).astype(np.int64))
+        return int(np.count_nonzero(~valid))
+
+    rejected = 0
+    block = []
+    for record in iter_records(stream, content_type):
+        block.append(record)
+        received += 1
+        if received > MAX_POINTS:
+            raise GPSIngestError(f'At most {MAX_POINTS} points per upload', status=413)
+        if len(block) == BLOCK_SIZE:
+            rejected += flush(block)
+            block = []
+    if block:
+        rejected += flush(block)
+    parsed = time.perf_counter()
+
+    lat = np.concatenate(lat_blocks) if lat_blocks else np.empty(0)
+    lon = np.concatenate(lon_blocks) if lon_blocks else np.empty(0)
+    timestamp = np.concatenate(time_blocks) if time_blocks else np.empty(0, dtype=np.int64)
+
+    # Points that arrived earlier than one already seen in this upload
+    out_of_order = int(np.count_nonzero(timestamp[1:] < np.maximum.accumulate(timestamp)[:-1])) if len(timestamp) else 0
+    # Sorted, keeping the last point uploaded for each timestamp
+    track = merge_tracks(Track(timestamp, lat, lon))
+    duplicates = len(timestamp) - len(track)
+
+    # Packed tracks are per test; points of a session keep their session link as rows
+    storage = 'packed' if session_id is None and settings.GPS_TRACK_STORAGE == 'packed' else 'rows'
+    if storage == 'packed':
+        inserted, already_stored = append_to_track(test_id, track)
+    else:
+        inserted, already_stored = _store_rows(track, test_id, session_id)
+    written = time.perf_counter()
+    if inserted and test_id is not None:
+        build_track_pyramid(test_id)
+    if inserted:
+        # Voice feedback recorded before the track arrived can now be placed on it;
+        # only comments around the uploaded time span can move
+        span = int(track.timestamp_ms[0]), int(track.timestamp_ms[-1])
+        if test_id is not None:
+            align_test_feedback(test_id, *span)
+        else:
+            align_session_feedback(session_id, *span)
+    finished = time.perf_counter()
+
+    elapsed = finished - started
+    return {
+        'storage': storage,
+        'received': received,
+        'inserted': inserted,
+        'rejected': rejected,
+        'duplicates': duplicates,
+        'already_stored': already_stored,
+        'out_of_order': out_of_order,
+        'errors': errors,
+        'parse_ms': round((parsed - started) * 1000, 1),
+        'insert_ms': round((written - parsed) * 1000, 1),
+        'index_ms': round((finished - written) * 1000, 1),
+        'points_per_second': round(received / elapsed) if elapsed > 0 else None,
+    }
+
+
+def json_points(values, now_ms=None):
+    """
+    The valid points of a small batch of decoded JSON records (as accepted by the
+    upload endpoints) as a time-sorted Track, and the number of records rejected.
+    """
+    records = [_record_from_json(value) for value in values]
+    lat, lon, timestamp = _block_arrays(records)
+    valid, _ = validate_points(lat, lon, timestamp, time.time() * 1000.0 if now_ms is None else now_ms)
+    track = merge_tracks(Track(np.rint(timestamp[valid]).astype(np.int64), lat[valid], lon[valid]))
+    return track, int(np.count_nonzero(~valid))
+
+
+def store_session_points(session_id, track):
+    """
+    Insert a time-sorted Track as rows of a session (and its test, if linked) without
+    the follow-up work of an upload; call finish_session_points once the stream ends.
+    Returns (inserted, already_stored), or None if the session no longer exists.
+    """
+    test_ids = list(Session.objects.filter(id=session_id).values_list('test_id', flat=True))
+    if not test_ids:
+        return None
+    return _store_rows(track, test_ids[0], session_id)
+
+
+def finish_session_points(session_id, start_ms=None, end_ms=None):
+    """
+    Rebuild the pyramid and re-align the voice feedback after store_session_points,
+    given the time span of the stored points (epoch ms; all feedback when omitted).
+    """
+    test_id = Session.objects.filter(id=session_id).values_list('test_id', flat=True).first()
+    if test_id is not None:
+        build_track_pyramid(test_id)
+        align_test_feedback(test_id, start_ms, end_ms)
+    else:
+        align_session_feedback(session_id, start_ms, end_ms)
@@ -0,0 +1,279 @@
+import threading
+from functools import reduce
+from operator import or_
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Q
+
+from testing import geohash
+from testing.models import CategoryScore, Feedback, FeedbackAnswer, FeedbackHeatCell, FeedbackTag, Test
+
+CELL_PRECISION = 7  # ~153 m x 153 m
+HEATMAP_CACHE_TIMEOUT = 60 * 60 * 24
+# Cells refreshed per query: each is one range in an OR, which SQLite nests one level per term
+BATCH_SIZE = 200
+GEOHASH_LENGTH = 12  # Width of the geohash columns
+
+# Tests, (test_id, geohash) and (vehicle_id, geohash) pairs waiting for the current transaction to commit
+_queued = threading.local()
+
+
+def cell_range(cell):
+    """Inclusive (low, high) range of the longer geohashes inside a cell."""
+    return cell, cell + 'z' * (GEOHASH_LENGTH - len(cell))
+
+
+def _cells_filter(cells, field):
+    ranges = (cell_range(cell) for cell in cells)
+    return reduce(or_, (Q(**{f'{field}__gte': low, f'{field}__lte': high}) for low, high in ranges))
+
+
+def _empty_cell():
+    return {'feedback_count': 0, 'rating_sum': 0.0, 'rating_count': 0, 'tags': {}, 'category_scores': {}}
+
+
+def compute_cells(vehicle_id, cells=None):
+    """
+    {cell: aggregate} of the located voice feedback of the vehicle's tests in the
+    given cells (every cell when None), from the source tables. Each feedback adds
+    its test's mean questionnaire rating and category scores, so a cell shows how
+    the drives commented on there were rated.
+    """
+    if cells is None:
+        rows = list(Feedback.objects.filter(
+            session__test__project__vehicle_id=vehicle_id, geohash__isnull=False,
+        ).values_list('id', 'session__test_id', 'geohash'))
+        tags = list(FeedbackTag.objects.filter(
+            feedback__session__test__project__vehicle_id=vehicle_id, feedback__geohash__isnull=False,
+        ).values_list('feedback_id', 'category'))
+    else:
+        # The vehicle is compared as an expression (+ 0) so SQLite cannot start from the
+        # vehicle's index and walk all of its feedback: rows are read from the geohash
+        # ranges and checked through primary-key lookups of their session, test and project
+        rows = list(Feedback.objects.alias(
+            feedback_vehicle=F('session__test__project__vehicle_id') + 0,
+        ).filter(_cells_filter(cells, 'geohash'), feedback_vehicle=vehicle_id).values_list(
+            'id', 'session__test_id', 'geohash',
+        ))
+        feedback_ids = [feedback_id for feedback_id, _, _ in rows]
+        tags = []
+        for start in range(0, len(feedback_ids), BATCH_SIZE):
+            tags.extend(FeedbackTag.objects.filter(
+                feedback_id__in=feedback_ids[start:start + BATCH_SIZE],
+            ).values_list('feedback_id', 'category'))
+
+    test_ids = sorted({test_id for _, test_id, _ in rows})
+    ratings, scores = {}, {}
+    for start in range(0, len(test_ids), BATCH_SIZE):
+        batch = test_ids[start:start + BATCH_SIZE]
+        ratings.update(
+            FeedbackAnswer.objects.filter(test_id__in=batch).values('test_id').annotate(
+                mean=Avg('rating'),
+            ).values_list('test_id', 'mean')
+        )
+        for test_id, category, score in CategoryScore.objects.filter(test_id__in=batch).values_list(
+            'test_id', 'category', 'score',
+        ):
+            scores.setdefault(test_id, []).append((category, score))
+
+    aggregates, feedback_cell = {}, {}
+    for feedback_id, test_id, code in rows:
+        cell = feedback_cell[feedback_id] = code[:CELL_PRECISION]
+        entry = aggregates.setdefault(cell, _empty_cell())
+        entry['feedback_count'] += 1
+        if test_id in ratings:
+            entry['rating_sum'] += ratings[test_id]
+            entry['rating_count'] += 1
+        for category, score in scores.get(test_id, ()):
+            total = entry['category_scores'].setdefault(category, {'sum': 0.0, 'count': 0})
+            total['sum'] += score
+            total['count'] += 1
+    for feedback_id, category in tags:
+        cell = feedback_cell.get(feedback_id)
+        if cell is not None:
+            counts = aggregates[cell]['tags']
+            counts[category] = counts.get(category, 0) + 1
+
+    # Rounded so an unchanged cell compares equal to the stored row
+    for entry in aggregates.values():
+        entry['rating_sum'] = round(entry['rating_sum'], 6)
+        for total in entry['category_scores'].values():
+            total['sum'] = round(total['sum'], 6)
+    return aggregates
+
+
+def refresh_cells(vehicle_id, cells=None):
+    """
+    Recompute the vehicle's FeedbackHeatCells for the given cells (or geohashes
+    inside them; every cell when None). Only rows whose numbers changed are written,
+    so the tiles around them keep their ETags. Returns the number of rows written
+    or removed.
+    """
+    if cells is None:
+        batches = [None]
+    else:
+        cells = sorted({code[:CELL_PRECISION] for code in cells if code})
+        batches = [cells[start:start + BATCH_SIZE] for start in range(0, len(cells), BATCH_SIZE)]
+
+    changed = 0
+    for batch in batches:
+        aggregates = compute_cells(vehicle_id, batch)
+        stored = FeedbackHeatCell.objects.filter(vehicle_id=vehicle_id)
+        if batch is not None:
+            stored = stored.filter(cell__in=batch)
+        existing = {
+            row.pop('cell'): row
+            for row in stored.values('cell', 'id', *_empty_cell())
+        }
+        upserts = [
+            FeedbackHeatCell(vehicle_id=vehicle_id, cell=cell, **entry)
+            for cell, entry in aggregates.items()
+            if cell not in existing or {key: existing[cell][key] for key in entry} != entry
+        ]
+        stale_ids = [row['id'] for cell, row in existing.items() if cell not in aggregates]
+        if upserts or stale_ids:
+            with transaction.atomic():
+                FeedbackHeatCell.objects.bulk_create(
+                    upserts,
+                    update_conflicts=True,
+                    unique_fields=['vehicle', 'cell'],
+                    update_fields=[*_empty_cell(), 'updatedAt'],
+                )
+                FeedbackHeatCell.objects.filter(id__in=stale_ids).delete()
+        changed += len(upserts) + len(stale_ids)
+    return changed
+
+
+def refresh_feedback(pairs):
+    """
+    Refresh the cells touched by changed feedback, given as (test_id, geohash) pairs:
+    the old and the new location of a moved comment, or the test a session left and
+    the one it joined. Pairs without a test or a location are ignored.
+    """
+    cells_by_test = {}
+    for test_id, code in pairs:
+        if test_id is not None and code:
+            cells_by_test.setdefault(test_id, set()).add(code[:CELL_PRECISION])
+    if not cells_by_test:
+        return
+    cells_by_vehicle = {}
+    for test_id, vehicle_id in Test.objects.filter(id__in=cells_by_test).values_list('id', 'project__vehicle_id'):
+        cells_by_vehicle.setdefault(vehicle_id, set()).update(cells_by_test[test_id])
+    for vehicle_id, cells in cells_by_vehicle.items():
+        refresh_cells(vehicle_id, cells)
+
+
+def refresh_tests(test_ids):
+    """Refresh the cells holding feedback of tests whose ratings, scores or tags changed."""
+    test_ids = sorted({test_id for test_id in test_ids if test_id is not None})
+    for start in range(0, len(test_ids), BATCH_SIZE):
+        refresh_feedback(
+            Feedback.objects.filter(
+                session__test_id__in=test_ids[start:start + BATCH_SIZE], geohash__isnull=False,
+            ).values_list('session__test_id', 'geohash').distinct()
+        )
+
+
+def refresh_on_commit(test_ids=(), pairs=(), vehicle_cells=()):
+    """
+    Queue refresh_tests(test_ids), refresh_feedback(pairs) and refresh_cells for
+    (vehicle_id, geohash) pairs (cells of a vehicle no test leads to any more, e.g.
+    after a test moved project) until the current transaction commits (at once
+    outside a transaction). Saving every answer and
+    score of a test in one transaction then refreshes its cells once, from the
+    final data. Entries of a rolled back transaction are refreshed with the next
+    commit, which only recomputes them.
+    """
+    queued = getattr(_queued, 'entries', None)
+    if queued is None:
+        queued = _queued.entries = {'tests': set(), 'pairs': set(), 'vehicle_cells': set()}
+    queued['tests'].update(test_id for test_id in test_ids if test_id is not None)
+    queued['pairs'].update(pairs)
+    queued['vehicle_cells'].update((vehicle_id, code) for vehicle_id, code in vehicle_cells if vehicle_id and code)
+    transaction.on_commit(_refresh_queued)
+
+
+def _refresh_queued():
+    # The first callback of a transaction takes everything queued; the rest find nothing
+    queued = getattr(_queued, 'entries', None)
+    _queued.entries = None
+    if queued:
+        refresh_tests(queued['tests'])
+        refresh_feedback(queued['pairs'])
+        cells_by_vehicle = {}
+        for vehicle_id, code in queued['vehicle_cells']:
+            cells_by_vehicle.setdefault(vehicle_id, set()).add(code)
+        for vehicle_id, cells in cells_by_vehicle.items():
+            refresh_cells(vehicle_id, cells)
+
+
+def tile_fingerprint(vehicle_id, tile):
+    """(cell count, latest updatedAt, None) of the stored cells in a tile, in one query."""
+    low, high = cell_range(tile)
+    state = FeedbackHeatCell.objects.filter(vehicle_id=vehicle_id, cell__gte=low, cell__lte=high).aggregate(
+        count=Count('id'), latest=Max('updatedAt'),
+    )
+    return state['count'], state['latest'], None
+
+
+def _bbox(cell):
+    min_lat, min_lon, max_lat, max_lon = geohash.bounds(cell)
+    return [min_lon, min_lat, max_lon, max_lat]
+
+
+def heatmap_tile(vehicle_id, tile, precision):
+    """
+    The vehicle's feedback heat inside a geohash tile, summed into cells of the
+    given precision (len(tile) to CELL_PRECISION). Cached per tile and precision
+    until a cell of the tile changes.
+    """
+    count, latest, _ = tile_fingerprint(vehicle_id, tile)
+    cache_key = f'heatmap:{vehicle_id}:{tile}:{precision}:{count}:{latest.timestamp() if latest else 0}'
+    data = cache.get(cache_key)
+    if data is not None:
+        return data
+
+    low, high = cell_range(tile)
+    merged = {}
+    for row in FeedbackHeatCell.objects.filter(vehicle_id=vehicle_id, cell__gte=low, cell__lte=high).values(
+        'cell', *_empty_cell(),
+    ):
+        entry = merged.setdefault(row['cell'][:precision], _empty_cell())
+        entry['feedback_count'] += row['feedback_count']
+        entry['rating_sum'] += row['rating_sum']
+        entry['rating_count'] += row['rating_count']
+        for category, hits in row['tags'].items():
+            entry['tags'][category] = entry['tags'].get(category, 0) + hits
+        for category, score in row['category_scores'].items():
+            total = entry['category_scores'].setdefault(category, {'sum': 0.0, 'count': 0})
+            total['sum'] += score['sum']
+            total['count'] += score['count']
+
+    cells = []
+    for cell, entry in sorted(merged.items()):
+        bbox = _bbox(cell)
+        cells.append({
+            'geohash': cell,
+            'lat': (bbox[1] + bbox[3]) / 2,
+            'lon': (bbox[0] + bbox[2]) / 2,
+            'bbox': bbox,
+            'feedback_count': entry['feedback_count'],
+            'rated_feedback_count': entry['rating_count'],
+            'mean_rating': round(entry['rating_sum'] / entry['rating_count'], 2) if entry['rating_count'] else None,
+            'tags': dict(sorted(entry['tags'].items())),
+            'category_scores': {
+                category: round(total['sum'] / total['count'], 2)
+                for category, total in sorted(entry['category_scores'].items()) if total['count']
+            },
+        })
+    data = {
+        'vehicle_id': vehicle_id,
+        'tile': tile,
+        'precision': precision,
+        'bbox': _bbox(tile),
+        'feedback_count': sum(cell['feedback_count'] for cell in cells),
+        'cells': cells,
+    }
+    cache.set(cache_key, data, HEATMAP_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,179 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import wraps
+
+from django.db import IntegrityError, connections, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from testing.models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+# Keys are forgotten after this long; a retry after that runs the view again
+KEY_TTL = timedelta(hours=24)
+# The first request renews its claim every LEASE / 3 while it runs; a claim left
+# unrenewed for LEASE (the worker died) is taken over by the next retry
+LEASE = timedelta(seconds=30)
+# How long a duplicate waits for the first request with the same key to finish
+WAIT_TIMEOUT = 60.0
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+# Client errors that depend on timing rather than on the request; like 5xx they are not stored
+TRANSIENT_STATUSES = {408, 409, 423, 425, 429}
+
+
+def request_fingerprint(request):
+    """
+    SHA-256 over the method, path and payload. Multipart bodies are hashed by their
+    fields and file contents rather than the raw bytes, since a client may pick a
+    different boundary when it rebuilds the request for a retry.
+    """
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    if request.content_type == 'multipart/form-data':
+        for name, values in sorted(request.POST.lists()):
+            for value in values:
+                digest.update(f'{name}={value}\n'.encode())
+        for name, files in sorted(request.FILES.lists()):
+            for uploaded in files:
+                digest.update(f'{name}:{uploaded.name}:{uploaded.size}\n'.encode())
+                for chunk in uploaded.chunks():
+                    digest.update(chunk)
+                uploaded.seek(0)
+    else:
+        digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _replay(record):
+    response = HttpResponse(
+        bytes(record.response_body or b''),
+        status=record.response_status,
+        content_type=record.response_content_type or 'application/json',
+    )
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(user_id, key, fingerprint):
+    """Create the in-progress record; returns None if another request already holds the key."""
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                user_id=user_id, key=key, fingerprint=fingerprint, lease_expires_at=timezone.now() + LEASE,
+            )
+    except IntegrityError:
+        return None
+
+
+def _take_over(record):
+    """Claim an in-progress record whose lease ran out; False if another retry got it first."""
+    return IdempotencyKey.objects.filter(
+        id=record.id, status='in_progress', lease_expires_at=record.lease_expires_at,
+    ).update(lease_expires_at=timezone.now() + LEASE) == 1
+
+
+@contextmanager
+def _renewing(record):
+    """Renew the record's lease from a background thread while the block runs."""
+    stop = threading.Event()
+
+    def renew():
+        try:
+            while not stop.wait(LEASE.total_seconds() / 3):
+                IdempotencyKey.objects.filter(id=record.id, status='in_progress').update(
+                    lease_expires_at=timezone.now() + LEASE,
+                )
+        except Exception:
+            pass  # The lease lapses; a retry may then run the view again
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _storable(status):
+    return 200 <= status < 300 or (400 <= status < 500 and status not in TRANSIENT_STATUSES)
+
+
+def idempotent(view_func):
+    """
+    Honour an optional Idempotency-Key header on a mutating view (apply below
+    jwt_authentication; keys are scoped per user).
+
+    The first request with a key runs the view and stores its response. Later
+    requests with the same key and the same payload get that response back without
+    the view running; if the first is still in flight they wait for it. Reusing a
+    key for a different payload is rejected with 422. Only successes and client
+    errors that would recur (e.g. 400, 404) are stored; server errors and timing
+    dependent ones (409, 429, ...) release the key so the client can retry them. A
+    request whose worker died without releasing the key is taken over by a retry
+    once its lease (LEASE, renewed while it runs) has expired.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if not key:
+            return view_func(request, *args, **kwargs)
+        if len(key) > 255:
+            return JsonResponse({'error': 'Idempotency-Key must be at most 255 characters'}, status=400)
+
+        user_id = request.user_id
+        fingerprint = request_fingerprint(request)
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        interval = POLL_INTERVAL
+
+        while True:
+            record = _claim(user_id, key, fingerprint)
+            if record is not None:
+                break
+
+            existing = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+            if existing is None:
+                # The first request failed and released the key; try to claim it again
+                continue
+            if existing.createdAt < timezone.now() - KEY_TTL:
+                IdempotencyKey.objects.filter(id=existing.id, createdAt=existing.createdAt).delete()
+                continue
+            if existing.fingerprint != fingerprint:
+                return JsonResponse({'error': 'Idempotency-Key was already used for a different request'}, status=422)
+            if existing.status == 'completed':
+                return _replay(existing)
+            if existing.lease_expires_at is None or existing.lease_expires_at < timezone.now():
+                if _take_over(existing):
+                    record = existing
+                    break
+                continue
+            if time.monotonic() >= deadline:
+                return JsonResponse({'error': 'A request with this Idempotency-Key is still in progress'}, status=409)
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+        try:
+            with _renewing(record):
+                response = view_func(request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        if not _storable(response.status_code) or getattr(response, 'streaming', False):
+            record.delete()
+            return response
+        IdempotencyKey.objects.filter(id=record.id).update(
+            status='completed',
+            response_status=response.status_code,
+            response_body=response.content,
+            response_content_type=response.get('Content-Type', ''),
+            updatedAt=timezone.now(),
+        )
+        return response
+    return _wrapped_view
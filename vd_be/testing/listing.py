@@ -0,0 +1,209 @@
+import base64
+import json
+from datetime import datetime, time
+
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+
+from organisation.models import Project, Spec, SpecValue
+from testing.models import ProjectTestsVersion, Test, TestParticipant, TestSpecValue
+from vd_be.row_serializers import FieldsetError, represent_rows
+
+TEST_FIELDS = ('id', 'project', 'status', 'isReviewed', 'notes', 'createdAt', 'updatedAt')
+SPEC_VALUE_FIELDS = ('id', 'spec', 'value', 'value_type', 'createdAt', 'updatedAt')
+SPEC_FIELDS = ('id', 'organisation', 'category', 'title', 'createdAt', 'updatedAt')
+TEST_INCLUDES = ('spec_values', 'participants', 'specs')
+
+
+def test_fieldset(fields=None, include=None):
+    """
+    Validate ?fields= / ?include= for the tests listing. Returns (fields, include)
+    with the defaults filled in; 'id' is always part of the fields.
+    """
+    if fields is None:
+        fields = TEST_FIELDS
+    for name in fields:
+        if name not in TEST_FIELDS:
+            raise FieldsetError(f'Unknown field: {name}')
+    if include is None:
+        include = TEST_INCLUDES
+    for name in include:
+        if name not in TEST_INCLUDES:
+            raise FieldsetError(f'Unknown include: {name}')
+    return tuple(['id'] + [name for name in fields if name != 'id']), tuple(include)
+
+
+def flatten_tests(tests, fields=TEST_FIELDS, include=TEST_INCLUDES):
+    """
+    Build the flattened tests listing for a queryset of tests in a fixed number of
+    queries (at most five), however many tests, spec values or participants there are.
+
+    Each test lists its spec values as {id, spec_value, isTestingParam} and its
+    participants; the referenced SpecValues and Specs are returned once each in
+    the top-level 'spec_values' and 'specs' lists. Relations left out of include
+    are not queried at all.
+    """
+    return flatten_test_rows(list(tests.values(*fields)), include)
+
+
+def flatten_test_rows(test_rows, include=TEST_INCLUDES):
+    """
+    The listing for values() rows of tests. Dates and times of all rows are rendered
+    as the DRF serializers render them (microseconds, Z suffix).
+    """
+    test_ids = [row['id'] for row in test_rows]
+    result = {'tests': represent_rows(Test, test_rows)}
+
+    if 'spec_values' in include or 'specs' in include:
+        spec_links = {}
+        spec_value_ids = set()
+        for row in TestSpecValue.objects.filter(test_id__in=test_ids).order_by('id').values(
+            'id', 'test_id', 'spec_id', 'isTestingParam'
+        ):
+            spec_links.setdefault(row['test_id'], []).append({
+                'id': row['id'],
+                'spec_value': row['spec_id'],
+                'isTestingParam': row['isTestingParam'],
+            })
+            spec_value_ids.add(row['spec_id'])
+
+        spec_values = represent_rows(
+            SpecValue, list(SpecValue.objects.filter(id__in=spec_value_ids).order_by('id').values(*SPEC_VALUE_FIELDS))
+        )
+        if 'spec_values' in include:
+            for row in test_rows:
+                row['spec_values'] = spec_links.get(row['id'], [])
+            result['spec_values'] = spec_values
+        if 'specs' in include:
+            spec_ids = {row['spec'] for row in spec_values}
+            result['specs'] = represent_rows(
+                Spec, list(Spec.objects.filter(id__in=spec_ids).order_by('id').values(*SPEC_FIELDS))
+            )
+
+    if 'participants' in include:
+        participants = {}
+        rows = list(TestParticipant.objects.filter(test_id__in=test_ids).order_by('id').values(
+            'id', 'test_id', 'user', 'role', 'createdAt', 'updatedAt'
+        ))
+        for row in represent_rows(TestParticipant, rows):
+            participants.setdefault(row.pop('test_id'), []).append(row)
+        for row in test_rows:
+            row['participants'] = participants.get(row['id'], [])
+
+    return result
+
+
+def filter_project_tests(tests, query):
+    """Apply the ProjectTestsQueryDTO filters to a tests queryset."""
+    if query.status:
+        tests = tests.filter(status__in=query.status)
+    if query.isReviewed is not None:
+        tests = tests.filter(isReviewed=query.isReviewed)
+    if query.created_from:
+        tests = tests.filter(createdAt__gte=timezone.make_aware(datetime.combine(query.created_from, time.min)))
+    if query.created_to:
+        tests = tests.filter(createdAt__lte=timezone.make_aware(datetime.combine(query.created_to, time.max)))
+    if query.participant is not None:
+        tests = tests.filter(id__in=TestParticipant.objects.filter(user_id=query.participant).values('test_id'))
+    return tests
+
+
+def encode_cursor(updated_at, test_id):
+    raw = json.dumps([updated_at.isoformat(), test_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (updatedAt, id) from a cursor; raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        updated_at, test_id = json.loads(raw)
+        return datetime.fromisoformat(updated_at), int(test_id)
+    except (TypeError, ValueError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def paginate_tests(tests, limit, cursor=None, fields=TEST_FIELDS):
+    """
+    Keyset pagination over (updatedAt, id), newest first, backed by the
+    test_project_updated_idx index. Returns (test_rows, next_cursor).
+    """
+    tests = tests.order_by('-updatedAt', '-id')
+    if cursor:
+        updated_at, test_id = decode_cursor(cursor)
+        tests = tests.filter(Q(updatedAt__lt=updated_at) | Q(updatedAt=updated_at, id__lt=test_id))
+    rows = list(tests.values(*fields, *(['updatedAt'] if 'updatedAt' not in fields else []))[:limit + 1])
+    if len(rows) <= limit:
+        next_cursor = None
+    else:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['updatedAt'], rows[-1]['id'])
+    if 'updatedAt' not in fields:
+        for row in rows:
+            del row['updatedAt']
+    return rows, next_cursor
+
+
+def bump_tests_version(project_id):
+    """
+    Mark a project's tests listing as changed: participants or spec values edited,
+    or a test deleted. Only an existing row is touched, so this is safe while the
+    project itself is being deleted; tests_fingerprint creates the row on first read.
+    """
+    if project_id is None:
+        return
+    ProjectTestsVersion.objects.filter(project_id=project_id).update(
+        version=F('version') + 1, updatedAt=timezone.now()
+    )
+
+
+def bump_organisation_tests_versions(organisation_id):
+    """bump_tests_version for every project of an organisation whose Specs or SpecValues changed."""
+    if organisation_id is None:
+        return
+    ProjectTestsVersion.objects.filter(project__organisation_id=organisation_id).update(
+        version=F('version') + 1, updatedAt=timezone.now()
+    )
+
+
+def tests_fingerprint(project_id):
+    """
+    (test count, latest change, version) of a project's tests, in one aggregate query.
+    The version moves on every change that does not touch a remaining test's
+    updatedAt (deletions, participants, spec values and the specs they reference),
+    and its updatedAt keeps Last-Modified moving forward for them.
+    """
+    stats = Project.objects.filter(id=project_id).aggregate(
+        count=Count('test'),
+        latest=Max('test__updatedAt'),
+        version=Max('tests_version__version'),
+        version_at=Max('tests_version__updatedAt'),
+    )
+    if stats['version'] is None and Project.objects.filter(id=project_id).exists():
+        row, _ = ProjectTestsVersion.objects.get_or_create(project_id=project_id)
+        stats['version'], stats['version_at'] = row.version, row.updatedAt
+    changes = [timestamp for timestamp in (stats['latest'], stats['version_at']) if timestamp is not None]
+    return stats['count'], max(changes) if changes else None, stats['version']
+
+
+def tests_versions(project_ids):
+    """
+    (count, sum, latest updatedAt) of the ProjectTestsVersions of the given projects,
+    which move whenever their tests' spec values or participants, the specs those
+    reference, or the set of tests change. Missing rows are created first, since
+    bumps only update existing ones.
+    """
+    project_ids = set(project_ids)
+    stats = ProjectTestsVersion.objects.filter(project_id__in=project_ids).aggregate(
+        count=Count('id'), total=Sum('version'), latest=Max('updatedAt'),
+    )
+    if stats['count'] < len(project_ids):
+        existing = set(ProjectTestsVersion.objects.filter(project_id__in=project_ids).values_list('project_id', flat=True))
+        ProjectTestsVersion.objects.bulk_create([
+            ProjectTestsVersion(project_id=project_id)
+            for project_id in Project.objects.filter(id__in=project_ids - existing).values_list('id', flat=True)
+        ], ignore_conflicts=True)
+        stats = ProjectTestsVersion.objects.filter(project_id__in=project_ids).aggregate(
+            count=Count('id'), total=Sum('version'), latest=Max('updatedAt'),
+        )
+    return stats['count'], stats['total'] or 0, stats['latest']
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import logging
+import re
+from http.cookies import SimpleCookie
+
+import jwt
+from asgiref.sync import sync_to_async
+
+from testing.access import session_access, session_owner
+from testing.gps import finish_session_points, json_points, store_session_points
+from testing.tracks import merge_tracks
+from vd_be.middleware import Principal, verify_token
+
+# Buffered fixes are written in one bulk insert when this many are waiting, or every
+# FLUSH_INTERVAL_S, so the database sees a steady trickle whatever the sample rate
+FLUSH_POINTS = 500
+FLUSH_INTERVAL_S = 2.0
+# A sender waits for the write once this many fixes are buffered (the database is behind)
+MAX_PENDING_POINTS = 50_000
+MAX_MESSAGE_POINTS = 1000
+# Messages for a dashboard that falls this far behind are dropped rather than queued
+SUBSCRIBER_QUEUE_SIZE = 256
+PATH = re.compile(r'^/ws/sessions/(?P<session_id>\d+)/$')
+
+# Close codes sent instead of accepting the connection
+UNAUTHENTICATED = 4401
+FORBIDDEN = 4403
+NOT_FOUND = 4404
+
+logger = logging.getLogger(__name__)
+
+
+class SessionChannel:
+    """
+    The live connections of one Session. Fixes sent by any connection are fanned out
+    to the others and buffered for batched inserts.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.subscribers = set()
+        self.pending = []
+        self.pending_points = 0
+        self.stored = 0
+        self.stored_span = None  # (first, last) epoch ms of the stored fixes
+        self.dropped = 0
+        self._flush_lock = asyncio.Lock()
+        self._flusher = asyncio.ensure_future(self._flush_periodically())
+
+    def publish(self, message, sender=None):
+        for queue in self.subscribers:
+            if queue is sender:
+                continue
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    def add_points(self, track):
+        self.pending.append(track)
+        self.pending_points += len(track)
+        if self.pending_points >= FLUSH_POINTS:
+            # Written in the background; the sender keeps streaming meanwhile
+            asyncio.ensure_future(self.try_flush())
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            pending, self.pending, self.pending_points = self.pending, [], 0
+            track = merge_tracks(*pending)
+            try:
+                stored = await sync_to_async(store_session_points)(self.session_id, track)
+            except Exception:
+                # The fixes were acknowledged: keep them, ahead of any that arrived meanwhile, for the next flush
+                self.pending = pending + self.pending
+                self.pending_points = sum(len(track) for track in self.pending)
+                raise
+            if stored is not None and stored[0]:
+                self.stored += stored[0]
+                first, last = int(track.timestamp_ms[0]), int(track.timestamp_ms[-1])
+                if self.stored_span is not None:
+                    first, last = min(first, self.stored_span[0]), max(last, self.stored_span[1])
+                self.stored_span = first, last
+
+    async def try_flush(self):
+        """flush, logging a failure instead of raising it; the fixes stay buffered."""
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception('Writing %d live fixes of session %s failed', self.pending_points, self.session_id)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL_S)
+            await self.try_flush()
+
+    async def close(self):
+        """Write what is left (a last failed write is logged) and run the post-upload work (pyramid, feedback alignment)."""
+        self._flusher.cancel()
+        await self.try_flush()
+        if self.stored:
+            await sync_to_async(finish_session_points)(self.session_id, *self.stored_span)
+
+
+class TelemetryHub:
+    """
+    The SessionChannels of this process. Channels exist while they have connections;
+    fan-out reaches the connections served by the same process only.
+    """
+
+    def __init__(self):
+        self.channels = {}
+        self.loop = None
+
+    def join(self, session_id, queue):
+        self.loop = asyncio.get_running_loop()
+        channel = self.channels.get(session_id)
+        if channel is None:
+            channel = self.channels[session_id] = SessionChannel(session_id)
+        channel.subscribers.add(queue)
+        return channel
+
+    async def leave(self, session_id, queue):
+        channel = self.channels.get(session_id)
+        if channel is None:
+            return
+        channel.subscribers.discard(queue)
+        if not channel.subscribers:
+            del self.channels[session_id]
+            await channel.close()
+
+    def publish_threadsafe(self, session_id, message):
+        """Fan a message out from synchronous code, e.g. a view. A no-op without listeners."""
+        loop = self.loop
+        if loop is None or session_id not in self.channels or loop.is_closed():
+            return
+
+        def publish():
+            channel = self.channels.get(session_id)
+            if channel is not None:
+                channel.publish(message)
+        loop.call_soon_threadsafe(publish)
+
+
+hub = TelemetryHub()
+
+
+def _authenticate(scope):
+    """The Principal of the jwt cookie of a connection, or None."""
+    cookies = SimpleCookie()
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    token = cookies['jwt'].value if 'jwt' in cookies else None
+    if token is None:
+        return None
+    try:
+        claims = verify_token(token)
+    except jwt.InvalidTokenError:
+        return None
+    return Principal(claims['user_id'], claims)
+
+
+def _may_join(principal, session_id):
+    """None for an unknown session, otherwise whether the principal has access."""
+    if session_owner(session_id) is None:
+        return None
+    return session_access(principal, session_id)
+
+
+def _fixes_message(session_id, track):
+    return {
+        'type': 'fixes',
+        'session_id': session_id,
+        'points': [
+            list(point) for point in zip(track.lat.tolist(), track.lon.tolist(), track.timestamp_ms.tolist())
+        ],
+    }
+
+
+def _decode_points(text):
+    """
+    Records of a message: {"points": [...]}, a bare list, or one record. Records use
+    the JSON shapes of the upload endpoints. Raises ValueError.
+    """
+    data = json.loads(text)
+    if isinstance(data, dict) and 'points' in data:
+        data = data['points']
+    if not isinstance(data, list) or (len(data) == 3 and not isinstance(data[0], (list, dict))):
+        data = [data]
+    if len(data) > MAX_MESSAGE_POINTS:
+        raise ValueError(f'At most {MAX_MESSAGE_POINTS} points per message')
+    return data
+
+
+async def session_telemetry(scope, receive, send):
+    """
+    ASGI WebSocket application for /ws/sessions/<session_id>/, authenticated with the
+    jwt cookie like the HTTP API. Every connection receives the fixes sent by the
+    others ({"type": "fixes", "points": [[lat, lon, timestamp_ms], ...]}) and new
+    voice feedback ({"type": "feedback", ...}); a connection that sends fixes gets
+    {"type": "ack", "accepted", "rejected"} back.
+    """
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    match = PATH.match(scope.get('path', ''))
+    if match is None:
+        await send({'type': 'websocket.close', 'code': NOT_FOUND})
+        return
+    session_id = int(match.group('session_id'))
+    principal = _authenticate(scope)
+    if principal is None:
+        await send({'type': 'websocket.close', 'code': UNAUTHENTICATED})
+        return
+    allowed = await sync_to_async(_may_join)(principal, session_id)
+    if allowed is None or not allowed:
+        await send({'type': 'websocket.close', 'code': NOT_FOUND if allowed is None else FORBIDDEN})
+        return
+
+    await send({'type': 'websocket.accept'})
+    queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    channel = hub.join(session_id, queue)
+    send_lock = asyncio.Lock()
+
+    async def send_json(message):
+        async with send_lock:
+            await send({'type': 'websocket.send', 'text': json.dumps(message)})
+
+    async def forward():
+        while True:
+            await send_json(await queue.get())
+
+    forwarder = asyncio.ensure_future(forward())
+    try:
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+            if event['type'] != 'websocket.receive':
+                continue
+            try:
+                records = _decode_points(event.get('text') or (event.get('bytes') or b'').decode())
+                track, rejected = json_points(records)
+            except (ValueError, UnicodeDecodeError) as e:
+                await send_json({'type': 'error', 'error': str(e)})
+                continue
+            if len(track):
+                channel.add_points(track)
+                channel.publish(_fixes_message(session_id, track), sender=queue)
+                if channel.pending_points >= MAX_PENDING_POINTS:
+                    await channel.try_flush()
+            await send_json({'type': 'ack', 'accepted': len(track), 'rejected': rejected})
+    finally:
+        forwarder.cancel()
+        await hub.leave(session_id, queue)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from testing.alignment import align_feedback
+from testing.models import Feedback
+
+
+class Command(BaseCommand):
+    help = 'Place voice feedback on its sessions\' GPS tracks (interpolated position and speed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, action='append', help='Only feedback of this test (repeatable)')
+        parser.add_argument('--session', type=int, action='append', help='Only feedback of this session (repeatable)')
+        parser.add_argument(
+            '--unaligned-only', action='store_true', help='Skip feedback that already has a track position'
+        )
+
+    def handle(self, *args, **options):
+        feedbacks = Feedback.objects.all()
+        if options['test']:
+            feedbacks = feedbacks.filter(session__test_id__in=options['test'])
+        if options['session']:
+            feedbacks = feedbacks.filter(session_id__in=options['session'])
+        if options['unaligned_only']:
+            feedbacks = feedbacks.filter(track_latitude__isnull=True)
+
+        # Feedback is aligned one track at a time: each test's track (or an unlinked
+        # session's points) is loaded once for all of its sessions
+        owners = set(feedbacks.values_list('session__test_id', 'session_id'))
+        tests = sorted({test_id for test_id, _ in owners if test_id is not None})
+        sessions = sorted({session_id for test_id, session_id in owners if test_id is None})
+        groups = [feedbacks.filter(session__test_id=test_id) for test_id in tests]
+        groups += [feedbacks.filter(session_id=session_id) for session_id in sessions]
+
+        processed = placed = 0
+        for idx, group in enumerate(groups, 1):
+            count, aligned = align_feedback(group)
+            processed += count
+            placed += aligned
+            self.stdout.write(f'Progress: {idx}/{len(groups)} tracks')
+
+        self.stdout.write(self.style.SUCCESS(f'Placed {placed} of {processed} voice feedback on GPS tracks.'))
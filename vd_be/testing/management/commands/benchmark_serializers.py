@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from organisation.models import ProjectEmployee, VehicleSpec
+from organisation.serializers import (
+    ProjectEmployeeRowSerializer, ProjectEmployeeSerializer, VehicleSpecRowSerializer, VehicleSpecSerializer
+)
+from testing.listing import flatten_tests
+from testing.models import Feedback, Test
+from testing.serializers import FeedbackRowSerializer, FeedbackSerializer, TestSerializer
+
+
+def _cases():
+    """(name, queryset, DRF serializer callable, row serializer callable) for each list endpoint."""
+    employees = ProjectEmployee.objects.order_by('id')
+    vehicle_specs = VehicleSpec.objects.order_by('id')
+    feedbacks = Feedback.objects.order_by('id')
+    tests = Test.objects.order_by('id')
+    return [
+        ('employees', employees,
+         lambda: ProjectEmployeeSerializer(employees.select_related('user'), many=True).data,
+         lambda: ProjectEmployeeRowSerializer.serialize(employees, include=['user'])),
+        ('vehicle specs', vehicle_specs,
+         lambda: VehicleSpecSerializer(vehicle_specs.select_related('spec__spec'), many=True).data,
+         lambda: VehicleSpecRowSerializer.serialize(vehicle_specs, include=['spec.spec'])),
+        ('voice feedback', feedbacks,
+         lambda: FeedbackSerializer(feedbacks.select_related('session').prefetch_related('tags'), many=True).data,
+         lambda: FeedbackRowSerializer.serialize(feedbacks, include=['session', 'tags'])),
+        ('tests', tests,
+         lambda: TestSerializer(tests, many=True).data,
+         lambda: flatten_tests(tests, include=())),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/s of the DRF serializers against the values()-based row serializers on the current data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per serializer; the fastest run is reported')
+
+    def _best_time(self, serialize, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            serialize()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be positive')
+
+        self.stdout.write(f'{"endpoint":<16}{"rows":>8}{"serializer rows/s":>20}{"row rows/s":>14}{"speedup":>10}')
+        for name, queryset, drf, rows in _cases():
+            count = queryset.count()
+            if not count:
+                self.stdout.write(f'{name:<16}{0:>8}  (no rows, skipped)')
+                continue
+            drf_time = self._best_time(drf, options['repeat'])
+            row_time = self._best_time(rows, options['repeat'])
+            self.stdout.write(
+                f'{name:<16}{count:>8}{count / drf_time:>20.0f}{count / row_time:>14.0f}{drf_time / row_time:>9.1f}x'
+            )
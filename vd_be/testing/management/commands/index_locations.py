@@ -0,0 +1,57 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from testing import geohash
+from testing.models import Feedback, TestGPSCoordinate, TestGPSTrack
+from testing.tracks import decode_track
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Fill in the spatial index (geohash columns and packed-track bounding boxes) for rows stored before it existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute every row, not only those missing a value')
+
+    def _index_rows(self, model, fields, locate, rebuild):
+        rows = model.objects.all() if rebuild else model.objects.filter(geohash__isnull=True)
+        ids = list(rows.order_by('id').values_list('id', flat=True))
+        indexed = 0
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = list(model.objects.filter(id__in=ids[start:start + BATCH_SIZE]).only('id', *fields))
+            located = [(row, locate(row)) for row in batch]
+            located = [(row, lat, lon) for row, (lat, lon) in located if lat is not None and lon is not None]
+            if not located:
+                continue
+            lat = np.array([lat for _, lat, _ in located], dtype=np.float64)
+            lon = np.array([lon for _, _, lon in located], dtype=np.float64)
+            for (row, _, _), cell in zip(located, geohash.encode(lat, lon).tolist()):
+                row.geohash = cell
+            with transaction.atomic():
+                model.objects.bulk_update([row for row, _, _ in located], ['geohash'])
+            indexed += len(located)
+        return indexed
+
+    def handle(self, *args, **options):
+        rebuild = options['all']
+        feedback = self._index_rows(
+            Feedback, ['latitude', 'longitude', 'track_latitude', 'track_longitude'], Feedback.location, rebuild
+        )
+        self.stdout.write(f'Indexed {feedback} feedback locations')
+        points = self._index_rows(TestGPSCoordinate, ['lat', 'lon'], lambda row: (row.lat, row.lon), rebuild)
+        self.stdout.write(f'Indexed {points} GPS rows')
+
+        tracks = TestGPSTrack.objects.all() if rebuild else TestGPSTrack.objects.filter(min_lat__isnull=True)
+        count = 0
+        for track_id, data in tracks.values_list('id', 'data').iterator():
+            track = decode_track(data)
+            if not len(track):
+                continue
+            TestGPSTrack.objects.filter(id=track_id).update(
+                min_lat=float(track.lat.min()), min_lon=float(track.lon.min()),
+                max_lat=float(track.lat.max()), max_lon=float(track.lon.max()),
+            )
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} packed tracks.'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from testing.models import TestGPSCoordinate
+from testing.tracks import pack_test_track
+
+
+class Command(BaseCommand):
+    help = 'Pack tests\' TestGPSCoordinate rows into compressed TestGPSTrack blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, action='append', help='Only pack this test (repeatable)')
+        parser.add_argument(
+            '--delete-rows', action='store_true',
+            help='Delete the packed rows afterwards (rows linked to a session are kept)'
+        )
+
+    def handle(self, *args, **options):
+        rows = TestGPSCoordinate.objects.filter(test__isnull=False)
+        if options['test']:
+            rows = rows.filter(test_id__in=options['test'])
+        test_ids = sorted(set(rows.values_list('test_id', flat=True)))
+
+        points = 0
+        for idx, test_id in enumerate(test_ids, 1):
+            points += pack_test_track(test_id, delete_rows=options['delete_rows'])
+            self.stdout.write(f'Progress: {idx}/{len(test_ids)} tests')
+
+        self.stdout.write(self.style.SUCCESS(f'Packed {points} points of {len(test_ids)} tests.'))
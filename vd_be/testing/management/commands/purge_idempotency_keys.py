@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from testing.idempotency import KEY_TTL
+from testing.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses older than the replay window'
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.filter(createdAt__lt=timezone.now() - KEY_TTL).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys.'))
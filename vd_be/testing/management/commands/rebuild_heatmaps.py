@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from organisation.models import Vehicle
+from testing.heatmap import refresh_cells
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the feedback heatmap cells of vehicles from the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehicle', type=int, action='append', help='Only rebuild this vehicle (repeatable)')
+
+    def handle(self, *args, **options):
+        vehicles = Vehicle.objects.order_by('id')
+        if options['vehicle']:
+            vehicles = vehicles.filter(id__in=options['vehicle'])
+        vehicle_ids = list(vehicles.values_list('id', flat=True))
+
+        changed = 0
+        for idx, vehicle_id in enumerate(vehicle_ids, 1):
+            changed += refresh_cells(vehicle_id)
+            self.stdout.write(f'Progress: {idx}/{len(vehicle_ids)} vehicles')
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the heatmaps of {len(vehicle_ids)} vehicles ({changed} cells changed).'))
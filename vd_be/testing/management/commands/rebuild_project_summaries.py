@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from organisation.models import Project
+from testing.summary import rebuild_project_summary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialised project dashboard summaries from the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, action='append', help='Only rebuild this project (repeatable)')
+
+    def handle(self, *args, **options):
+        projects = Project.objects.order_by('id')
+        if options['project']:
+            projects = projects.filter(id__in=options['project'])
+        project_ids = list(projects.values_list('id', flat=True))
+
+        for idx, project_id in enumerate(project_ids, 1):
+            rebuild_project_summary(project_id)
+            self.stdout.write(f'Progress: {idx}/{len(project_ids)} projects')
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(project_ids)} project summaries.'))
@@ -0,0 +1,101 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from testing.models import Test
+from testing.scoring import recompute_category_scores_for_tests
+from testing.summary import rebuild_project_summaries
+
+
+def _close_inherited_connections():
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+
+
+def _recompute_chunk(test_ids, dry_run):
+    result = recompute_category_scores_for_tests(test_ids, dry_run=dry_run)
+    connections.close_all()
+    return result
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored category scores in bulk, e.g. after benchmark weightages change'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organisation', type=int, help='Only recompute tests of this organisation')
+        parser.add_argument('--project', type=int, help='Only recompute tests of this project')
+        parser.add_argument('--from', dest='date_from', help='Only tests created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Only tests created on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of tests per chunk')
+        parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1), help='Number of worker processes')
+        parser.add_argument('--dry-run', action='store_true', help='Show which scores would change without writing them')
+
+    def _parse_date(self, value, end_of_day=False):
+        try:
+            day = datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Invalid date {value}. Expected YYYY-MM-DD.')
+        return timezone.make_aware(datetime.combine(day, time.max if end_of_day else time.min))
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size and --workers must be positive')
+
+        tests = Test.objects.all()
+        if options['organisation']:
+            tests = tests.filter(project__organisation_id=options['organisation'])
+        if options['project']:
+            tests = tests.filter(project_id=options['project'])
+        if options['date_from']:
+            tests = tests.filter(createdAt__gte=self._parse_date(options['date_from']))
+        if options['date_to']:
+            tests = tests.filter(createdAt__lte=self._parse_date(options['date_to'], end_of_day=True))
+
+        test_ids = list(tests.order_by('id').values_list('id', flat=True))
+        if not test_ids:
+            self.stdout.write(self.style.WARNING('No tests matched the given filters.'))
+            return
+
+        chunk_size = options['chunk_size']
+        chunks = [test_ids[i:i + chunk_size] for i in range(0, len(test_ids), chunk_size)]
+        dry_run = options['dry_run']
+        workers = min(options['workers'], len(chunks))
+        self.stdout.write(f'Recomputing {len(test_ids)} tests in {len(chunks)} chunks with {workers} worker(s)'
+                          f'{" (dry run)" if dry_run else ""}')
+
+        if workers == 1:
+            results = (recompute_category_scores_for_tests(chunk, dry_run=dry_run) for chunk in chunks)
+            self._report(results, len(test_ids), dry_run)
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_close_inherited_connections) as executor:
+                futures = [executor.submit(_recompute_chunk, chunk, dry_run) for chunk in chunks]
+                self._report((future.result() for future in as_completed(futures)), len(test_ids), dry_run)
+
+        if not dry_run:
+            # Bulk upserts bypass model signals, so refresh the dashboard summaries here
+            rebuild_project_summaries(list(tests.order_by().values_list('project_id', flat=True).distinct()))
+
+    def _report(self, results, total_tests, dry_run):
+        done_tests = 0
+        total_scores = 0
+        total_changes = 0
+        for result in results:
+            done_tests += result['tests']
+            total_scores += result['scores']
+            total_changes += len(result['changes'])
+            if dry_run:
+                for test_id, category, old, new in sorted(result['changes']):
+                    old_text = 'none' if old is None else f'{old:.2f}'
+                    new_text = 'removed' if new is None else f'{new:.2f}'
+                    self.stdout.write(f'  test {test_id} {category}: {old_text} -> {new_text}')
+            self.stdout.write(f'Progress: {done_tests}/{total_tests} tests')
+
+        verb = 'would change' if dry_run else 'changed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. {total_scores} scores computed, {total_changes} {verb}.'
+        ))
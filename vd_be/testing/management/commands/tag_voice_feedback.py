@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from organisation.models import Vehicle
+from testing.heatmap import refresh_tests
+from testing.models import Feedback, FeedbackTag
+from testing.tagging import get_automaton, match_categories
+
+
+class Command(BaseCommand):
+    help = 'Tag transcribed voice feedback with benchmark categories using the organisation keyword vocabularies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organisation', type=int, help='Only tag feedback recorded on this organisation\'s vehicles')
+        parser.add_argument('--untagged-only', action='store_true', help='Skip feedback that already has tags')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of feedbacks per chunk')
+
+    def handle(self, *args, **options):
+        vehicle_orgs = {
+            str(vehicle_id): organisation_id
+            for vehicle_id, organisation_id in Vehicle.objects.values_list('id', 'organisation_id')
+        }
+        if options['organisation']:
+            vehicle_orgs = {v: o for v, o in vehicle_orgs.items() if o == options['organisation']}
+
+        feedbacks = Feedback.objects.exclude(transcription_text='').filter(session__vehicle_id__in=vehicle_orgs.keys())
+        if options['untagged_only']:
+            feedbacks = feedbacks.filter(tags__isnull=True)
+        rows = list(feedbacks.order_by('id').values_list('id', 'session__vehicle_id', 'transcription_text', 'session__test_id'))
+
+        chunk_size = options['chunk_size']
+        tagged = 0
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            tags = []
+            for feedback_id, vehicle_id, text, _ in chunk:
+                matches = match_categories(get_automaton(vehicle_orgs[vehicle_id]), text)
+                tags.extend(
+                    FeedbackTag(feedback_id=feedback_id, category=category, hits=entry['hits'], keywords=entry['keywords'])
+                    for category, entry in matches.items()
+                )
+            with transaction.atomic():
+                FeedbackTag.objects.filter(feedback_id__in=[row[0] for row in chunk]).delete()
+                FeedbackTag.objects.bulk_create(tags)
+            refresh_tests({row[3] for row in chunk})
+            tagged += len({tag.feedback_id for tag in tags})
+            self.stdout.write(f'Progress: {start + len(chunk)}/{len(rows)} feedbacks')
+
+        self.stdout.write(self.style.SUCCESS(f'Tagged {tagged} of {len(rows)} transcribed feedbacks.'))
@@ -1,6 +1,9 @@
+import time
+
 from django.db import models
 
 from organisation.models import Organisation, Project, SpecValue, User, Vehicle
+from testing.geohash import encode_point
 
 class Test(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
@@ -17,6 +20,10 @@ class Test(models.Model):
     createdAt = models.DateTimeField(auto_now_add=True)
     updatedAt = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Keyset pagination of a project's tests, newest first
+        indexes = [models.Index(fields=['project', '-updatedAt', '-id'], name='test_project_updated_idx')]
+
     @classmethod
     def create(cls, project, vehicle, status):
         return cls.objects.create(project=project, vehicle=vehicle, status=status)
@@ -84,13 +91,33 @@ class TestSpecValue(models.Model):
         cls.objects.filter(id=tsv_id).delete()
 
 class TestGPSCoordinate(models.Model):
-    test = models.ForeignKey(Test, on_delete=models.CASCADE)
+    # Null when recorded for a session that is not linked to a test
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, null=True, blank=True)
+    session = models.ForeignKey(
+        'Session', on_delete=models.CASCADE, null=True, blank=True, related_name='gps_coordinates'
+    )
     lat = models.FloatField()
     lon = models.FloatField()
+    # Spatial index key (testing/geohash.py); area queries are range scans on it
+    geohash = models.CharField(max_length=12, null=True, blank=True)
     timestamp = models.DateTimeField()
     createdAt = models.DateTimeField(auto_now_add=True)
     updatedAt = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Tracks are read and de-duplicated in time order per test or session
+        indexes = [
+            models.Index(fields=['test', 'timestamp'], name='gps_test_timestamp_idx'),
+            models.Index(fields=['session', 'timestamp'], name='gps_session_timestamp_idx'),
+            models.Index(fields=['geohash'], name='gps_geohash_idx'),
+            # Area search within a project or vehicle (testing/spatial.py)
+            models.Index(fields=['test', 'geohash'], name='gps_test_geohash_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.geohash = encode_point(self.lat, self.lon)
+        super().save(*args, **kwargs)
+
     @classmethod
     def create(cls, test, lat, lon, timestamp):
         return cls.objects.create(test=test, lat=lat, lon=lon, timestamp=timestamp)
@@ -102,6 +129,9 @@ class TestGPSCoordinate(models.Model):
     @classmethod
     def update(cls, tgc_id, **kwargs):
         cls.objects.filter(id=tgc_id).update(**kwargs)
+        if 'lat' in kwargs or 'lon' in kwargs:
+            lat, lon = cls.objects.filter(id=tgc_id).values_list('lat', 'lon').first() or (None, None)
+            cls.objects.filter(id=tgc_id).update(geohash=encode_point(lat, lon))
 
     @classmethod
     def delete(cls, tgc_id):
@@ -182,6 +212,42 @@ class Report(models.Model):
         cls.objects.filter(id=report_id).delete()
 
 
+class TestGPSTrack(models.Model):
+    """
+    A test's GPS track packed into one compressed blob instead of one
+    TestGPSCoordinate row per fix; see testing/tracks.py for the encoding.
+    """
+    test = models.OneToOneField(Test, on_delete=models.CASCADE, related_name='gps_track')
+    point_count = models.IntegerField(default=0)
+    start_time = models.DateTimeField(null=True, blank=True)
+    end_time = models.DateTimeField(null=True, blank=True)
+    # Bounding box of the points, so area queries only decode tracks that can match
+    min_lat = models.FloatField(null=True, blank=True)
+    min_lon = models.FloatField(null=True, blank=True)
+    max_lat = models.FloatField(null=True, blank=True)
+    max_lon = models.FloatField(null=True, blank=True)
+    data = models.BinaryField()
+    createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"GPS track of test {self.test_id} - {self.point_count} points"
+
+class TestGPSTrackPyramid(models.Model):
+    """
+    Precomputed Douglas-Peucker levels of a test's GPS track, each a quarter of the
+    size of the one below, for bounded-size track queries (see testing/pyramid.py).
+    """
+    test = models.OneToOneField(Test, on_delete=models.CASCADE, related_name='gps_pyramid')
+    point_count = models.IntegerField(default=0)  # Track size the levels were built for
+    level_sizes = models.JSONField(default=list)
+    data = models.BinaryField()  # Compressed, delta-encoded point indices of every level
+    createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"GPS track levels of test {self.test_id} - {self.level_sizes}"
+
 class Session(models.Model):
     test = models.ForeignKey(Test, on_delete=models.CASCADE, null=True, blank=True, related_name='sessions')
     driver_id = models.CharField(max_length=255)
@@ -196,8 +262,236 @@ class Feedback(models.Model):
     audio_file = models.FileField(upload_to='feedback_audios/')
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Position and speed on the session's GPS track at `timestamp` (testing/alignment.py)
+    track_latitude = models.FloatField(null=True, blank=True)
+    track_longitude = models.FloatField(null=True, blank=True)
+    track_speed_kmh = models.FloatField(null=True, blank=True)
+    track_gap_ms = models.IntegerField(null=True, blank=True)  # Time to the nearest GPS fix
+    # Spatial index key of location() (testing/geohash.py)
+    geohash = models.CharField(max_length=12, null=True, blank=True, db_index=True)
+    # When the phone recorded the comment, as sent with the upload; None for clients that do not send it
+    recorded_at = models.DateTimeField(null=True, blank=True)
+    timestamp = models.DateTimeField(auto_now_add=True)  # Upload time
     transcription_text = models.TextField(blank=True)
 
+    class Meta:
+        # Area search within a project or vehicle (testing/spatial.py)
+        indexes = [models.Index(fields=['session', 'geohash'], name='feedback_session_geohash_idx')]
+
+    def __str__(self):
+        return f"Feedback {self.id} for Session {self.session.id}"
+
+    def recorded_time(self):
+        """When the comment was spoken: recorded_at, or the upload time for clients that do not send it."""
+        return self.recorded_at or self.timestamp
+
+    def location(self):
+        """(lat, lon) on the GPS track when aligned, otherwise as sent by the phone."""
+        if self.track_latitude is not None and self.track_longitude is not None:
+            return self.track_latitude, self.track_longitude
+        return self.latitude, self.longitude
+
+    def save(self, *args, **kwargs):
+        self.geohash = encode_point(*self.location())
+        super().save(*args, **kwargs)
+
+class TelemetryChannel(models.Model):
+    """
+    A named high-rate sensor channel of a session (accelerometer, steering angle, ...).
+    The samples live on disk as compressed chunks with a memory-mapped chunk index
+    (testing/telemetry.py); this row catalogues them and is updated after each append.
+    """
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='telemetry_channels')
+    name = models.CharField(max_length=64)
+    sample_count = models.BigIntegerField(default=0)
+    chunk_count = models.IntegerField(default=0)
+    stored_bytes = models.BigIntegerField(default=0)  # Compressed size on disk
+    start_time = models.DateTimeField(null=True, blank=True)
+    end_time = models.DateTimeField(null=True, blank=True)
+    min_value = models.FloatField(null=True, blank=True)
+    max_value = models.FloatField(null=True, blank=True)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['session', 'name']
+
+    def __str__(self):
+        return f"Channel {self.name} of session {self.session_id} - {self.sample_count} samples"
+
+class CategoryKeyword(models.Model):
+    """A term that marks a voice note transcript as being about a benchmark category."""
+    organisation = models.ForeignKey(Organisation, on_delete=models.CASCADE)
+    category = models.CharField(max_length=100, choices=TestingBenchmarkParams.CATEGORY_CHOICES)
+    keyword = models.CharField(max_length=255)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['organisation', 'category', 'keyword']
+
+    def __str__(self):
+        return f"{self.category} - {self.keyword}"
+
+class TrackSection(models.Model):
+    """
+    A named part of the organisation's proving ground (rough road, handling loop, ...)
+    as a polygon. GPS points and voice feedback are split by section in
+    testing/sections.py.
+    """
+    organisation = models.ForeignKey(Organisation, on_delete=models.CASCADE, related_name='track_sections')
+    name = models.CharField(max_length=255)
+    polygon = models.JSONField(default=list)  # [[lon, lat], ...] in GeoJSON order, closing vertex optional
+    # Bounding box of the polygon, kept in sync on save; points outside it skip the polygon test
+    min_lat = models.FloatField(default=0)
+    min_lon = models.FloatField(default=0)
+    max_lat = models.FloatField(default=0)
+    max_lon = models.FloatField(default=0)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['organisation', 'name']
+
+    def __str__(self):
+        return f"{self.name} ({self.organisation_id})"
+
+    def save(self, *args, **kwargs):
+        if self.polygon:
+            lons, lats = zip(*self.polygon)
+            self.min_lat, self.max_lat = min(lats), max(lats)
+            self.min_lon, self.max_lon = min(lons), max(lons)
+        super().save(*args, **kwargs)
+
+class FeedbackTag(models.Model):
+    feedback = models.ForeignKey(Feedback, on_delete=models.CASCADE, related_name='tags')
+    category = models.CharField(max_length=100)
+    hits = models.IntegerField(default=1)
+    keywords = models.JSONField(default=list)  # Distinct keywords that matched
+    createdAt = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['feedback', 'category']
+        indexes = [models.Index(fields=['category', 'feedback'])]
+
+    def __str__(self):
+        return f"Feedback {self.feedback_id} - {self.category}"
+
+class FeedbackHeatCell(models.Model):
+    """
+    Voice feedback of all tests of a vehicle aggregated per geohash cell, for the
+    feedback heatmap. Kept up to date cell by cell by testing/heatmap.py as feedback,
+    tags, ratings and scores change, and rebuilt by the rebuild_heatmaps command.
+    """
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='feedback_heat_cells')
+    cell = models.CharField(max_length=12)  # Geohash of heatmap.CELL_PRECISION characters
+    feedback_count = models.IntegerField(default=0)
+    # Sum and count of the mean questionnaire rating of each feedback's test
+    rating_sum = models.FloatField(default=0)
+    rating_count = models.IntegerField(default=0)
+    tags = models.JSONField(default=dict)  # category -> number of tagged feedback
+    category_scores = models.JSONField(default=dict)  # category -> {'sum': float, 'count': int}
+    createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['vehicle', 'cell']
+
+    def __str__(self):
+        return f"Feedback heat of vehicle {self.vehicle_id} in {self.cell}"
+
+class ProjectSummary(models.Model):
+    """
+    Denormalised dashboard numbers for a project. Kept up to date incrementally by
+    testing/signals.py and rebuilt from scratch by the rebuild_project_summaries command.
+    """
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, related_name='summary')
+    total_tests = models.IntegerField(default=0)
+    pending_tests = models.IntegerField(default=0)
+    yet_to_test_tests = models.IntegerField(default=0)
+    in_progress_tests = models.IntegerField(default=0)
+    completed_tests = models.IntegerField(default=0)
+    failed_tests = models.IntegerField(default=0)
+    reviewed_tests = models.IntegerField(default=0)
+    feedback_answer_count = models.IntegerField(default=0)
+    voice_feedback_count = models.IntegerField(default=0)
+    category_scores = models.JSONField(default=dict)  # category -> {'sum': float, 'count': int}
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    STATUS_FIELDS = {
+        'pending': 'pending_tests',
+        'yet_to_test': 'yet_to_test_tests',
+        'in_progress': 'in_progress_tests',
+        'completed': 'completed_tests',
+        'failed': 'failed_tests',
+    }
+
+    def __str__(self):
+        return f"Summary for {self.project}"
+
+def questionnaire_version_now():
+    """Microseconds since the epoch: versions taken from the clock never repeat an earlier one."""
+    return time.time_ns() // 1000
+
+
+class QuestionnaireBundle(models.Model):
+    """
+    Precompiled questionnaire (questions, categories and weightages) for a project.
+    `version` is bumped whenever a FeedbackQuestion or TestingBenchmarkParams of the
+    project changes; `payload` is rebuilt lazily when it is older than `version`.
+    Versions start from, and are bumped to at least, questionnaire_version_now(), so
+    a bundle row that is deleted and created again never reuses a version (and ETag)
+    its clients may still hold.
+    """
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, related_name='questionnaire_bundle')
+    version = models.BigIntegerField(default=questionnaire_version_now)
+    payload = models.JSONField(null=True, blank=True)
+    payload_version = models.BigIntegerField(null=True, blank=True)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Questionnaire for {self.project} - v{self.version}"
+
+class ProjectTestsVersion(models.Model):
+    """
+    Change counter for a project's tests listing. Bumped when participants or spec
+    values of its tests change, since those do not touch Test.updatedAt; used with
+    the test count and latest Test.updatedAt as the listing's ETag fingerprint.
+    """
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, related_name='tests_version')
+    version = models.IntegerField(default=1)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Tests of {self.project} - v{self.version}"
+
+class IdempotencyKey(models.Model):
+    """
+    A client supplied Idempotency-Key and the response of the first request that used
+    it, so retried requests are answered from here instead of running the view again.
+    """
+    STATUS_CHOICES = [
+        ('in_progress', 'In Progress'),
+        ('completed', 'Completed'),
+    ]
+    user_id = models.IntegerField()
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
+    # Renewed while the first request runs; past it, an in-progress key is abandoned
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    response_status = models.IntegerField(null=True, blank=True)
+    response_body = models.BinaryField(null=True, blank=True)
+    response_content_type = models.CharField(max_length=255, blank=True)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user_id', 'key')
+
     def __str__(self):
-        return f"Feedback {self.id} for Session {self.session.id}"
\ No newline at end of file
+        return f"Idempotency key {self.key} for user {self.user_id} - {self.status}"
@@ -0,0 +1,159 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+from pydantic import ValidationError as PydanticValidationError
+
+from organisation.models import SpecValue
+from testing.dto import TestOperationDTO
+from testing.listing import bump_tests_version
+from testing.models import ProjectSummary, Test, TestSpecValue
+from testing.summary import apply_summary_delta
+
+
+def _error_message(error):
+    return '; '.join(item['msg'] for item in error.errors())
+
+
+def _validate(raw_operations, project_ids=None):
+    """
+    Parse and check every operation with a fixed number of queries. Tests outside
+    project_ids (when given) are rejected. Returns
+    (operations, tests, errors): the parsed DTOs (None where parsing failed),
+    {test_id: (project_id, status, isReviewed)} and {index: message}.
+    """
+    operations = []
+    errors = {}
+    for index, raw in enumerate(raw_operations):
+        try:
+            operations.append(TestOperationDTO.model_validate(raw))
+        except PydanticValidationError as e:
+            operations.append(None)
+            errors[index] = _error_message(e)
+
+    valid = [(index, op) for index, op in enumerate(operations) if op is not None]
+    tests = {
+        row[0]: row[1:] for row in Test.objects.filter(id__in={op.test for _, op in valid}).values_list(
+            'id', 'project_id', 'status', 'isReviewed'
+        )
+    }
+    swaps = [op for _, op in valid if op.type == 'spec']
+    spec_values = set(SpecValue.objects.filter(id__in={op.new_spec_id for op in swaps}).values_list('id', flat=True))
+    links = set()
+    if swaps:
+        links = set(TestSpecValue.objects.filter(
+            test_id__in={op.test for op in swaps},
+            spec_id__in={op.old_spec_id for op in swaps} | {op.new_spec_id for op in swaps},
+        ).values_list('test_id', 'spec_id'))
+
+    replaced = {(op.test, op.old_spec_id) for op in swaps}
+    seen = set()
+    for index, op in valid:
+        # One status and one review change per test; spec swaps are keyed by the value they
+        # replace and by the value they bring in, so a test never ends up with a value twice
+        keys = [(op.test, op.type, op.old_spec_id if op.type == 'spec' else None)]
+        if op.type == 'spec' and op.new_spec_id != op.old_spec_id:
+            keys.append((op.test, 'spec_target', op.new_spec_id))
+        if op.test not in tests:
+            errors[index] = f'Test with id {op.test} not found'
+        elif project_ids is not None and tests[op.test][0] not in project_ids:
+            errors[index] = f'You do not have access to the project of test {op.test}'
+        elif keys[0] in seen:
+            errors[index] = f'Duplicate {op.type} operation for test {op.test}'
+        elif any(key in seen for key in keys[1:]):
+            errors[index] = f'SpecValue {op.new_spec_id} is already swapped into test {op.test} in this batch'
+        elif op.type == 'spec' and op.new_spec_id not in spec_values:
+            errors[index] = f'SpecValue with id {op.new_spec_id} does not exist'
+        elif op.type == 'spec' and (op.test, op.old_spec_id) not in links:
+            errors[index] = f'Test {op.test} does not use SpecValue {op.old_spec_id}'
+        elif op.type == 'spec' and op.new_spec_id != op.old_spec_id and (op.test, op.new_spec_id) in links:
+            errors[index] = f'Test {op.test} already uses SpecValue {op.new_spec_id}'
+        elif op.type == 'spec' and (op.test, op.new_spec_id) in replaced:
+            # Set-based updates run in no particular order, so chained or circular swaps are ambiguous
+            errors[index] = f'SpecValue {op.new_spec_id} is also swapped out of test {op.test} in this batch'
+        # Only valid operations claim their keys, so a corrected retry later in the batch is accepted
+        if index not in errors:
+            seen.update(keys)
+    return operations, tests, errors
+
+
+def apply_test_operations(raw_operations, all_or_nothing=False, project_ids=None):
+    """
+    Apply many status changes, review flags and spec swaps across tests:
+        {"type": "status", "test": 1, "status": "completed"}
+        {"type": "review", "test": 1, "isReviewed": true}
+        {"type": "spec", "test": 1, "old_spec_id": 3, "new_spec_id": 4, "isTestingParam": true}
+
+    All operations are validated together, then applied in one transaction as one
+    UPDATE per distinct target value (at most five for status, two for review and
+    one per distinct swap), not one query per test. Invalid operations, and those on
+    tests outside project_ids when it is given, are reported and skipped, or with
+    all_or_nothing nothing is applied.
+
+    Returns (results, applied) where results lists {index, test, ok[, error]} in
+    request order. Queryset updates bypass model signals, so ProjectSummary counters
+    and the tests listing version are adjusted here, from the tests' rows re-read
+    with select_for_update inside the transaction.
+    """
+    operations, tests, errors = _validate(raw_operations, project_ids)
+    results = []
+    for index, (raw, op) in enumerate(zip(raw_operations, operations)):
+        test_id = op.test if op is not None else (raw.get('test') if isinstance(raw, dict) else None)
+        result = {'index': index, 'test': test_id, 'ok': index not in errors}
+        if index in errors:
+            result['error'] = errors[index]
+        results.append(result)
+    if errors and all_or_nothing:
+        return results, False
+
+    statuses = defaultdict(list)
+    reviews = defaultdict(list)
+    swaps = defaultdict(list)
+    for index, op in enumerate(operations):
+        if index in errors:
+            continue
+        if op.type == 'status':
+            statuses[op.status].append(op.test)
+        elif op.type == 'review':
+            reviews[op.isReviewed].append(op.test)
+        else:
+            swaps[(op.old_spec_id, op.new_spec_id, op.isTestingParam)].append(op.test)
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Summary deltas come from the rows as they are now, locked until commit, so a
+        # concurrent batch changing the same tests cannot make both count the same change
+        changed = {test_id for test_ids in (*statuses.values(), *reviews.values()) for test_id in test_ids}
+        current = {
+            row[0]: row[1:] for row in Test.objects.select_for_update().filter(id__in=changed).values_list(
+                'id', 'project_id', 'status', 'isReviewed'
+            )
+        } if changed else {}
+        deltas = defaultdict(Counter)
+        for status, test_ids in statuses.items():
+            for test_id in test_ids:
+                project_id, old_status, _ = current[test_id]
+                if old_status != status:
+                    # Rows written before a status was added to STATUS_FIELDS have no counter to move
+                    for field, delta in ((ProjectSummary.STATUS_FIELDS.get(old_status), -1),
+                                         (ProjectSummary.STATUS_FIELDS.get(status), 1)):
+                        if field:
+                            deltas[project_id][field] += delta
+        for is_reviewed, test_ids in reviews.items():
+            for test_id in test_ids:
+                project_id, _, old_reviewed = current[test_id]
+                deltas[project_id]['reviewed_tests'] += int(is_reviewed) - int(old_reviewed)
+
+        for status, test_ids in statuses.items():
+            Test.objects.filter(id__in=test_ids).update(status=status, updatedAt=now)
+        for is_reviewed, test_ids in reviews.items():
+            Test.objects.filter(id__in=test_ids).update(isReviewed=is_reviewed, updatedAt=now)
+        for (old_spec_id, new_spec_id, is_testing_param), test_ids in swaps.items():
+            TestSpecValue.objects.filter(test_id__in=test_ids, spec_id=old_spec_id).update(
+                spec_id=new_spec_id, isTestingParam=is_testing_param, updatedAt=now
+            )
+        for project_id, project_deltas in deltas.items():
+            apply_summary_delta(project_id, **project_deltas)
+        for project_id in {tests[test_id][0] for test_ids in swaps.values() for test_id in test_ids}:
+            bump_tests_version(project_id)
+    return results, True
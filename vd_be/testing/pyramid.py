@@ -0,0 +1,149 @@
+import zlib
+
+import numpy as np
+
+from testing.models import TestGPSTrackPyramid
+from testing.tracks import load_track
+
+EARTH_RADIUS_M = 6371008.8
+# Each level keeps a quarter of the points of the one below; the coarsest has at most this many
+LEVEL_FACTOR = 4
+MIN_LEVEL_POINTS = 512
+COMPRESSION_LEVEL = 6
+
+
+def _project(track):
+    """Equirectangular x/y in metres around the track's mean latitude (fine at track scale)."""
+    lat = np.radians(track.lat)
+    lon = np.radians(track.lon)
+    return EARTH_RADIUS_M * lon * np.cos(lat.mean()), EARTH_RADIUS_M * lat
+
+
+def _segment_distance(px, py, ax, ay, bx, by):
+    """Distance from points p to segments a-b, all arrays of equal length."""
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(length2 > 0, ((px - ax) * dx + (py - ay) * dy) / length2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def significance(track):
+    """
+    Douglas-Peucker significance of every point: the tolerance (metres) below which
+    the point is kept. Endpoints are infinite. Keeping the points with significance
+    >= e gives the Douglas-Peucker simplification at tolerance e, so one ranking
+    serves every level.
+
+    All segments at the same recursion depth are split together with segmented
+    NumPy reductions, so the Python loop runs once per depth, not once per point.
+    """
+    count = len(track)
+    sig = np.zeros(count)
+    if count == 0:
+        return sig
+    sig[[0, -1]] = np.inf
+    if count < 3:
+        return sig
+    x, y = _project(track)
+
+    starts, ends, parents = np.array([0]), np.array([count - 1]), np.array([np.inf])
+    while len(starts):
+        interior = ends - starts - 1
+        active = interior > 0
+        starts, ends, parents, interior = starts[active], ends[active], parents[active], interior[active]
+        if not len(starts):
+            break
+        segment = np.repeat(np.arange(len(starts)), interior)
+        offsets = np.cumsum(interior) - interior
+        index = starts[segment] + 1 + (np.arange(interior.sum()) - offsets[segment])
+        a, b = starts[segment], ends[segment]
+        distance = _segment_distance(x[index], y[index], x[a], y[a], x[b], y[b])
+
+        furthest = np.maximum.reduceat(distance, offsets)
+        split = np.minimum.reduceat(np.where(distance == furthest[segment], index, count), offsets)
+        # A child never outranks its parent, so thresholds give nested simplifications
+        sig[split] = np.minimum(furthest, parents)
+        # Segments whose points all lie on the chord are done; their points keep 0
+        more = furthest > 0
+        split, starts, ends = split[more], starts[more], ends[more]
+        starts, ends = np.concatenate([starts, split]), np.concatenate([split, ends])
+        parents = np.concatenate([sig[split], sig[split]])
+    return sig
+
+
+def build_levels(track):
+    """
+    Sorted point indices of each reduced level, finest first. The full track is level
+    0 and is not stored.
+    """
+    count = len(track)
+    order = np.argsort(-significance(track), kind='stable')
+    levels = []
+    size = count
+    while size > MIN_LEVEL_POINTS:
+        size = -(-size // LEVEL_FACTOR)
+        levels.append(np.sort(order[:max(size, 2)]))
+    return levels
+
+
+def encode_levels(levels):
+    parts = [np.diff(level, prepend=0).astype('<u4').tobytes() for level in levels]
+    return zlib.compress(b''.join(parts), COMPRESSION_LEVEL)
+
+
+def decode_levels(data, sizes):
+    raw = np.frombuffer(zlib.decompress(bytes(data)), dtype='<u4')
+    levels, position = [], 0
+    for size in sizes:
+        levels.append(np.cumsum(raw[position:position + size], dtype=np.int64))
+        position += size
+    return levels
+
+
+def build_track_pyramid(test_id, track=None):
+    """(Re)build the stored pyramid of a test's track. Returns the levels."""
+    track = load_track(test_id) if track is None else track
+    levels = build_levels(track)
+    TestGPSTrackPyramid.objects.update_or_create(test_id=test_id, defaults={
+        'point_count': len(track),
+        'level_sizes': [len(level) for level in levels],
+        'data': encode_levels(levels),
+    })
+    return levels
+
+
+def load_pyramid(test_id):
+    """
+    A test's track and its levels. A missing pyramid, or one built for a different
+    number of points (rows changed outside the ingest endpoint), is rebuilt.
+    """
+    track = load_track(test_id)
+    stored = TestGPSTrackPyramid.objects.filter(test_id=test_id).values_list('point_count', 'level_sizes', 'data').first()
+    if stored is not None and stored[0] == len(track):
+        return track, decode_levels(stored[2], stored[1])
+    return track, build_track_pyramid(test_id, track)
+
+
+def select_points(track, levels, start_ms=None, end_ms=None, bbox=None, max_points=2000):
+    """
+    Indices of the track points to return for a window: the finest level whose points
+    inside the time window and bbox (min_lon, min_lat, max_lon, max_lat) number at
+    most max_points. Returns (level, indices); level 0 is full resolution. If even
+    the coarsest level has too many, it is thinned evenly.
+    """
+    candidates = [None] + list(levels)
+    for level, index in enumerate(candidates):
+        timestamps = track.timestamp_ms if index is None else track.timestamp_ms[index]
+        lo = 0 if start_ms is None else np.searchsorted(timestamps, start_ms, side='left')
+        hi = len(timestamps) if end_ms is None else np.searchsorted(timestamps, end_ms, side='right')
+        selected = np.arange(lo, hi) if index is None else index[lo:hi]
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            lat, lon = track.lat[selected], track.lon[selected]
+            selected = selected[(lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)]
+        if len(selected) <= max_points:
+            return level, selected
+    keep = np.unique(np.linspace(0, len(selected) - 1, max_points).round().astype(np.int64))
+    return len(candidates) - 1, selected[keep]
@@ -0,0 +1,68 @@
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from organisation.models import Project
+from testing.models import FeedbackQuestion, QuestionnaireBundle, TestingBenchmarkParams, questionnaire_version_now
+
+
+def bump_questionnaire_version(project_id):
+    if project_id is None:
+        return
+    # Moves with the clock, and by one at least when bumps come faster than it ticks
+    QuestionnaireBundle.objects.filter(project_id=project_id).update(
+        version=Greatest(F('version') + 1, Value(questionnaire_version_now())), updatedAt=timezone.now()
+    )
+
+
+def get_questionnaire_version(project_id):
+    """Current bundle version of a project, or None if no bundle has been built yet."""
+    return QuestionnaireBundle.objects.filter(project_id=project_id).values_list('version', flat=True).first()
+
+
+def build_questionnaire_payload(project):
+    questions = list(
+        FeedbackQuestion.objects.filter(project=project).order_by('-createdAt').values('id', 'question')
+    )
+    params = TestingBenchmarkParams.objects.filter(
+        question__project=project,
+        organisation_id=project.organisation_id
+    ).order_by('id').values_list('question_id', 'category', 'weightage')
+
+    question_categories = {}
+    categories = {}
+    for question_id, category, weightage in params:
+        question_categories.setdefault(question_id, []).append({'category': category, 'weightage': weightage})
+        categories.setdefault(category, []).append(question_id)
+
+    return {
+        'project_id': project.id,
+        'organisation_id': project.organisation_id,
+        'questions': [
+            {**question, 'categories': question_categories.get(question['id'], [])}
+            for question in questions
+        ],
+        'categories': categories,
+    }
+
+
+def get_questionnaire_bundle(project_id):
+    """
+    Return (version, payload) for a project, building the payload only when the
+    stored one is older than the current version. Raises Project.DoesNotExist.
+    """
+    bundle = QuestionnaireBundle.objects.filter(project_id=project_id).first()
+    if bundle is None:
+        project = Project.get_by_id(project_id)
+        bundle, _ = QuestionnaireBundle.objects.get_or_create(project=project)
+    if bundle.payload is not None and bundle.payload_version == bundle.version:
+        return bundle.version, bundle.payload
+
+    version = bundle.version
+    project = Project.get_by_id(project_id)
+    payload = {**build_questionnaire_payload(project), 'version': version}
+    # Only store it if nothing bumped the version while we were building
+    QuestionnaireBundle.objects.filter(project_id=project_id, version=version).update(
+        payload=payload, payload_version=version
+    )
+    return version, payload
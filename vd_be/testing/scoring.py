@@ -0,0 +1,127 @@
+import numpy as np
+from django.db import transaction
+
+from testing.heatmap import refresh_tests
+from testing.models import CategoryScore, FeedbackAnswer, Test, TestingBenchmarkParams
+
+
+def compute_category_scores_bulk(answers, test_orgs, params):
+    """
+    Vectorised equivalent of calculate_category_scores for many tests at once.
+
+    answers:   list of (test_id, question_id, rating)
+    test_orgs: dict test_id -> organisation_id
+    params:    list of (organisation_id, question_id, category, weightage)
+
+    Returns a dict (test_id, category) -> score rounded to 2 decimals. As in
+    calculate_category_scores, a category only gets a score for a test when one
+    of its benchmark questions was answered in that test.
+    """
+    if not answers or not params:
+        return {}
+
+    a_test = np.fromiter((a[0] for a in answers), dtype=np.int64, count=len(answers))
+    a_question = np.fromiter((a[1] for a in answers), dtype=np.int64, count=len(answers))
+    a_rating = np.fromiter((a[2] for a in answers), dtype=np.float64, count=len(answers))
+    a_org = np.fromiter((test_orgs[t] for t in a_test.tolist()), dtype=np.int64, count=len(answers))
+
+    categories = sorted({p[2] for p in params})
+    category_index = {category: idx for idx, category in enumerate(categories)}
+    p_org = np.fromiter((p[0] for p in params), dtype=np.int64, count=len(params))
+    p_question = np.fromiter((p[1] for p in params), dtype=np.int64, count=len(params))
+    p_category = np.fromiter((category_index[p[2]] for p in params), dtype=np.int64, count=len(params))
+    p_weightage = np.fromiter((p[3] for p in params), dtype=np.float64, count=len(params))
+
+    # Join answers to benchmark params on (organisation, question)
+    p_key = (p_org << 32) | p_question
+    order = np.argsort(p_key, kind='stable')
+    p_key, p_category, p_weightage = p_key[order], p_category[order], p_weightage[order]
+
+    a_key = (a_org << 32) | a_question
+    lo = np.searchsorted(p_key, a_key, side='left')
+    hi = np.searchsorted(p_key, a_key, side='right')
+    counts = hi - lo
+    total = int(counts.sum())
+    if total == 0:
+        return {}
+
+    answer_idx = np.repeat(np.arange(len(answers)), counts)
+    group_start = np.repeat(np.cumsum(counts) - counts, counts)
+    param_idx = np.repeat(lo, counts) + (np.arange(total) - group_start)
+
+    # Contribution: rating * (weightage/100), summed per (test, category)
+    contributions = a_rating[answer_idx] * (p_weightage[param_idx] / 100.0)
+    pair_key = (a_test[answer_idx] << 16) | p_category[param_idx]
+    unique_pairs, inverse = np.unique(pair_key, return_inverse=True)
+    sums = np.bincount(inverse, weights=contributions, minlength=len(unique_pairs))
+
+    return {
+        (int(pair >> 16), categories[int(pair & 0xFFFF)]): round(float(score), 2)
+        for pair, score in zip(unique_pairs.tolist(), sums.tolist())
+    }
+
+
+def recompute_category_scores_for_tests(test_ids, dry_run=False):
+    """
+    Recompute and upsert CategoryScore rows for the given tests using a fixed
+    number of queries. Scores for categories that no longer apply are removed.
+
+    Returns a dict with counts and the list of changes as
+    (test_id, category, old_score, new_score); old or new is None for
+    created or removed scores.
+    """
+    test_orgs = dict(
+        Test.objects.filter(id__in=test_ids).values_list('id', 'project__organisation_id')
+    )
+    answers = list(
+        FeedbackAnswer.objects.filter(test_id__in=test_orgs.keys()).values_list('test_id', 'question_id', 'rating')
+    )
+    question_ids = {a[1] for a in answers}
+    params = list(
+        TestingBenchmarkParams.objects.filter(
+            organisation_id__in=set(test_orgs.values()),
+            question_id__in=question_ids
+        ).values_list('organisation_id', 'question_id', 'category', 'weightage')
+    )
+    existing = {
+        (test_id, category): (score_id, score)
+        for score_id, test_id, category, score in CategoryScore.objects.filter(
+            test_id__in=test_orgs.keys()
+        ).values_list('id', 'test_id', 'category', 'score')
+    }
+
+    new_scores = compute_category_scores_bulk(answers, test_orgs, params)
+
+    changes = []
+    for key, score in new_scores.items():
+        old = existing.get(key)
+        if old is None or abs(old[1] - score) > 1e-9:
+            changes.append((key[0], key[1], old[1] if old else None, score))
+    stale_ids = []
+    for key, (score_id, score) in existing.items():
+        if key not in new_scores:
+            stale_ids.append(score_id)
+            changes.append((key[0], key[1], score, None))
+
+    if not dry_run and changes:
+        to_upsert = [
+            CategoryScore(test_id=test_id, category=category, score=new)
+            for test_id, category, old, new in changes if new is not None
+        ]
+        with transaction.atomic():
+            CategoryScore.objects.bulk_create(
+                to_upsert,
+                update_conflicts=True,
+                unique_fields=['test', 'category'],
+                update_fields=['score', 'updatedAt'],
+            )
+            if stale_ids:
+                CategoryScore.objects.filter(id__in=stale_ids).delete()
+        # The upsert sends no signals
+        refresh_tests({test_id for test_id, _, _, _ in changes})
+
+    return {
+        'tests': len(test_orgs),
+        'scores': len(new_scores),
+        'changes': changes,
+    }
@@ -0,0 +1,153 @@
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from testing.models import Feedback, FeedbackTag, Test, TrackSection
+from testing.tracks import load_track, track_fingerprint
+from testing.trip_metrics import MAX_GAP_S, haversine_m
+
+SECTION_SUMMARY_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def points_in_polygon(lat, lon, polygon):
+    """
+    Even-odd rule test of arrays of points against a [[lon, lat], ...] polygon. The
+    loop runs over the edges; every edge is tested against all points at once.
+    """
+    vertices = np.asarray(polygon, dtype=np.float64)
+    x, y = vertices[:, 0], vertices[:, 1]
+    x2, y2 = np.roll(x, -1), np.roll(y, -1)
+    inside = np.zeros(len(lat), dtype=bool)
+    for x1, y1, x2_, y2_ in zip(x.tolist(), y.tolist(), x2.tolist(), y2.tolist()):
+        if y1 == y2_:
+            continue  # Horizontal edges never cross a horizontal ray
+        crosses = (y1 > lat) != (y2_ > lat)
+        crossing_lon = x1 + (lat - y1) * (x2_ - x1) / (y2_ - y1)
+        inside ^= crosses & (lon < crossing_lon)
+    return inside
+
+
+def assign_sections(lat, lon, sections):
+    """
+    Index into sections of the section containing each point, -1 for none. Only the
+    points inside a section's bounding box are tested against its polygon; where
+    sections overlap the first one wins.
+    """
+    lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+    assigned = np.full(len(lat), -1, dtype=np.int64)
+    for index, section in enumerate(sections):
+        candidates = np.flatnonzero(
+            (assigned < 0)
+            & (lat >= section.min_lat) & (lat <= section.max_lat)
+            & (lon >= section.min_lon) & (lon <= section.max_lon)
+        )
+        if len(candidates):
+            inside = points_in_polygon(lat[candidates], lon[candidates], section.polygon)
+            assigned[candidates[inside]] = index
+    return assigned
+
+
+def _empty_aggregate():
+    return {
+        'points': 0, 'visits': 0, 'time_s': 0.0, 'distance_m': 0.0,
+        'feedback_count': 0, 'feedback_ids': [], 'tags': {},
+    }
+
+
+def compute_section_summary(track, sections, feedback, tags):
+    """
+    Per-section aggregates of a test. feedback is [(id, lat, lon)] with None for
+    feedback that has no location, tags is [(feedback_id, category)]. Time and
+    distance count the intervals that start in a section, leaving out signal gaps
+    longer than MAX_GAP_S; a visit is a run of consecutive points in a section.
+    Returns (per-section aggregates in section order, aggregate of the rest).
+    """
+    aggregates = [_empty_aggregate() for _ in sections]
+    outside = _empty_aggregate()
+
+    def bucket(index):
+        return aggregates[index] if index >= 0 else outside
+
+    if len(track):
+        assigned = assign_sections(track.lat, track.lon, sections)
+        points = np.bincount(assigned + 1, minlength=len(sections) + 1)
+        starts = np.append(True, assigned[1:] != assigned[:-1])
+        visits = np.bincount(assigned[starts] + 1, minlength=len(sections) + 1)
+        time_s, distance_m = np.zeros(len(sections) + 1), np.zeros(len(sections) + 1)
+        if len(track) > 1:
+            dt = np.diff(track.timestamp_ms) / 1000.0
+            counted = dt <= MAX_GAP_S
+            distance = haversine_m(track.lat[:-1], track.lon[:-1], track.lat[1:], track.lon[1:])
+            owner = assigned[:-1][counted] + 1
+            time_s = np.bincount(owner, weights=dt[counted], minlength=len(sections) + 1)
+            distance_m = np.bincount(owner, weights=distance[counted], minlength=len(sections) + 1)
+        for index in range(-1, len(sections)):
+            aggregate = bucket(index)
+            aggregate['points'] = int(points[index + 1])
+            aggregate['visits'] = int(visits[index + 1])
+            aggregate['time_s'] = round(float(time_s[index + 1]), 1)
+            aggregate['distance_m'] = round(float(distance_m[index + 1]), 1)
+
+    located = [(feedback_id, lat, lon) for feedback_id, lat, lon in feedback if lat is not None and lon is not None]
+    feedback_section = {feedback_id: -1 for feedback_id, _, _ in feedback}
+    if located:
+        ids, lats, lons = zip(*located)
+        feedback_section.update(zip(ids, assign_sections(lats, lons, sections).tolist()))
+    for feedback_id, index in sorted(feedback_section.items()):
+        aggregate = bucket(index)
+        aggregate['feedback_count'] += 1
+        aggregate['feedback_ids'].append(feedback_id)
+    for feedback_id, category in tags:
+        counts = bucket(feedback_section.get(feedback_id, -1))['tags']
+        counts[category] = counts.get(category, 0) + 1
+    return aggregates, outside
+
+
+def _fingerprint(test_id, organisation_id):
+    """Changes with the track, the organisation's sections, and the test's feedback or tags."""
+    section_state = TrackSection.objects.filter(organisation_id=organisation_id).aggregate(
+        count=Count('id'), latest=Max('updatedAt'),
+    )
+    feedback_state = Feedback.objects.filter(session__test_id=test_id).aggregate(
+        count=Count('id', distinct=True), latest=Max('id'), tag_count=Count('tags'), latest_tag=Max('tags__id'),
+    )
+    latest_section = section_state['latest'].timestamp() if section_state['latest'] else 0
+    return (
+        f'{track_fingerprint(test_id)}:{section_state["count"]}:{latest_section}:'
+        f'{feedback_state["count"]}:{feedback_state["latest"]}:{feedback_state["tag_count"]}:{feedback_state["latest_tag"]}'
+    )
+
+
+def section_summary(test_id):
+    """
+    compute_section_summary of a test against its organisation's sections, cached
+    until the track, the sections or the test's feedback change. Returns None for an
+    unknown test.
+    """
+    organisation_id = Test.objects.filter(id=test_id).values_list('project__organisation_id', flat=True).first()
+    if organisation_id is None:
+        return None
+    cache_key = f'section_summary:{test_id}:{_fingerprint(test_id, organisation_id)}'
+    summary = cache.get(cache_key)
+    if summary is not None:
+        return summary
+
+    sections = list(TrackSection.objects.filter(organisation_id=organisation_id).order_by('id'))
+    feedbacks = list(Feedback.objects.filter(session__test_id=test_id).only(
+        'id', 'latitude', 'longitude', 'track_latitude', 'track_longitude',
+    ).order_by('id'))
+    aggregates, outside = compute_section_summary(
+        load_track(test_id),
+        sections,
+        [(feedback.id, *feedback.location()) for feedback in feedbacks],
+        list(FeedbackTag.objects.filter(feedback__session__test_id=test_id).values_list('feedback_id', 'category')),
+    )
+    summary = {
+        'sections': [
+            {'id': section.id, 'name': section.name, **aggregate}
+            for section, aggregate in zip(sections, aggregates)
+        ],
+        'outside': outside,
+    }
+    cache.set(cache_key, summary, SECTION_SUMMARY_CACHE_TIMEOUT)
+    return summary
@@ -1,6 +1,8 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from organisation.serializers import SpecValueSerializer,OrganisationSerializer
-from testing.models import Feedback, FeedbackAnswer, FeedbackQuestion, Report, Session, Test, TestGPSCoordinate, TestParticipant, TestSpecValue
+from vd_be.row_serializers import RowSerializer
+from testing.models import Feedback, FeedbackAnswer, FeedbackTag, FeedbackQuestion, Report, Session, Test, TestGPSCoordinate, TestParticipant, TestSpecValue
 
 
 class TestSerializer(serializers.ModelSerializer):
@@ -61,14 +63,21 @@ class SessionSerializer(serializers.ModelSerializer):
         model = Session
         fields = '__all__'
 
+class FeedbackTagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FeedbackTag
+        fields = ['category', 'hits', 'keywords']
+
 class FeedbackSerializer(serializers.ModelSerializer):
     audio_file_url = serializers.SerializerMethodField()
     session = SessionSerializer(read_only=True)
+    tags = FeedbackTagSerializer(many=True, read_only=True)
     
     class Meta:
         model = Feedback
         fields = ['id', 'session', 'audio_file', 'audio_file_url', 'transcription_text', 
-                  'latitude', 'longitude', 'timestamp']
+                  'latitude', 'longitude', 'track_latitude', 'track_longitude', 'track_speed_kmh', 'track_gap_ms',
+                  'recorded_at', 'timestamp', 'tags']
     
     def get_audio_file_url(self, obj):
         """Get full URL for the audio file"""
@@ -78,3 +87,36 @@ class FeedbackSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.audio_file.url)
             return obj.audio_file.url
         return None
+
+
+# values()-based serializers for sparse fieldsets (?fields= / ?include=) on list endpoints
+
+def _audio_file_url(values, context):
+    name, = values
+    if not name:
+        return None
+    url = default_storage.url(name)
+    request = (context or {}).get('request')
+    return request.build_absolute_uri(url) if request else url
+
+
+SessionRowSerializer = RowSerializer(Session, {
+    'id': 'id', 'test': 'test_id', 'driver_id': 'driver_id', 'vehicle_id': 'vehicle_id', 'start_time': 'start_time',
+})
+
+FeedbackTagRowSerializer = RowSerializer(FeedbackTag, {
+    'category': 'category', 'hits': 'hits', 'keywords': 'keywords',
+})
+
+FeedbackRowSerializer = RowSerializer(Feedback, {
+    'id': 'id', 'session': 'session_id', 'audio_file': 'audio_file', 'transcription_text': 'transcription_text',
+    'latitude': 'latitude', 'longitude': 'longitude', 'track_latitude': 'track_latitude',
+    'track_longitude': 'track_longitude', 'track_speed_kmh': 'track_speed_kmh', 'track_gap_ms': 'track_gap_ms',
+    'recorded_at': 'recorded_at', 'timestamp': 'timestamp',
+}, computed={
+    'audio_file_url': (('audio_file',), _audio_file_url),
+}, related={
+    'session': ('session', SessionRowSerializer),
+}, many={
+    'tags': ('feedback_id', FeedbackTagRowSerializer),
+})
@@ -0,0 +1,257 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from organisation.models import Project, Spec, SpecValue
+from testing.access import forget_session, forget_test
+from testing.alignment import align_session_feedback
+from testing.heatmap import refresh_on_commit
+from testing.listing import bump_organisation_tests_versions, bump_tests_version
+from testing.models import (
+    CategoryScore, Feedback, FeedbackAnswer, FeedbackQuestion, ProjectSummary, Session, Test, TestingBenchmarkParams,
+    TestParticipant, TestSpecValue
+)
+from testing.questionnaire import bump_questionnaire_version
+from testing.summary import apply_category_score_delta, apply_summary_delta, rebuild_project_summaries
+from testing.telemetry import delete_session_telemetry
+
+
+def _project_id_for_test(test_id):
+    if test_id is None:
+        return None
+    return Test.objects.filter(id=test_id).values_list('project_id', flat=True).first()
+
+
+def _project_id_for_parent(sender, instance):
+    """Project of the test a FeedbackAnswer or CategoryScore belongs to, from its loaded test when it has one."""
+    if sender.test.is_cached(instance):
+        return instance.test.project_id
+    return _project_id_for_test(instance.test_id)
+
+
+def _project_id_for_session(session_id):
+    return Session.objects.filter(id=session_id).values_list('test__project_id', flat=True).first()
+
+
+def _test_id_for_session(session_id):
+    return Session.objects.filter(id=session_id).values_list('test_id', flat=True).first()
+
+
+def _status_deltas(status, sign):
+    field = ProjectSummary.STATUS_FIELDS.get(status)
+    return {field: sign} if field else {}
+
+
+# Remember the values loaded from the database so saves can be applied as deltas.
+# __dict__ is read directly so deferred fields are not fetched.
+
+@receiver(post_init, sender=Test)
+def remember_test_state(sender, instance, **kwargs):
+    instance._summary_state = (
+        instance.__dict__.get('status'), instance.__dict__.get('isReviewed'), instance.__dict__.get('project_id')
+    )
+
+
+@receiver(post_init, sender=FeedbackAnswer)
+def remember_feedback_answer_state(sender, instance, **kwargs):
+    instance._summary_state = instance.__dict__.get('test_id')
+
+
+@receiver(post_init, sender=CategoryScore)
+def remember_category_score_state(sender, instance, **kwargs):
+    instance._summary_state = (
+        instance.__dict__.get('category'), instance.__dict__.get('score'), instance.__dict__.get('test_id')
+    )
+
+
+@receiver(post_init, sender=Session)
+def remember_session_state(sender, instance, **kwargs):
+    instance._summary_state = instance.__dict__.get('test_id')
+
+
+@receiver(post_init, sender=Feedback)
+def remember_feedback_state(sender, instance, **kwargs):
+    instance._heat_state = instance.__dict__.get('geohash')
+
+
+@receiver(post_save, sender=Test)
+def test_saved(sender, instance, created, **kwargs):
+    old_status, old_reviewed, old_project_id = instance._summary_state
+    if not created and old_project_id is not None and old_project_id != instance.project_id:
+        _test_moved(instance, old_project_id)
+    else:
+        if created:
+            deltas = {'total_tests': 1, 'reviewed_tests': int(instance.isReviewed), **_status_deltas(instance.status, 1)}
+        elif old_status is None or old_reviewed is None:
+            # Loaded with deferred fields; the old values are unknown
+            deltas = {}
+        else:
+            deltas = {'reviewed_tests': int(instance.isReviewed) - int(old_reviewed)}
+            if old_status != instance.status:
+                deltas.update(_status_deltas(old_status, -1))
+                deltas.update(_status_deltas(instance.status, 1))
+        apply_summary_delta(instance.project_id, **deltas)
+    instance._summary_state = (instance.status, instance.isReviewed, instance.project_id)
+
+
+def _test_moved(test, old_project_id):
+    # Rare: the test takes its answers, scores and voice feedback along, so both
+    # summaries are rebuilt from the source tables rather than patched
+    rebuild_project_summaries([old_project_id, test.project_id])
+    bump_tests_version(old_project_id)
+    bump_tests_version(test.project_id)
+    forget_test(test.id)
+    for session_id in test.sessions.values_list('id', flat=True):
+        forget_session(session_id)
+    # The new vehicle's cells are found through the test; the old vehicle's are named
+    old_vehicle_id = Project.objects.filter(id=old_project_id).values_list('vehicle_id', flat=True).first()
+    cells = Feedback.objects.filter(session__test=test, geohash__isnull=False).values_list('geohash', flat=True)
+    refresh_on_commit(test_ids=[test.id], vehicle_cells=[(old_vehicle_id, cell) for cell in cells])
+
+
+@receiver(post_delete, sender=Test)
+def test_deleted(sender, instance, **kwargs):
+    old_status, old_reviewed, _ = instance._summary_state
+    apply_summary_delta(
+        instance.project_id,
+        total_tests=-1,
+        reviewed_tests=-int(old_reviewed),
+        **_status_deltas(old_status, -1)
+    )
+    # The remaining tests' updatedAt does not move when one is deleted
+    bump_tests_version(instance.project_id)
+    forget_test(instance.id)
+
+
+@receiver(post_save, sender=FeedbackAnswer)
+def feedback_answer_saved(sender, instance, created, **kwargs):
+    old_test_id = instance._summary_state
+    if not created and old_test_id is not None and old_test_id != instance.test_id:
+        # Moved to another test, possibly of another project
+        apply_summary_delta(_project_id_for_test(old_test_id), feedback_answer_count=-1)
+        apply_summary_delta(_project_id_for_parent(sender, instance), feedback_answer_count=1)
+        refresh_on_commit(test_ids=[old_test_id])
+    else:
+        apply_summary_delta(_project_id_for_parent(sender, instance), feedback_answer_count=1 if created else 0)
+    refresh_on_commit(test_ids=[instance.test_id])
+    instance._summary_state = instance.test_id
+
+
+@receiver(post_delete, sender=FeedbackAnswer)
+def feedback_answer_deleted(sender, instance, **kwargs):
+    apply_summary_delta(_project_id_for_parent(sender, instance), feedback_answer_count=-1)
+    refresh_on_commit(test_ids=[instance.test_id])
+
+
+@receiver(post_save, sender=CategoryScore)
+def category_score_saved(sender, instance, created, **kwargs):
+    project_id = _project_id_for_parent(sender, instance)
+    old_category, old_score, old_test_id = instance._summary_state
+    if created:
+        apply_category_score_delta(project_id, instance.category, instance.score, 1)
+    elif old_category is None or old_score is None:
+        pass
+    elif old_test_id is not None and old_test_id != instance.test_id:
+        # Moved to another test, possibly of another project
+        apply_category_score_delta(_project_id_for_test(old_test_id), old_category, -old_score, -1)
+        apply_category_score_delta(project_id, instance.category, instance.score, 1)
+        refresh_on_commit(test_ids=[old_test_id])
+    elif old_category != instance.category:
+        apply_category_score_delta(project_id, old_category, -old_score, -1)
+        apply_category_score_delta(project_id, instance.category, instance.score, 1)
+    else:
+        apply_category_score_delta(project_id, instance.category, instance.score - old_score, 0)
+    instance._summary_state = (instance.category, instance.score, instance.test_id)
+    refresh_on_commit(test_ids=[instance.test_id])
+
+
+@receiver(post_delete, sender=CategoryScore)
+def category_score_deleted(sender, instance, **kwargs):
+    old_category, old_score, _ = instance._summary_state
+    apply_category_score_delta(_project_id_for_parent(sender, instance), old_category, -old_score, -1)
+    refresh_on_commit(test_ids=[instance.test_id])
+
+
+@receiver(post_save, sender=Feedback)
+def feedback_saved(sender, instance, created, **kwargs):
+    apply_summary_delta(_project_id_for_session(instance.session_id), voice_feedback_count=1 if created else 0)
+    # Moving a comment to another heatmap cell updates both cells
+    old_geohash = instance._heat_state
+    if instance.geohash != old_geohash:
+        test_id = _test_id_for_session(instance.session_id)
+        refresh_on_commit(pairs=[(test_id, old_geohash), (test_id, instance.geohash)])
+    instance._heat_state = instance.geohash
+
+
+@receiver(post_delete, sender=Feedback)
+def feedback_deleted(sender, instance, **kwargs):
+    apply_summary_delta(_project_id_for_session(instance.session_id), voice_feedback_count=-1)
+    if instance.geohash:
+        refresh_on_commit(pairs=[(_test_id_for_session(instance.session_id), instance.geohash)])
+
+
+@receiver(post_save, sender=Session)
+def session_saved(sender, instance, created, **kwargs):
+    # Re-linking a session moves its voice feedback to the new test's project
+    old_test_id = instance._summary_state
+    if not created and old_test_id != instance.test_id:
+        feedback_count = instance.feedbacks.count()
+        if feedback_count:
+            apply_summary_delta(_project_id_for_test(old_test_id), voice_feedback_count=-feedback_count)
+            apply_summary_delta(_project_id_for_test(instance.test_id), voice_feedback_count=feedback_count)
+    if not created and old_test_id != instance.test_id:
+        # The session now belongs to another project (or none), and another track;
+        # its comments leave the old vehicle's heatmap and join the new one's
+        forget_session(instance.id)
+        old_cells = list(instance.feedbacks.filter(geohash__isnull=False).values_list('geohash', flat=True))
+        align_session_feedback(instance.id)
+        new_cells = list(instance.feedbacks.filter(geohash__isnull=False).values_list('geohash', flat=True))
+        refresh_on_commit(pairs=[(old_test_id, cell) for cell in old_cells] + [(instance.test_id, cell) for cell in new_cells])
+    instance._summary_state = instance.test_id
+
+
+@receiver(post_delete, sender=Session)
+def session_deleted(sender, instance, **kwargs):
+    forget_session(instance.id)
+    # The files cannot be rolled back, so they go only once the delete is committed
+    transaction.on_commit(partial(delete_session_telemetry, instance.id))
+
+
+@receiver(post_save, sender=FeedbackQuestion)
+@receiver(post_delete, sender=FeedbackQuestion)
+def feedback_question_changed(sender, instance, **kwargs):
+    bump_questionnaire_version(instance.project_id)
+
+
+@receiver(post_save, sender=TestingBenchmarkParams)
+@receiver(post_delete, sender=TestingBenchmarkParams)
+def benchmark_params_changed(sender, instance, **kwargs):
+    project_id = FeedbackQuestion.objects.filter(id=instance.question_id).values_list('project_id', flat=True).first()
+    bump_questionnaire_version(project_id)
+
+
+# Participants and spec values are part of the tests listing but do not touch Test.updatedAt
+
+@receiver(post_save, sender=TestParticipant)
+@receiver(post_delete, sender=TestParticipant)
+@receiver(post_save, sender=TestSpecValue)
+@receiver(post_delete, sender=TestSpecValue)
+def test_listing_changed(sender, instance, **kwargs):
+    bump_tests_version(_project_id_for_test(instance.test_id))
+
+
+# Spec titles and spec values are listed with the tests of every project of their organisation
+
+@receiver(post_save, sender=Spec)
+@receiver(post_delete, sender=Spec)
+def spec_changed(sender, instance, **kwargs):
+    bump_organisation_tests_versions(instance.organisation_id)
+
+
+@receiver(post_save, sender=SpecValue)
+@receiver(post_delete, sender=SpecValue)
+def spec_value_changed(sender, instance, **kwargs):
+    organisation_id = Spec.objects.filter(id=instance.spec_id).values_list('organisation_id', flat=True).first()
+    bump_organisation_tests_versions(organisation_id)
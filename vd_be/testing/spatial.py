@@ -0,0 +1,153 @@
+import math
+from functools import reduce
+from operator import or_
+
+import numpy as np
+from django.db.models import Q
+
+from testing import geohash
+from testing.models import Feedback, Session, Test, TestGPSCoordinate, TestGPSTrack
+from testing.tracks import decode_track, to_epoch_ms
+from testing.trip_metrics import EARTH_RADIUS_M, haversine_m
+
+METRES_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+
+
+def radius_bbox(lat, lon, radius_m):
+    """(min_lon, min_lat, max_lon, max_lat) enclosing a circle, clipped to valid coordinates."""
+    dlat = radius_m / METRES_PER_DEGREE
+    dlon = dlat / max(math.cos(math.radians(min(abs(lat) + dlat, 90.0))), 1e-6)
+    return (max(lon - dlon, -180.0), max(lat - dlat, -90.0), min(lon + dlon, 180.0), min(lat + dlat, 90.0))
+
+
+def geohash_filter(bbox, field='geohash', **lookups):
+    """
+    A Q matching rows whose geohash lies in one of the cells covering the bbox.
+    Extra lookups are repeated in every range term, so that with an index on
+    (lookup column, geohash) each term is a seek per scope value and a range scan.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    ranges = geohash.cover_ranges(min_lat, min_lon, max_lat, max_lon)
+    return reduce(or_, (Q(**lookups, **{f'{field}__gte': low, f'{field}__lte': high}) for low, high in ranges))
+
+
+def _scope_tests(scope):
+    """Subquery of the ids of the tests matched by scope."""
+    return Test.objects.filter(**scope).values('id')
+
+
+def _match(lat, lon, bbox, center):
+    """
+    Exact test of candidate points, which the geohash cells only approximate: inside
+    the bbox, and within the radius when center is (lat, lon, radius_m). Returns
+    (mask, distance_m or None).
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    mask = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+    if center is None:
+        return mask, None
+    distance = haversine_m(np.full(len(lat), center[0]), np.full(len(lon), center[1]), lat, lon)
+    return mask & (distance <= center[2]), distance
+
+
+def find_feedback(scope, bbox, center=None, limit=500):
+    """
+    Voice feedback located inside the bbox (and the circle, when center is
+    (lat, lon, radius_m)) among the tests matched by scope, a dict of Test lookups.
+    Candidates come from (session, geohash) range scans over the scope's sessions and
+    are checked exactly with NumPy, so other projects' feedback in the area is never
+    read. Returns (total, results): nearest first for a circle, otherwise oldest first.
+    """
+    sessions = Session.objects.filter(test__in=_scope_tests(scope)).values('id')
+    rows = list(Feedback.objects.filter(geohash_filter(bbox, session_id__in=sessions)).values_list(
+        'id', 'session_id', 'session__test_id', 'latitude', 'longitude', 'timestamp', 'transcription_text',
+        'track_latitude', 'track_longitude', 'track_speed_kmh',
+    ))
+    if not rows:
+        return 0, []
+    # Matched on Feedback.location(): the aligned track position when there is one
+    lat = np.array([row[7] if row[7] is not None else row[3] for row in rows], dtype=np.float64)
+    lon = np.array([row[8] if row[8] is not None else row[4] for row in rows], dtype=np.float64)
+    mask, distance = _match(lat, lon, bbox, center)
+    index = np.flatnonzero(mask)
+    if distance is not None:
+        index = index[np.argsort(distance[index], kind='stable')]
+    else:
+        index = np.array(sorted(index, key=lambda i: (rows[i][5], rows[i][0])), dtype=np.int64)
+    results = []
+    for i in index[:limit].tolist():
+        (feedback_id, session_id, feedback_test_id, latitude, longitude, timestamp, transcription,
+         track_latitude, track_longitude, track_speed_kmh) = rows[i]
+        result = {
+            'id': feedback_id,
+            'session': session_id,
+            'test': feedback_test_id,
+            'latitude': latitude,
+            'longitude': longitude,
+            'timestamp': timestamp.isoformat(),
+            'transcription_text': transcription,
+            'track_latitude': track_latitude,
+            'track_longitude': track_longitude,
+            'track_speed_kmh': track_speed_kmh,
+        }
+        if distance is not None:
+            result['distance_m'] = round(float(distance[i]), 1)
+        results.append(result)
+    return len(index), results
+
+
+def find_gps_points(scope, bbox, center=None, limit=500):
+    """
+    GPS points of the tests matched by scope inside the bbox (and circle), from both
+    storage forms: TestGPSCoordinate rows through the (test, geohash) index, and packed
+    tracks whose stored bounding box intersects the query. Where a test has a
+    timestamp in both, the row wins, as in load_track. Returns (total, results):
+    nearest first for a circle, otherwise by test and time.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    test_ids, timestamps, lats, lons = [], [], [], []
+
+    packed = TestGPSTrack.objects.filter(
+        min_lat__lte=max_lat, max_lat__gte=min_lat, min_lon__lte=max_lon, max_lon__gte=min_lon,
+        **{f'test__{lookup}': value for lookup, value in scope.items()},
+    ).values_list('test_id', 'data')
+    for test_id, data in packed:
+        track = decode_track(data)
+        mask, _ = _match(track.lat, track.lon, bbox, None)
+        test_ids.append(np.full(int(mask.sum()), test_id, dtype=np.int64))
+        timestamps.append(track.timestamp_ms[mask])
+        lats.append(track.lat[mask])
+        lons.append(track.lon[mask])
+
+    rows = list(TestGPSCoordinate.objects.filter(geohash_filter(bbox, test_id__in=_scope_tests(scope))).values_list(
+        'test_id', 'timestamp', 'lat', 'lon',
+    ))
+    if rows:
+        test_ids.append(np.array([row[0] for row in rows], dtype=np.int64))
+        timestamps.append(np.array([to_epoch_ms(row[1]) for row in rows], dtype=np.int64))
+        lats.append(np.array([row[2] for row in rows], dtype=np.float64))
+        lons.append(np.array([row[3] for row in rows], dtype=np.float64))
+    if not test_ids:
+        return 0, []
+
+    test_id, timestamp = np.concatenate(test_ids), np.concatenate(timestamps)
+    lat, lon = np.concatenate(lats), np.concatenate(lons)
+    # Rows were appended last; keep the last point of every (test, timestamp)
+    order = np.lexsort((np.arange(len(test_id)), timestamp, test_id))
+    test_id, timestamp, lat, lon = test_id[order], timestamp[order], lat[order], lon[order]
+    last = np.append((test_id[1:] != test_id[:-1]) | (timestamp[1:] != timestamp[:-1]), True)
+    test_id, timestamp, lat, lon = test_id[last], timestamp[last], lat[last], lon[last]
+
+    mask, distance = _match(lat, lon, bbox, center)
+    index = np.flatnonzero(mask)
+    if distance is not None:
+        index = index[np.argsort(distance[index], kind='stable')]
+    index = index[:limit]
+    results = [
+        {'test_id': t, 'lat': a, 'lon': b, 'timestamp_ms': ts}
+        for t, a, b, ts in zip(test_id[index].tolist(), lat[index].tolist(), lon[index].tolist(), timestamp[index].tolist())
+    ]
+    if distance is not None:
+        for result, value in zip(results, distance[index].tolist()):
+            result['distance_m'] = round(value, 1)
+    return int(mask.sum()), results
@@ -0,0 +1,109 @@
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+
+from testing.models import CategoryScore, Feedback, FeedbackAnswer, ProjectSummary, Test
+
+
+def apply_summary_delta(project_id, **deltas):
+    """
+    Add the given deltas to a project's summary counters in one UPDATE, e.g.
+    apply_summary_delta(1, total_tests=1, pending_tests=1).
+
+    Only existing rows are touched; a project without a summary row gets one
+    built from scratch the first time it is read, so nothing is lost.
+    """
+    if project_id is None:
+        return
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    ProjectSummary.objects.filter(project_id=project_id).update(
+        last_activity_at=timezone.now(),
+        updatedAt=timezone.now(),
+        **updates
+    )
+
+
+def apply_category_score_delta(project_id, category, score_delta, count_delta):
+    if project_id is None:
+        return
+    with transaction.atomic():
+        summary = ProjectSummary.objects.select_for_update().filter(project_id=project_id).first()
+        if summary is None:
+            return
+        entry = summary.category_scores.get(category, {'sum': 0.0, 'count': 0})
+        # Scores have 2 decimals; rounding the running sum stops float drift accumulating
+        entry = {'sum': round(entry['sum'] + score_delta, 6), 'count': entry['count'] + count_delta}
+        if entry['count'] > 0:
+            summary.category_scores[category] = entry
+        else:
+            summary.category_scores.pop(category, None)
+        summary.last_activity_at = timezone.now()
+        summary.save(update_fields=['category_scores', 'last_activity_at', 'updatedAt'])
+
+
+def rebuild_project_summary(project_id):
+    """Recompute a project's summary row from the source tables."""
+    status_counts = {
+        field: Count('id', filter=Q(status=status))
+        for status, field in ProjectSummary.STATUS_FIELDS.items()
+    }
+    tests = Test.objects.filter(project_id=project_id).aggregate(
+        total_tests=Count('id'),
+        reviewed_tests=Count('id', filter=Q(isReviewed=True)),
+        latest=Max('updatedAt'),
+        **status_counts
+    )
+    answers = FeedbackAnswer.objects.filter(test__project_id=project_id).aggregate(
+        count=Count('id'), latest=Max('updatedAt')
+    )
+    feedbacks = Feedback.objects.filter(session__test__project_id=project_id).aggregate(
+        count=Count('id'), latest=Max('timestamp')
+    )
+    category_rows = CategoryScore.objects.filter(test__project_id=project_id).values('category').annotate(
+        total=Sum('score'), count=Count('id'), latest=Max('updatedAt')
+    )
+
+    category_scores = {}
+    activity = [tests.pop('latest'), answers['latest'], feedbacks['latest']]
+    for row in category_rows:
+        category_scores[row['category']] = {'sum': round(row['total'], 6), 'count': row['count']}
+        activity.append(row['latest'])
+    activity = [timestamp for timestamp in activity if timestamp is not None]
+
+    summary, _ = ProjectSummary.objects.update_or_create(
+        project_id=project_id,
+        defaults={
+            **tests,
+            'feedback_answer_count': answers['count'],
+            'voice_feedback_count': feedbacks['count'],
+            'category_scores': category_scores,
+            'last_activity_at': max(activity) if activity else None,
+        }
+    )
+    return summary
+
+
+def rebuild_project_summaries(project_ids):
+    for project_id in project_ids:
+        rebuild_project_summary(project_id)
+
+
+def project_summary_data(summary):
+    total = summary.total_tests
+    return {
+        'project_id': summary.project_id,
+        'total_tests': total,
+        'tests_by_status': {
+            status: getattr(summary, field) for status, field in ProjectSummary.STATUS_FIELDS.items()
+        },
+        'reviewed_tests': summary.reviewed_tests,
+        'reviewed_share': round(summary.reviewed_tests / total, 4) if total else 0.0,
+        'average_category_scores': {
+            category: round(entry['sum'] / entry['count'], 2)
+            for category, entry in sorted(summary.category_scores.items()) if entry['count']
+        },
+        'feedback_answer_count': summary.feedback_answer_count,
+        'voice_feedback_count': summary.voice_feedback_count,
+        'last_activity_at': summary.last_activity_at,
+        'updatedAt': summary.updatedAt,
+    }
@@ -0,0 +1,139 @@
+import re
+from collections import deque
+
+from django.db import transaction
+from django.db.models import Count, Max
+
+from organisation.models import Vehicle
+from testing.heatmap import refresh_feedback
+from testing.models import CategoryKeyword, FeedbackTag
+
+_WHITESPACE = re.compile(r'\s+')
+
+# organisation_id -> (fingerprint, KeywordAutomaton)
+_automata = {}
+
+
+def _normalise(text):
+    return _WHITESPACE.sub(' ', text.lower()).strip()
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a fixed vocabulary of (keyword, category) pairs.
+    Matching walks the text once, so its cost is linear in the text length no
+    matter how many keywords there are. Only whole-word matches are reported.
+    """
+
+    def __init__(self, terms):
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        for keyword, category in terms:
+            keyword = _normalise(keyword)
+            if keyword:
+                self._add(keyword, category)
+        self._build_failure_links()
+
+    def _add(self, keyword, category):
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            state = next_state
+        self.outputs[state].append((keyword, category))
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+
+    def find(self, text):
+        """Yield (keyword, category) for every whole-word occurrence in text."""
+        text = _normalise(text)
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if not self.outputs[state]:
+                continue
+            if end + 1 < len(text) and text[end + 1].isalnum():
+                continue
+            # Outputs are longest first; "noise" inside "wind noise" is not counted again
+            seen = set()
+            for keyword, category in self.outputs[state]:
+                start = end - len(keyword) + 1
+                if category in seen or (start > 0 and text[start - 1].isalnum()):
+                    continue
+                seen.add(category)
+                yield keyword, category
+
+
+def get_automaton(organisation_id):
+    """
+    Compiled automaton for an organisation's vocabulary. Rebuilt only when the
+    organisation's CategoryKeywords change (checked with one aggregate query).
+    """
+    keywords = CategoryKeyword.objects.filter(organisation_id=organisation_id)
+    stats = keywords.aggregate(count=Count('id'), latest=Max('updatedAt'))
+    fingerprint = (stats['count'], stats['latest'])
+    cached = _automata.get(organisation_id)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    automaton = KeywordAutomaton(keywords.values_list('keyword', 'category'))
+    _automata[organisation_id] = (fingerprint, automaton)
+    return automaton
+
+
+def organisation_id_for_session(session):
+    try:
+        return Vehicle.objects.filter(id=int(session.vehicle_id)).values_list('organisation_id', flat=True).first()
+    except (TypeError, ValueError):
+        return None
+
+
+def match_categories(automaton, text):
+    """Return {category: {'hits': n, 'keywords': [...]}} for a transcript."""
+    matches = {}
+    for keyword, category in automaton.find(text or ''):
+        entry = matches.setdefault(category, {'hits': 0, 'keywords': []})
+        entry['hits'] += 1
+        if keyword not in entry['keywords']:
+            entry['keywords'].append(keyword)
+    return matches
+
+
+def tag_feedback(feedback, organisation_id=None):
+    """
+    Replace the category tags of a transcribed Feedback with those found in its
+    transcription_text. Returns the list of tagged categories.
+    """
+    if organisation_id is None:
+        organisation_id = organisation_id_for_session(feedback.session)
+    if organisation_id is None:
+        return []
+
+    matches = match_categories(get_automaton(organisation_id), feedback.transcription_text)
+    with transaction.atomic():
+        FeedbackTag.objects.filter(feedback=feedback).delete()
+        FeedbackTag.objects.bulk_create([
+            FeedbackTag(feedback=feedback, category=category, hits=entry['hits'], keywords=entry['keywords'])
+            for category, entry in matches.items()
+        ])
+    # bulk_create sends no signals
+    refresh_feedback([(feedback.session.test_id, feedback.geohash)])
+    return sorted(matches)
@@ -0,0 +1,525 @@
+import csv
+import fcntl
+import json
+import os
+import re
+import shutil
+import struct
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+
+from testing.gps import (
+    EARLIEST_MS, EPOCH_MS_THRESHOLD, FUTURE_TOLERANCE_MS, GPSIngestError, float_column, iter_lines, iter_text,
+    parse_timestamp, to_float,
+)
+from testing.models import TelemetryChannel
+
+# Each channel is two files in the session's directory: <name>.dat holds the full
+# chunks back to back (zlib-compressed, delta-encoded int64 microsecond timestamps,
+# then float32 values, both with their bytes regrouped by significance), and
+# <name>.idx a header, one fixed-width INDEX_DTYPE record per chunk and the bytes of
+# the partly filled last chunk. The records are memory-mapped, so a time range is
+# located with a binary search and only the chunks it overlaps are read.
+#
+# .dat is only ever appended to and .idx only ever replaced whole (os.replace), so a
+# crash leaves the previous index and every byte it points at intact; .dat bytes past
+# the last full chunk of the index are left by an interrupted append and dropped by
+# the next one.
+CHUNK_SAMPLES = 65_536
+# Magic, record count, records whose chunk is in the .dat file (the rest is in .idx)
+INDEX_HEADER = struct.Struct('<4s4xQQ')
+INDEX_MAGIC = b'VDTI'
+
+INDEX_DTYPE = np.dtype([
+    ('start_us', '<i8'), ('end_us', '<i8'), ('count', '<i8'),
+    ('offset', '<i8'), ('time_bytes', '<i8'), ('value_bytes', '<i8'),
+    ('min', '<f8'), ('max', '<f8'), ('sum', '<f8'),
+])
+VALUE_DTYPE = np.dtype('<f4')
+COMPRESSION_LEVEL = 6
+CHANNEL_NAME = re.compile(r'^[A-Za-z][A-Za-z0-9_.-]{0,63}$')
+MAX_CHANNELS = 64
+# Rows parsed before they are converted, validated and appended as arrays
+BLOCK_ROWS = 50_000
+MAX_REPORTED_ERRORS = 50
+TIMESTAMP_COLUMNS = ('timestamp', 'time', 'ts')
+CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'application/x-jsonlines': 'ndjson',
+}
+
+
+class TelemetryError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def session_directory(session_id):
+    return os.path.join(settings.TELEMETRY_ROOT, f'session_{int(session_id)}')
+
+
+def _paths(session_id, name):
+    directory = session_directory(session_id)
+    return os.path.join(directory, f'{name}.idx'), os.path.join(directory, f'{name}.dat')
+
+
+@contextmanager
+def _locked(session_id, exclusive):
+    """A per-session flock: appends are exclusive, reads shared, across processes."""
+    directory = session_directory(session_id)
+    if exclusive:
+        os.makedirs(directory, exist_ok=True)
+    elif not os.path.isdir(directory):
+        yield
+        return
+    with open(os.path.join(directory, '.lock'), 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _planes(array):
+    """Bytes of a 1-d array regrouped by significance: all first bytes, then all second bytes, ..."""
+    width = array.dtype.itemsize
+    return np.ascontiguousarray(array.view(np.uint8).reshape(len(array), width).T).tobytes()
+
+
+def _unplanes(data, dtype, count):
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, count)
+    return np.ascontiguousarray(planes.T).view(dtype).ravel()
+
+
+def encode_chunk(timestamp_us, values):
+    """(time bytes, value bytes) of a chunk of sorted samples."""
+    deltas = np.diff(timestamp_us, prepend=np.int64(0)).astype('<i8')
+    return (
+        zlib.compress(_planes(deltas), COMPRESSION_LEVEL),
+        zlib.compress(_planes(values.astype(VALUE_DTYPE)), COMPRESSION_LEVEL),
+    )
+
+
+def decode_chunk(data, record):
+    """(timestamp_us, values) of the chunk an index record points at, from the mapped data file."""
+    start = int(record['offset'])
+    middle = start + int(record['time_bytes'])
+    end = middle + int(record['value_bytes'])
+    count = int(record['count'])
+    deltas = _unplanes(zlib.decompress(data[start:middle]), np.dtype('<i8'), count)
+    values = _unplanes(zlib.decompress(data[middle:end]), VALUE_DTYPE, count)
+    return np.cumsum(deltas), values
+
+
+def _read_index(index_path):
+    """(records, data_chunks) of an index file, the records memory-mapped; no records if missing."""
+    try:
+        with open(index_path, 'rb') as handle:
+            magic, count, data_chunks = INDEX_HEADER.unpack(handle.read(INDEX_HEADER.size))
+    except (FileNotFoundError, struct.error):
+        return np.empty(0, dtype=INDEX_DTYPE), 0
+    if magic != INDEX_MAGIC:
+        raise ValueError(f'{index_path} is not a telemetry index')
+    if not count:
+        return np.empty(0, dtype=INDEX_DTYPE), 0
+    return np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', offset=INDEX_HEADER.size, shape=(count,)), data_chunks
+
+
+def _write_index(index_path, records, data_chunks, tail):
+    temporary = index_path + '.tmp'
+    with open(temporary, 'wb') as handle:
+        handle.write(INDEX_HEADER.pack(INDEX_MAGIC, len(records), data_chunks))
+        handle.write(records.tobytes())
+        handle.write(tail)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, index_path)
+
+
+def _chunk_record(timestamp_us, values, offset, time_bytes, value_bytes):
+    record = np.zeros(1, dtype=INDEX_DTYPE)
+    record[0] = (
+        timestamp_us[0], timestamp_us[-1], len(timestamp_us), offset, time_bytes, value_bytes,
+        float(values.min()), float(values.max()), float(values.astype(np.float64).sum()),
+    )
+    return record
+
+
+def _append_locked(session_id, name, timestamp_us, values):
+    index_path, data_path = _paths(session_id, name)
+    index, data_chunks = _read_index(index_path)
+    index = np.array(index)
+    if len(index):
+        new = timestamp_us > index['end_us'][-1]
+        timestamp_us, values = timestamp_us[new], values[new]
+    appended = len(timestamp_us)
+    if not appended:
+        return 0, index
+
+    values = values.astype(VALUE_DTYPE)
+    if data_chunks < len(index):
+        # The partly filled last chunk is merged with the new samples
+        with open(index_path, 'rb') as handle:
+            tail_times, tail_values = decode_chunk(handle.read(), index[-1])
+        timestamp_us = np.concatenate([tail_times, timestamp_us])
+        values = np.concatenate([tail_values, values])
+        index = index[:data_chunks]
+
+    records = [index]
+    full = len(timestamp_us) // CHUNK_SAMPLES * CHUNK_SAMPLES
+    with open(data_path, 'a+b') as data_file:
+        # Bytes past the last chunk of the index are from an append that did not complete
+        offset = int(index['offset'][-1] + index['time_bytes'][-1] + index['value_bytes'][-1]) if len(index) else 0
+        data_file.truncate(offset)
+        for start in range(0, full, CHUNK_SAMPLES):
+            chunk_times = timestamp_us[start:start + CHUNK_SAMPLES]
+            chunk_values = values[start:start + CHUNK_SAMPLES]
+            time_bytes, value_bytes = encode_chunk(chunk_times, chunk_values)
+            data_file.write(time_bytes)
+            data_file.write(value_bytes)
+            records.append(_chunk_record(chunk_times, chunk_values, offset, len(time_bytes), len(value_bytes)))
+            offset += len(time_bytes) + len(value_bytes)
+        data_file.flush()
+        os.fsync(data_file.fileno())
+
+    # The index is replaced only once the chunks it points at are on disk
+    data_chunks = len(index) + full // CHUNK_SAMPLES
+    tail = b''
+    if full < len(timestamp_us):
+        time_bytes, value_bytes = encode_chunk(timestamp_us[full:], values[full:])
+        offset = INDEX_HEADER.size + (data_chunks + 1) * INDEX_DTYPE.itemsize
+        records.append(_chunk_record(timestamp_us[full:], values[full:], offset, len(time_bytes), len(value_bytes)))
+        tail = time_bytes + value_bytes
+    index = np.concatenate(records)
+    _write_index(index_path, index, data_chunks, tail)
+    return appended, index
+
+
+def _datetime_us(value):
+    return datetime.fromtimestamp(int(value) / 1_000_000, tz=dt_timezone.utc)
+
+
+def _update_catalogue(session_id, name, index):
+    data_bytes = int((index['time_bytes'] + index['value_bytes']).sum())
+    TelemetryChannel.objects.update_or_create(
+        session_id=session_id,
+        name=name,
+        defaults={
+            'sample_count': int(index['count'].sum()),
+            'chunk_count': len(index),
+            'stored_bytes': data_bytes + index.nbytes,
+            'start_time': _datetime_us(index['start_us'][0]),
+            'end_time': _datetime_us(index['end_us'][-1]),
+            'min_value': float(index['min'].min()),
+            'max_value': float(index['max'].max()),
+        },
+    )
+
+
+def append_samples(session_id, name, timestamp_us, values):
+    """
+    Append time-sorted samples with unique timestamps to a channel. Channels are
+    append-only: samples at or before the last stored timestamp are skipped, so
+    re-sending data is harmless. Returns (appended, already_stored).
+    """
+    with _locked(session_id, exclusive=True):
+        appended, index = _append_locked(session_id, name, timestamp_us, values)
+    if appended:
+        _update_catalogue(session_id, name, index)
+    return appended, len(timestamp_us) - appended
+
+
+def _overlapping(index, start_us, end_us):
+    """Slice of the index records whose chunks overlap [start_us, end_us]."""
+    first = int(np.searchsorted(index['end_us'], start_us, side='left'))
+    last = int(np.searchsorted(index['start_us'], end_us, side='right'))
+    return slice(first, max(first, last))
+
+
+@contextmanager
+def open_channel(session_id, name):
+    """
+    (index, read_chunk) of a channel under a shared lock, or None if it is missing.
+    index is the memory-mapped records; read_chunk(position) decodes one chunk from
+    the memory-mapped file that holds it.
+    """
+    with _locked(session_id, exclusive=False):
+        index_path, data_path = _paths(session_id, name)
+        index, data_chunks = _read_index(index_path)
+        if not len(index):
+            yield None
+            return
+        data = np.memmap(data_path, dtype=np.uint8, mode='r') if data_chunks else None
+        tail = np.memmap(index_path, dtype=np.uint8, mode='r') if data_chunks < len(index) else None
+
+        def read_chunk(position):
+            return decode_chunk(data if position < data_chunks else tail, index[position])
+        yield index, read_chunk
+
+
+def iter_range(index, read_chunk, start_us, end_us):
+    """Yield (timestamp_us, values) for each chunk overlapping the range, trimmed to it."""
+    overlapping = _overlapping(index, start_us, end_us)
+    for position in range(overlapping.start, overlapping.stop):
+        record = index[position]
+        timestamp_us, values = read_chunk(position)
+        if record['start_us'] < start_us or record['end_us'] > end_us:
+            keep = slice(
+                int(np.searchsorted(timestamp_us, start_us, side='left')),
+                int(np.searchsorted(timestamp_us, end_us, side='right')),
+            )
+            timestamp_us, values = timestamp_us[keep], values[keep]
+        yield timestamp_us, values
+
+
+def query_channel(session_id, name, start_us=None, end_us=None, max_points=2000):
+    """
+    Samples of a channel between start_us and end_us (inclusive, default: all). Up to
+    max_points samples are returned as they are; longer ranges are decimated into
+    max_points equal time buckets with min, max, mean and count, which keeps spikes
+    visible. Chunks are decoded one at a time and folded into the buckets, so memory
+    does not grow with the range. Returns None for an unknown channel.
+    """
+    if not _valid_name(name):
+        return None
+    with open_channel(session_id, name) as channel:
+        if channel is None:
+            return None
+        index, read_chunk = channel
+        start_us = int(index['start_us'][0]) if start_us is None else start_us
+        end_us = int(index['end_us'][-1]) if end_us is None else end_us
+        overlapping = _overlapping(index, start_us, end_us)
+        chunks_read = overlapping.stop - overlapping.start
+
+        buckets = max_points
+        width = max((end_us - start_us + 1) / buckets, 1.0)
+        low = np.full(buckets, np.inf)
+        high = np.full(buckets, -np.inf)
+        total = np.zeros(buckets)
+        counts = np.zeros(buckets, dtype=np.int64)
+        raw_times, raw_values, sample_count = [], [], 0
+        for timestamp_us, values in iter_range(index, read_chunk, start_us, end_us):
+            if not len(timestamp_us):
+                continue
+            sample_count += len(timestamp_us)
+            if sample_count <= max_points:
+                raw_times.append(timestamp_us)
+                raw_values.append(values)
+            bucket = np.minimum(((timestamp_us - start_us) / width).astype(np.int64), buckets - 1)
+            # Timestamps are sorted, so each bucket is one contiguous run of the chunk
+            starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+            ids = bucket[starts]
+            values = values.astype(np.float64)
+            low[ids] = np.minimum(low[ids], np.minimum.reduceat(values, starts))
+            high[ids] = np.maximum(high[ids], np.maximum.reduceat(values, starts))
+            total[ids] += np.add.reduceat(values, starts)
+            counts[ids] += np.diff(np.append(starts, len(values)))
+
+    result = {
+        'start_ms': start_us / 1000.0,
+        'end_ms': end_us / 1000.0,
+        'sample_count': sample_count,
+        'chunks_read': chunks_read,
+        'chunks_total': len(index),
+    }
+    if sample_count <= max_points:
+        timestamp_us = np.concatenate(raw_times) if raw_times else np.empty(0, dtype=np.int64)
+        values = np.concatenate(raw_values) if raw_values else np.empty(0, dtype=VALUE_DTYPE)
+        return {
+            **result,
+            'decimated': False,
+            'timestamp_ms': (timestamp_us / 1000.0).tolist(),
+            'values': values.astype(np.float64).tolist(),
+        }
+    filled = np.flatnonzero(counts)
+    return {
+        **result,
+        'decimated': True,
+        'bucket_ms': width / 1000.0,
+        'timestamp_ms': ((start_us + filled * width) / 1000.0).tolist(),
+        'min': low[filled].tolist(),
+        'max': high[filled].tolist(),
+        'mean': (total[filled] / counts[filled]).tolist(),
+        'count': counts[filled].tolist(),
+    }
+
+
+def delete_session_telemetry(session_id):
+    shutil.rmtree(session_directory(session_id), ignore_errors=True)
+
+
+def _csv_block(header, stamp_column, cells, numbers):
+    # Rows are collected as one flat list of cells, which one array call turns into a
+    # table; object dtype keeps the strings as they are, which converts faster to float
+    table = np.asarray(cells, dtype=object).reshape(len(numbers), len(header))
+    channels = {}
+    for index, name in enumerate(header):
+        if index != stamp_column:
+            raw = table[:, index]
+            present = np.flatnonzero(raw != '')
+            channels[name] = (present, raw[present])
+    return np.asarray(numbers, dtype=np.int64), table[:, stamp_column].tolist(), channels
+
+
+def _ndjson_block(records, numbers):
+    stamps, channels = [], {}
+    for position, record in enumerate(records):
+        stamps.append(next((record.pop(key) for key in TIMESTAMP_COLUMNS if key in record), None))
+        for name, value in record.items():
+            if value is not None:
+                column = channels.setdefault(name, ([], []))
+                column[0].append(position)
+                column[1].append(value)
+    return np.asarray(numbers, dtype=np.int64), stamps, {
+        name: (np.asarray(positions, dtype=np.int64), np.asarray(values, dtype=object))
+        for name, (positions, values) in channels.items()
+    }
+
+
+def _iter_blocks(stream, content_type):
+    """
+    Yield the records of a wide CSV (a header row with a timestamp column and one
+    column per channel) or an NDJSON stream of objects in column-wise blocks of up to
+    BLOCK_ROWS: (row numbers, timestamps, {channel: (positions in the block, raw
+    values)}, malformed row numbers). Empty cells and null or absent keys are missing
+    samples. The generator returns the number of records read.
+    """
+    kind = CONTENT_TYPES.get(content_type)
+    if kind is None:
+        raise TelemetryError(
+            f'Unsupported content type; use one of {", ".join(sorted(CONTENT_TYPES))}', status=415
+        )
+    lines = iter_lines(iter_text(stream))
+    records, numbers, malformed, received = [], [], [], 0
+
+    if kind == 'ndjson':
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                records.append(record)
+                numbers.append(received)
+            else:
+                malformed.append(received)
+            received += 1
+            if len(records) == BLOCK_ROWS:
+                yield (*_ndjson_block(records, numbers), malformed)
+                records, numbers, malformed = [], [], []
+        if records or malformed:
+            yield (*_ndjson_block(records, numbers), malformed)
+        return received
+
+    header, cells = None, []
+    for row in csv.reader(lines):
+        if not row:
+            continue
+        if header is None:
+            header = [cell.strip() for cell in row]
+            lowered = [name.lower() for name in header]
+            stamp_column = next((lowered.index(key) for key in TIMESTAMP_COLUMNS if key in lowered), None)
+            if stamp_column is None or len(header) < 2:
+                raise TelemetryError('CSV header must name a timestamp column and at least one channel')
+            continue
+        if len(row) == len(header):
+            cells.extend(row)
+            numbers.append(received)
+        else:
+            malformed.append(received)
+        received += 1
+        if len(numbers) == BLOCK_ROWS:
+            yield (*_csv_block(header, stamp_column, cells, numbers), malformed)
+            cells, numbers, malformed = [], [], []
+    if cells or malformed:
+        yield (*_csv_block(header, stamp_column, cells, numbers), malformed)
+    return received
+
+
+def _valid_name(name):
+    return isinstance(name, str) and CHANNEL_NAME.match(name) is not None and name.lower() not in TIMESTAMP_COLUMNS
+
+
+def ingest_telemetry(stream, content_type, session_id):
+    """
+    Parse and append a telemetry upload for a session. The body is read incrementally
+    and appended every BLOCK_ROWS records, so an upload of any length holds one block
+    in memory. Per channel, each block is validated, sorted and de-duplicated (the last
+    sample for a timestamp wins) as arrays, then appended with append_samples.
+    Timestamps are epoch seconds, epoch milliseconds or ISO 8601 and are stored in
+    microseconds. Raises TelemetryError.
+
+    Returns a report of counts and timings.
+    """
+    started = time.perf_counter()
+    now_ms = time.time() * 1000.0
+    known = set(TelemetryChannel.objects.filter(session_id=session_id).values_list('name', flat=True))
+    report = {'received': 0, 'appended': 0, 'rejected': 0, 'already_stored': 0, 'channels': {}, 'errors': []}
+
+    def reject(rows, error):
+        report['rejected'] += len(rows)
+        for row in rows[:MAX_REPORTED_ERRORS - len(report['errors'])]:
+            report['errors'].append({'row': row, 'error': error})
+
+    def append_block(numbers, stamps, channels):
+        stamps = float_column(stamps, parse_timestamp)
+        stamps = np.where(np.abs(stamps) < EPOCH_MS_THRESHOLD, stamps * 1000.0, stamps)
+        valid_time = np.isfinite(stamps) & (stamps >= EARLIEST_MS) & (stamps <= now_ms + FUTURE_TOLERANCE_MS)
+        reject(numbers[~valid_time].tolist(), 'timestamp must be an epoch number or ISO 8601 string after 2000')
+        timestamp_us = np.where(valid_time, np.rint(stamps * 1000.0), 0).astype(np.int64)
+
+        for name, (positions, raw) in channels.items():
+            keep = valid_time[positions]
+            positions, raw = positions[keep], raw[keep]
+            if not len(positions):
+                continue
+            if not _valid_name(name):
+                reject(numbers[positions].tolist(), f'Invalid channel name {name!r}')
+                continue
+            if name not in known:
+                if len(known) >= MAX_CHANNELS:
+                    raise TelemetryError(f'At most {MAX_CHANNELS} channels per session')
+                known.add(name)
+            values = float_column(raw, to_float)
+            finite = np.isfinite(values)
+            reject(numbers[positions[~finite]].tolist(), f'{name} must be a number')
+            times, values = timestamp_us[positions[finite]], values[finite]
+            # Sorted by time, keeping the last sample uploaded for each timestamp
+            order = np.lexsort((np.arange(len(times)), times))
+            times, values = times[order], values[order]
+            last = np.append(times[1:] != times[:-1], True)
+            appended, already = append_samples(session_id, name, times[last], values[last])
+            channel = report['channels'].setdefault(name, {'appended': 0, 'already_stored': 0, 'duplicates': 0})
+            channel['appended'] += appended
+            channel['already_stored'] += already
+            channel['duplicates'] += int(len(times) - np.count_nonzero(last))
+            report['appended'] += appended
+            report['already_stored'] += already
+
+    try:
+        blocks = _iter_blocks(stream, content_type)
+        while True:
+            try:
+                numbers, stamps, channels, malformed = next(blocks)
+            except StopIteration as end:
+                report['received'] = end.value or 0
+                break
+            reject(malformed, 'Malformed record')
+            append_block(numbers, stamps, channels)
+    except GPSIngestError as e:
+        raise TelemetryError(str(e), e.status)
+
+    elapsed = time.perf_counter() - started
+    report['elapsed_ms'] = round(elapsed * 1000, 1)
+    report['samples_per_second'] = round(report['appended'] / elapsed) if elapsed > 0 else None
+    return report
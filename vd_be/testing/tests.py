@@ -1,3 +1,1067 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from organisation.membership import get_project_roles
+from organisation.models import Organisation, Project, ProjectEmployee, Spec, SpecValue, User, Vehicle
+from organisation.tests import ProjectFixtureTestCase, auth_cookie
+from testing.access import project_for_test
+from testing.geohash import encode_point
+from testing.models import CategoryKeyword, CategoryScore, Feedback, FeedbackAnswer, FeedbackQuestion, FeedbackTag, IdempotencyKey, ProjectSummary, ProjectTestsVersion, QuestionnaireBundle, Session, Test, TestGPSCoordinate, TestGPSTrack, TestingBenchmarkParams, TestParticipant, TestSpecValue
+from testing.gps import store_session_points
+from testing.heatmap import refresh_tests
+from testing.idempotency import request_fingerprint
+from testing.live import hub as live_hub, session_telemetry
+from testing.scoring import recompute_category_scores_for_tests
+from testing.serializers import TestSerializer
+from testing.summary import project_summary_data, rebuild_project_summary
+from testing.tagging import tag_feedback
+from testing.telemetry import CHUNK_SAMPLES, append_samples, query_channel
+from testing.tracks import Track, decode_track, encode_track, from_epoch_ms, load_track
+from testing.views import calculate_category_scores
+
+
+class ProjectTestsListingTests(ProjectFixtureTestCase):
+    # ETag fingerprint, tests, spec value links, participants, spec values, specs
+    # (the membership check is served from cache after the first request)
+    EXPECTED_QUERIES = 6
+
+    def setUp(self):
+        super().setUp()
+        tyre = Spec.objects.create(organisation=self.organisation, category='tyre', title='Tyre')
+        brakes = Spec.objects.create(organisation=self.organisation, category='brakes', title='Brakes')
+        self.spec_values = [SpecValue.objects.create(spec=spec, value=f'{spec.title} {i}')
+                            for spec in (tyre, brakes) for i in range(3)]
+
+    def create_tests(self, count):
+        for i in range(count):
+            test = Test.objects.create(project=self.project, notes='')
+            TestParticipant.objects.create(test=test, user=self.user, role='driver')
+            for spec_value in self.spec_values[i % 2::2]:
+                TestSpecValue.objects.create(test=test, spec=spec_value, isTestingParam=True)
+
+    def get_tests(self):
+        return self.client.get(f'/project/{self.project.id}/tests/')
+
+    def test_query_count_does_not_grow_with_project_size(self):
+        self.create_tests(2)
+        self.get_tests()
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            self.get_tests()
+
+        self.create_tests(25)
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            response = self.get_tests()
+        self.assertEqual(len(response.json()['tests']), 27)
+
+    def test_payload_lists_each_spec_and_spec_value_once(self):
+        self.create_tests(10)
+        data = self.get_tests().json()
+
+        self.assertEqual(len(data['spec_values']), len(self.spec_values))
+        self.assertEqual(len(data['specs']), 2)
+        spec_value_ids = {spec_value['id'] for spec_value in data['spec_values']}
+        for test in data['tests']:
+            self.assertNotIn('test', test['spec_values'][0])
+            self.assertTrue({link['spec_value'] for link in test['spec_values']} <= spec_value_ids)
+            self.assertEqual(test['participants'][0]['user'], self.user.id)
+
+    def test_timestamps_are_rendered_like_the_serializers(self):
+        self.create_tests(2)
+        test = Test.objects.get(id=self.get_tests().json()['tests'][0]['id'])
+        expected = TestSerializer(test).data
+        for params in ({}, {'limit': 1}):
+            data = self.client.get(f'/project/{self.project.id}/tests/', params).json()
+            self.assertEqual(
+                {name: data['tests'][0][name] for name in ('createdAt', 'updatedAt')},
+                {name: expected[name] for name in ('createdAt', 'updatedAt')},
+            )
+            self.assertRegex(data['tests'][0]['participants'][0]['createdAt'], r'\.\d{6}Z$')
+            self.assertRegex(data['spec_values'][0]['updatedAt'], r'\.\d{6}Z$')
+            self.assertRegex(data['specs'][0]['createdAt'], r'\.\d{6}Z$')
+
+    def test_keyset_pagination_returns_every_test_once(self):
+        self.create_tests(12)
+        seen = []
+        cursor = ''
+        while True:
+            data = self.client.get(f'/project/{self.project.id}/tests/', {'limit': 5, 'cursor': cursor}).json()
+            seen.extend(test['id'] for test in data['tests'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 12)
+        self.assertEqual(set(seen), set(Test.objects.values_list('id', flat=True)))
+
+    def test_filters_and_invalid_parameters(self):
+        self.create_tests(4)
+        Test.objects.filter(id=Test.objects.first().id).update(status='completed', isReviewed=True)
+
+        data = self.client.get(f'/project/{self.project.id}/tests/', {'status': 'completed', 'isReviewed': 'true'}).json()
+        self.assertEqual(len(data['tests']), 1)
+        data = self.client.get(f'/project/{self.project.id}/tests/', {'participant': self.user.id + 1}).json()
+        self.assertEqual(data['tests'], [])
+
+        self.assertEqual(self.client.get(f'/project/{self.project.id}/tests/', {'status': 'unknown'}).status_code, 400)
+        self.assertEqual(self.client.get(f'/project/{self.project.id}/tests/', {'cursor': 'garbage'}).status_code, 400)
+
+    def test_sparse_fieldset_skips_unrequested_relations(self):
+        self.create_tests(3)
+        self.get_tests()
+        with self.assertNumQueries(3):
+            data = self.client.get(f'/project/{self.project.id}/tests/', {'fields': 'status', 'include': 'participants'}).json()
+        self.assertEqual(set(data), {'tests'})
+        self.assertEqual(set(data['tests'][0]), {'id', 'status', 'participants'})
+
+        self.assertEqual(self.client.get(f'/project/{self.project.id}/tests/', {'fields': 'secret'}).status_code, 400)
+        self.assertEqual(self.client.get(f'/project/{self.project.id}/tests/', {'include': 'sessions'}).status_code, 400)
+
+    def test_unchanged_listing_returns_304_after_one_query(self):
+        self.create_tests(3)
+        etag = self.get_tests()['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/project/{self.project.id}/tests/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        TestParticipant.objects.create(test=Test.objects.first(), user=self.user, role='passenger')
+        response = self.client.get(f'/project/{self.project.id}/tests/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_spec_edits_and_deletions_change_the_fingerprint(self):
+        self.create_tests(3)
+        url = f'/project/{self.project.id}/tests/'
+        etag = self.get_tests()['ETag']
+        self.spec_values[0].value = 'Tyre renamed'
+        self.spec_values[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Tyre renamed', [row['value'] for row in response.json()['spec_values']])
+
+        # Last-Modified has whole seconds: age the listing so the delete is strictly later
+        bare = Test.objects.create(project=self.project, notes='')
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Test.objects.update(updatedAt=an_hour_ago)
+        ProjectTestsVersion.objects.update(updatedAt=an_hour_ago)
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # A deleted test leaves no updatedAt behind; the listing must not look unchanged
+        Test.delete(bare.id)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['tests']), 3)
+
+
+class CreateTestViewTests(ProjectFixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        # Two members of the project and one outsider
+        self.users = [
+            self.user, self.add_member('user1'), User.objects.create(username='user2', organisation=self.organisation)
+        ]
+        spec = Spec.objects.create(organisation=self.organisation, category='tyre', title='Tyre')
+        self.spec_values = [SpecValue.objects.create(spec=spec, value=f'Tyre {i}') for i in range(30)]
+
+    def post_test(self, users, spec_values):
+        body = {
+            'participants': [{'user': user.id, 'role': 'driver'} for user in users],
+            'spec_values': [{'spec': spec_value.id, 'isTestingParam': True} for spec_value in spec_values],
+        }
+        return self.client.post(f'/project/{self.project.id}/test/', json.dumps(body), content_type='application/json')
+
+    def test_query_count_does_not_grow_with_list_sizes(self):
+        # Both requests check membership from the cache
+        get_project_roles(self.users[0].id)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.post_test(self.users[:1], self.spec_values[:2]).status_code, 201)
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = self.post_test(self.users[:2], self.spec_values)
+        self.assertEqual(response.status_code, 201)
+        test_id = response.json()['id']
+        self.assertEqual(TestSpecValue.objects.filter(test_id=test_id).count(), 30)
+        self.assertEqual(TestParticipant.objects.filter(test_id=test_id).count(), 2)
+
+    def test_invalid_payload_creates_nothing(self):
+        self.assertEqual(self.post_test(self.users, self.spec_values[:2]).status_code, 403)
+        missing = SpecValue(id=self.spec_values[-1].id + 1)
+        self.assertEqual(self.post_test(self.users[:1], [self.spec_values[0], missing]).status_code, 400)
+        self.assertFalse(Test.objects.exists())
+        self.assertFalse(TestParticipant.objects.exists())
+
+    def test_batch_creation_applies_overrides_and_clones(self):
+        base = self.spec_values[0]
+        body = {
+            'template': {
+                'participants': [{'user': self.users[0].id, 'role': 'driver'}],
+                'spec_values': [{'spec': base.id, 'isTestingParam': True}],
+            },
+            'tests': [{'spec_values': [{'spec': spec_value.id, 'isTestingParam': True}]} for spec_value in self.spec_values[1:21]],
+        }
+        response = self.client.post(f'/project/{self.project.id}/tests/batch/', json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        ids = response.json()['ids']
+        self.assertEqual(len(ids), 20)
+        # Each override replaces the template's tyre spec value
+        self.assertEqual(list(TestSpecValue.objects.filter(test_id=ids[4]).values_list('spec_id', flat=True)), [self.spec_values[5].id])
+        self.assertEqual(TestParticipant.objects.filter(test_id__in=ids, user=self.users[0]).count(), 20)
+
+        body = {'clone_from': ids[4], 'tests': [{}, {}]}
+        response = self.client.post(f'/project/{self.project.id}/tests/batch/', json.dumps(body), content_type='application/json')
+        clone_id = response.json()['ids'][0]
+        self.assertEqual(list(TestSpecValue.objects.filter(test_id=clone_id).values_list('spec_id', flat=True)), [self.spec_values[5].id])
+
+
+class BatchUpdateTestsViewTests(ProjectFixtureTestCase):
+    ROLE = 'manager'
+
+    def setUp(self):
+        super().setUp()
+        spec = Spec.objects.create(organisation=self.organisation, category='tyre', title='Tyre')
+        self.old, self.new = [SpecValue.objects.create(spec=spec, value=f'Tyre {i}') for i in range(2)]
+
+    def create_tests(self, count):
+        tests = [Test.objects.create(project=self.project, notes='') for _ in range(count)]
+        for test in tests:
+            TestSpecValue.objects.create(test=test, spec=self.old, isTestingParam=True)
+        return tests
+
+    def post_operations(self, operations, **options):
+        body = json.dumps({'operations': operations, **options})
+        return self.client.post('/tests/batch-update/', body, content_type='application/json')
+
+    def operations(self, tests):
+        return (
+            [{'type': 'status', 'test': test.id, 'status': 'completed'} for test in tests]
+            + [{'type': 'review', 'test': test.id, 'isReviewed': True} for test in tests]
+            + [{'type': 'spec', 'test': test.id, 'old_spec_id': self.old.id, 'new_spec_id': self.new.id,
+                'isTestingParam': True} for test in tests]
+        )
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        operations = self.operations(self.create_tests(2))
+        get_project_roles(self.user.id)
+        with CaptureQueriesContext(connection) as small:
+            self.post_operations(operations)
+        tests = self.create_tests(40)
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = self.post_operations(self.operations(tests))
+        self.assertEqual(response.json()['succeeded'], 120)
+        self.assertEqual(Test.objects.filter(status='completed', isReviewed=True).count(), 42)
+        self.assertEqual(TestSpecValue.objects.filter(spec=self.new).count(), 42)
+
+    def test_invalid_operations_are_reported_per_item(self):
+        test = self.create_tests(1)[0]
+        operations = [
+            {'type': 'status', 'test': test.id, 'status': 'completed'},
+            {'type': 'status', 'test': test.id + 1, 'status': 'completed'},
+            {'type': 'status', 'test': test.id, 'status': 'unknown'},
+        ]
+        response = self.post_operations(operations, all_or_nothing=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['ok'] for result in response.json()['results']], [True, False, False])
+        self.assertEqual(Test.objects.get(id=test.id).status, 'pending')
+
+        response = self.post_operations(operations)
+        self.assertEqual(response.json()['succeeded'], 1)
+        self.assertEqual(Test.objects.get(id=test.id).status, 'completed')
+
+    def test_corrected_operation_after_an_invalid_one_is_applied(self):
+        test = self.create_tests(1)[0]
+        response = self.post_operations([
+            {'type': 'spec', 'test': test.id, 'old_spec_id': self.old.id, 'new_spec_id': self.new.id + 100},
+            {'type': 'spec', 'test': test.id, 'old_spec_id': self.old.id, 'new_spec_id': self.new.id},
+        ])
+        self.assertEqual([result['ok'] for result in response.json()['results']], [False, True])
+        self.assertEqual(list(TestSpecValue.objects.filter(test=test).values_list('spec_id', flat=True)), [self.new.id])
+
+    def test_swaps_never_link_a_spec_value_twice(self):
+        test = self.create_tests(1)[0]
+        third = SpecValue.objects.create(spec=self.old.spec, value='Tyre 2')
+        TestSpecValue.objects.create(test=test, spec=third)
+        response = self.post_operations([
+            {'type': 'spec', 'test': test.id, 'old_spec_id': self.old.id, 'new_spec_id': third.id},
+        ])
+        self.assertIn('already uses', response.json()['results'][0]['error'])
+
+        TestSpecValue.objects.filter(test=test, spec=third).update(spec=self.new)
+        TestSpecValue.objects.create(test=test, spec=third)
+        response = self.post_operations([
+            {'type': 'spec', 'test': test.id, 'old_spec_id': self.old.id, 'new_spec_id': self.new.id + 100},
+            {'type': 'spec', 'test': test.id, 'old_spec_id': self.old.id, 'new_spec_id': self.new.id},
+        ])
+        self.assertEqual([result['ok'] for result in response.json()['results']], [False, False])
+        self.assertEqual(TestSpecValue.objects.filter(test=test).count(), 3)
+
+    def test_summary_follows_status_changes_from_unknown_statuses(self):
+        tests = self.create_tests(3)
+        Test.objects.filter(id=tests[0].id).update(status='archived')
+        rebuild_project_summary(self.project.id)
+        response = self.post_operations([
+            {'type': 'status', 'test': test.id, 'status': 'completed'} for test in tests
+        ] + [{'type': 'review', 'test': tests[1].id, 'isReviewed': True}])
+        self.assertEqual(response.json()['succeeded'], 4)
+        summary = ProjectSummary.objects.get(project=self.project)
+        self.assertEqual(
+            project_summary_data(summary)['tests_by_status'],
+            project_summary_data(rebuild_project_summary(self.project.id))['tests_by_status'],
+        )
+        self.assertEqual((summary.completed_tests, summary.pending_tests, summary.reviewed_tests), (3, 0, 1))
+
+
+class ProjectAccessTests(ProjectFixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = self.create_project('P2')
+        self.test = Test.objects.create(project=self.project, notes='')
+        self.foreign_test = Test.objects.create(project=self.other, notes='')
+
+    def test_other_projects_are_forbidden(self):
+        self.assertEqual(self.client.get(f'/project/{self.other.id}/tests/').status_code, 403)
+        self.assertEqual(self.client.get(f'/test/{self.foreign_test.id}/category-scores/').status_code, 403)
+        response = self.client.patch(
+            f'/test/{self.foreign_test.id}/status/', json.dumps({'status': 'completed'}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Test.objects.get(id=self.foreign_test.id).status, 'pending')
+
+        session = Session.objects.create(test=self.foreign_test, driver_id=str(self.user.id), vehicle_id='1')
+        self.assertEqual(self.client.get(f'/sessions/{session.id}/').status_code, 403)
+        own = Session.objects.create(driver_id=str(self.user.id), vehicle_id='1')
+        response = self.client.patch(
+            f'/sessions/{own.id}/', json.dumps({'test_id': self.foreign_test.id}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 403)
+
+        body = json.dumps({'operations': [{'type': 'review', 'test': self.foreign_test.id, 'isReviewed': True}]})
+        response = self.client.post('/tests/batch-update/', body, content_type='application/json')
+        self.assertFalse(response.json()['results'][0]['ok'])
+
+    def test_vehicle_spec_impact_covers_own_projects_of_own_organisation(self):
+        vehicle_id = self.project.vehicle_id
+        data = self.client.get(f'/vehicle/{vehicle_id}/spec-impact/').json()
+        self.assertEqual(data['project_ids'], [self.project.id])
+
+        stranger = Organisation.objects.create(name='Other org')
+        outsider = User.objects.create(username='outsider', organisation=stranger)
+        self.client.cookies['jwt'] = auth_cookie(outsider)
+        self.assertEqual(self.client.get(f'/vehicle/{vehicle_id}/spec-impact/').status_code, 404)
+
+    def test_warm_check_runs_no_queries(self):
+        self.client.get(f'/test/{self.test.id}/category-scores/')
+        with CaptureQueriesContext(connection) as warm:
+            self.assertEqual(self.client.get(f'/test/{self.test.id}/category-scores/').status_code, 200)
+        self.assertFalse(any('organisation_projectemployee' in query['sql'] for query in warm.captured_queries))
+
+        ProjectEmployee.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get(f'/test/{self.test.id}/category-scores/').status_code, 403)
+
+
+
+class SpecImpactAnalysisTests(ProjectFixtureTestCase):
+    ROLE = 'manager'
+
+    def setUp(self):
+        super().setUp()
+        spec = Spec.objects.create(organisation=self.organisation, category='tyre', title='Tyre')
+        self.soft, self.hard = [SpecValue.objects.create(spec=spec, value=value) for value in ('Soft', 'Hard')]
+        self.tests = [Test.objects.create(project=self.project, notes='') for _ in range(4)]
+        for i, test in enumerate(self.tests):
+            TestSpecValue.objects.create(test=test, spec=self.soft if i < 2 else self.hard, isTestingParam=True)
+            CategoryScore.objects.create(test=test, category='Ride', score=8 if i < 2 else 6)
+
+    def variants(self):
+        parameters = self.client.get(f'/project/{self.project.id}/spec-impact/').json()['parameters']
+        return {variant['value']: variant['scores']['Ride']['tests'] for variant in parameters[0]['variants']}
+
+    def test_cached_result_follows_spec_value_changes(self):
+        self.assertEqual(self.variants(), {'Soft': 2, 'Hard': 2})
+        self.soft.value = 'Soft compound'
+        self.soft.save()
+        self.assertEqual(self.variants(), {'Soft compound': 2, 'Hard': 2})
+
+        link = TestSpecValue.objects.get(test=self.tests[3])
+        link.isTestingParam = False
+        link.save()
+        self.assertEqual(self.variants(), {'Soft compound': 2, 'Hard': 1})
+
+        # Batch swaps are queryset updates and send no signals
+        body = json.dumps({'operations': [{
+            'type': 'spec', 'test': self.tests[0].id, 'old_spec_id': self.soft.id, 'new_spec_id': self.hard.id,
+            'isTestingParam': True,
+        }]})
+        self.assertEqual(self.client.post('/tests/batch-update/', body, content_type='application/json').status_code, 200)
+        self.assertEqual(self.variants(), {'Soft compound': 1, 'Hard': 2})
+
+
+class ProjectSummarySignalTests(ProjectFixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = self.create_project('P2')
+        self.questions = [
+            FeedbackQuestion.objects.create(organisation=self.organisation, project=self.project, question=f'Q{i}')
+            for i in range(2)
+        ]
+        for question, category in zip(self.questions, ('Ride', 'Noise')):
+            TestingBenchmarkParams.objects.create(
+                organisation=self.organisation, question=question, category=category, weightage=50
+            )
+        rebuild_project_summary(self.project.id)
+        rebuild_project_summary(self.other.id)
+
+    def assertSummariesConsistent(self):
+        # The incrementally maintained rows match a rebuild from the source tables
+        for project in (self.project, self.other):
+            maintained = project_summary_data(ProjectSummary.objects.get(project=project))
+            rebuilt = project_summary_data(rebuild_project_summary(project.id))
+            for data in (maintained, rebuilt):
+                del data['last_activity_at'], data['updatedAt']
+            self.assertEqual(maintained, rebuilt)
+
+    def answer(self, test, question, rating):
+        FeedbackAnswer.objects.create(test=test, question=question, rating=rating)
+        calculate_category_scores(test)
+
+    def test_creates_updates_and_deletes(self):
+        tests = [Test.objects.create(project=self.project, notes='') for _ in range(3)]
+        for i, test in enumerate(tests):
+            self.answer(test, self.questions[0], 6 + i)
+            self.answer(test, self.questions[1], 4)
+        self.assertSummariesConsistent()
+
+        tests[0].status = 'completed'
+        tests[0].isReviewed = True
+        tests[0].save()
+        answer = FeedbackAnswer.objects.get(test=tests[1], question=self.questions[0])
+        answer.rating = 2
+        answer.save()
+        calculate_category_scores(tests[1])
+        FeedbackAnswer.objects.filter(test=tests[2], question=self.questions[1]).delete()
+        CategoryScore.objects.filter(test=tests[2], category='Noise').delete()
+        self.assertSummariesConsistent()
+
+        Test.delete(tests[0].id)
+        self.assertSummariesConsistent()
+        self.assertEqual(ProjectSummary.objects.get(project=self.project).total_tests, 2)
+
+    def test_tests_answers_and_scores_moving_between_parents(self):
+        tests = [Test.objects.create(project=self.project, notes='') for _ in range(2)]
+        for test in tests:
+            self.answer(test, self.questions[0], 8)
+        self.assertEqual(project_for_test(tests[0].id), self.project.id)
+
+        moved = Test.objects.get(id=tests[0].id)
+        moved.project = self.other
+        moved.save()
+        self.assertSummariesConsistent()
+        self.assertEqual(project_for_test(moved.id), self.other.id)
+
+        # An answer and a score move to a test of the other project
+        foreign = Test.objects.create(project=self.other, notes='')
+        answer = FeedbackAnswer.objects.get(test=tests[1])
+        answer.test = foreign
+        answer.save()
+        score = CategoryScore.objects.get(test=tests[1])
+        score.test = foreign
+        score.save()
+        self.assertSummariesConsistent()
+        summary = ProjectSummary.objects.get(project=self.other)
+        self.assertEqual((summary.total_tests, summary.feedback_answer_count), (2, 2))
+        self.assertEqual(summary.category_scores['Ride']['count'], 2)
+
+
+class QuestionnaireBundleTests(ProjectFixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f'/project/{self.project.id}/questionnaire/'
+
+    def add_question(self, text):
+        return FeedbackQuestion.objects.create(organisation=self.organisation, project=self.project, question=text)
+
+    def test_version_moves_forward_on_changes_and_recreation(self):
+        self.add_question('Ride comfort?')
+        response = self.client.get(self.url)
+        etag, version = response['ETag'], response.json()['version']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        question = self.add_question('Cabin noise?')
+        TestingBenchmarkParams.objects.create(
+            organisation=self.organisation, question=question, category='Noise', weightage=100
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.json()['version'], version)
+        self.assertEqual(response.json()['categories'], {'Noise': [question.id]})
+        version = response.json()['version']
+
+        # A recreated bundle row starts after every version handed out before
+        QuestionnaireBundle.objects.filter(project=self.project).delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.json()['version'], version)
+
+
+class RecomputeCategoryScoresTests(ProjectFixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        other_organisation = Organisation.objects.create(name='Other org')
+        questions = [
+            FeedbackQuestion.objects.create(organisation=self.organisation, project=self.project, question=f'Q{i}')
+            for i in range(4)
+        ]
+        # Questions may feed several categories; another organisation's weightages never apply
+        for question, category, weightage in (
+            (questions[0], 'Ride', 40), (questions[0], 'Noise', 15), (questions[1], 'Ride', 60),
+            (questions[2], 'Handling', 35), (questions[3], 'Noise', 85),
+        ):
+            TestingBenchmarkParams.objects.create(
+                organisation=self.organisation, question=question, category=category, weightage=weightage
+            )
+        TestingBenchmarkParams.objects.create(
+            organisation=other_organisation, question=questions[1], category='Ride', weightage=100
+        )
+        self.tests = [Test.objects.create(project=self.project, notes='') for _ in range(5)]
+        for i, test in enumerate(self.tests):
+            for j, question in enumerate(questions):
+                if (i + j) % 3:
+                    FeedbackAnswer.objects.create(test=test, question=question, rating=(3 * i + 2 * j) % 10 + 1)
+
+    def stored_scores(self):
+        return dict(((test_id, category), score) for test_id, category, score in
+                    CategoryScore.objects.values_list('test_id', 'category', 'score'))
+
+    def test_bulk_scores_match_calculate_category_scores(self):
+        for test in self.tests:
+            calculate_category_scores(test)
+        expected = self.stored_scores()
+        self.assertEqual(len({category for _, category in expected}), 3)
+        self.assertEqual(recompute_category_scores_for_tests([test.id for test in self.tests], dry_run=True)['changes'], [])
+
+        TestingBenchmarkParams.objects.filter(category='Ride').update(weightage=25)
+        call_command('recompute_category_scores', workers=1, chunk_size=2, stdout=StringIO())
+        recomputed = self.stored_scores()
+        self.assertNotEqual(recomputed, expected)
+        for test in self.tests:
+            calculate_category_scores(test)
+        self.assertEqual(self.stored_scores(), recomputed)
+
+
+class FeedbackTaggingTests(ProjectFixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        self.test = Test.objects.create(project=self.project, notes='')
+        self.session = Session.objects.create(
+            test=self.test, driver_id=str(self.user.id), vehicle_id=str(self.vehicle.id)
+        )
+        for category, keyword in [('Noise', 'noise'), ('Noise', 'Wind  Noise'), ('Steering', 'steering')]:
+            CategoryKeyword.objects.create(organisation=self.organisation, category=category, keyword=keyword)
+
+    def create_feedback(self, text):
+        return Feedback.objects.create(
+            session=self.session, audio_file='a.m4a', latitude=12.9, longitude=77.5, transcription_text=text
+        )
+
+    def tags(self, feedback):
+        tag_feedback(feedback)
+        return {tag.category: (tag.hits, tag.keywords) for tag in feedback.tags.all()}
+
+    def test_longest_overlapping_keyword_wins(self):
+        feedback = self.create_feedback('Wind noise at 100 km/h, then more noise. Steering: fine')
+        # "noise" inside "wind noise" is not counted a second time for the category
+        self.assertEqual(self.tags(feedback), {'Noise': (2, ['wind noise', 'noise']), 'Steering': (1, ['steering'])})
+
+    def test_only_whole_words_match(self):
+        feedback = self.create_feedback('Noisy cabin, odd noises and some oversteering')
+        self.assertEqual(self.tags(feedback), {})
+
+    def test_vocabulary_edits_are_picked_up_when_retagging(self):
+        feedback = self.create_feedback('A hum, then noise')
+        self.assertEqual(self.tags(feedback), {'Noise': (1, ['noise'])})
+
+        keyword = CategoryKeyword.objects.get(keyword='noise')
+        keyword.keyword = 'hum'
+        keyword.save()
+        self.assertEqual(self.tags(feedback), {'Noise': (1, ['hum'])})
+        self.assertEqual(FeedbackTag.objects.filter(feedback=feedback).count(), 1)
+
+    def test_voice_feedback_is_filtered_by_category(self):
+        noisy = self.create_feedback('Wind noise')
+        steering = self.create_feedback('Steering is heavy')
+        self.create_feedback('Nothing to report')
+        for feedback in Feedback.objects.all():
+            tag_feedback(feedback)
+
+        url = f'/test/{self.test.id}/voice-feedback/'
+        self.assertEqual(self.client.get(url).json()['total_feedbacks'], 3)
+        data = self.client.get(url, {'category': 'noise'}).json()
+        self.assertEqual([feedback['id'] for feedback in data['feedbacks']], [noisy.id])
+        self.assertEqual(data['feedbacks'][0]['tags'][0]['keywords'], ['wind noise'])
+        data = self.client.get(url, {'category': 'Steering', 'fields': 'id,transcription_text'}).json()
+        self.assertEqual([feedback['id'] for feedback in data['feedbacks']], [steering.id])
+        self.assertEqual(self.client.get(url, {'category': 'ride'}).json()['feedbacks'], [])
+
+
+class GPSTestCase(ProjectFixtureTestCase):
+    """A test of the project, driven by the signed-in user, to record tracks and feedback for."""
+    ROLE = 'driver'
+    START = 1735725600000  # 2025-01-01T10:00:00Z in milliseconds
+
+    def setUp(self):
+        super().setUp()
+        self.test = Test.objects.create(project=self.project, notes='')
+
+    def upload(self, body, content_type='application/json', url=None):
+        return self.client.post(url or f'/test/{self.test.id}/gps/', body, content_type=content_type)
+
+
+class GPSIngestionTests(GPSTestCase):
+    @override_settings(GPS_TRACK_STORAGE='rows')
+    def test_json_upload_is_sorted_deduplicated_and_reported(self):
+        points = [{'lat': 12.9, 'lon': 77.5 + i * 1e-4, 'timestamp': self.START + i * 100} for i in range(50)]
+        points[3], points[4] = points[4], points[3]
+        points.append(dict(points[10], lat=13.0))
+        points.append({'lat': 95, 'lon': 77.5, 'timestamp': self.START})
+        points.append({'lat': 12.9, 'lon': 77.5, 'timestamp': 'yesterday'})
+        report = self.upload(json.dumps(points)).json()
+
+        self.assertEqual((report['received'], report['inserted'], report['rejected']), (53, 50, 2))
+        # The swapped point and the late correction both arrived after a later timestamp
+        self.assertEqual((report['duplicates'], report['out_of_order']), (1, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [51, 52])
+        stored = list(TestGPSCoordinate.objects.filter(test=self.test).order_by('id').values_list('timestamp', 'lat'))
+        self.assertEqual([timestamp for timestamp, _ in stored], sorted(timestamp for timestamp, _ in stored))
+        self.assertEqual(stored[10][1], 13.0)
+
+        # Re-sending the same upload stores nothing twice
+        report = self.upload(json.dumps(points)).json()
+        self.assertEqual((report['inserted'], report['already_stored']), (0, 50))
+
+    def test_ndjson_and_csv_uploads(self):
+        ndjson = '\n'.join(json.dumps([12.9, 77.5, (self.START + i * 1000) / 1000]) for i in range(3)) + '\nnot json\n'
+        self.assertEqual(self.upload(ndjson, 'application/x-ndjson').json()['inserted'], 3)
+        csv_body = 'timestamp,lon,lat\n2025-01-01T11:00:00Z,77.5,12.9\n2025-01-01T11:00:01+00:00,77.6,12.8\n'
+        self.assertEqual(self.upload(csv_body, 'text/csv').json()['inserted'], 2)
+        self.assertEqual(len(load_track(self.test.id)), 5)
+
+        session = Session.objects.create(driver_id=str(self.user.id), vehicle_id='1')
+        self.upload('[[12.9, 77.5, 1735725600]]', url=f'/sessions/{session.id}/gps/')
+        self.assertEqual(TestGPSCoordinate.objects.filter(session=session, test=None).count(), 1)
+
+        self.assertEqual(self.upload('[{"lat": 1').status_code, 400)
+        self.assertEqual(self.upload('lat', 'text/plain').status_code, 415)
+
+
+class GPSTrackStorageTests(GPSTestCase):
+    def test_packed_track_round_trip_and_migration(self):
+        rng = np.random.default_rng(0)
+        track = Track(
+            self.START + np.cumsum(rng.integers(90, 110, 1000)),
+            12.9 + np.cumsum(rng.normal(0, 2e-5, 1000)),
+            77.5 + np.cumsum(rng.normal(0, 2e-5, 1000)),
+        )
+        blob = encode_track(track)
+        self.assertLess(len(blob), 8 * len(track))
+        decoded = decode_track(blob)
+        np.testing.assert_array_equal(decoded.timestamp_ms, track.timestamp_ms)
+        np.testing.assert_allclose(decoded.lat, track.lat, atol=1e-6)
+        np.testing.assert_allclose(decoded.lon, track.lon, atol=1e-6)
+
+        TestGPSCoordinate.objects.bulk_create([
+            TestGPSCoordinate(test=self.test, lat=lat, lon=lon, timestamp=timestamp)
+            for lat, lon, timestamp in zip(track.lat[:10].tolist(), track.lon[:10].tolist(), track.datetimes()[:10])
+        ])
+        self.upload(json.dumps([[12.9, 77.5, int(self.START) + 10 ** 6]]))
+        self.assertEqual(len(load_track(self.test.id)), 11)
+        call_command('pack_gps_tracks', delete_rows=True, stdout=StringIO())
+        self.assertFalse(TestGPSCoordinate.objects.exists())
+        self.assertEqual(TestGPSTrack.objects.get(test=self.test).point_count, 11)
+        np.testing.assert_array_equal(load_track(self.test.id).timestamp_ms[:10], track.timestamp_ms[:10])
+
+        # A fix weeks away from the rest is stored, not rejected, in either form
+        late = self.START - 35 * 86_400_000
+        with override_settings(GPS_TRACK_STORAGE='rows'):
+            self.assertEqual(self.upload(json.dumps([[12.9, 77.5, late]])).status_code, 200)
+        call_command('pack_gps_tracks', delete_rows=True, stdout=StringIO())
+        self.assertEqual(self.upload(json.dumps([[12.9, 77.5, late + 45 * 86_400_000]])).status_code, 200)
+        self.assertEqual(TestGPSTrack.objects.get(test=self.test).point_count, 13)
+        self.assertEqual(load_track(self.test.id).timestamp_ms[0], late)
+
+
+class GPSTrackQueryTests(GPSTestCase):
+    def test_track_query_is_bounded_by_max_points(self):
+        heading = np.cumsum(np.random.default_rng(1).normal(0, 0.05, 3000))
+        lat = 12.9 + np.cumsum(np.cos(heading) * 1e-5)
+        lon = 77.5 + np.cumsum(np.sin(heading) * 1e-5)
+        points = [[a, b, self.START + i * 100] for i, (a, b) in enumerate(zip(lat.tolist(), lon.tolist()))]
+        self.upload(json.dumps(points))
+        url = f'/test/{self.test.id}/track/'
+
+        overview = self.client.get(url, {'max_points': 500}).json()
+        self.assertGreater(overview['level'], 0)
+        self.assertLessEqual(overview['returned'], 500)
+        # Douglas-Peucker levels always keep both ends of the route
+        self.assertEqual(overview['points'][0][2], points[0][2])
+        self.assertEqual(overview['points'][-1][2], points[-1][2])
+
+        window = self.client.get(url, {'start': self.START, 'end': self.START + 9999, 'max_points': 500}).json()
+        self.assertEqual((window['level'], window['returned']), (0, 100))
+        self.assertEqual(self.client.get(url, {'bbox': '77.5,12.9'}).status_code, 400)
+
+
+class TripMetricsTests(GPSTestCase):
+    def test_trip_metrics_drop_gps_jumps_and_follow_track_changes(self):
+        # 20 m/s due north at 1 Hz, with one fix thrown ~1 km east
+        step = 20 / 111195.0
+        points = [[12.9 + i * step, 77.5, self.START + i * 1000] for i in range(61)]
+        points[30][1] += 0.01
+        self.upload(json.dumps(points))
+        url = f'/test/{self.test.id}/trip-metrics/'
+
+        metrics = self.client.get(url).json()
+        self.assertEqual((metrics['points'], metrics['outliers_removed']), (60, 1))
+        self.assertAlmostEqual(metrics['distance_m'], 1200, delta=1)
+        self.assertAlmostEqual(metrics['max_speed_kmh'], 72, delta=0.5)
+        self.assertLess(metrics['max_lateral_acceleration_ms2'], 0.5)
+
+        # New points change the track fingerprint, so the cached metrics are not reused
+        more = [[12.9 + i * step, 77.5, self.START + i * 1000] for i in range(61, 91)]
+        self.upload(json.dumps(more))
+        self.assertAlmostEqual(self.client.get(url).json()['distance_m'], 1800, delta=1)
+
+
+class LocationSearchTests(GPSTestCase):
+    def test_location_search_is_scoped_and_exact(self):
+        # Both ~100 m apart along the same street; the far one is ~20 km away
+        near = [(12.9, 77.5), (12.9, 77.5009)]
+        session = Session.objects.create(test=self.test, driver_id=str(self.user.id), vehicle_id='1')
+        for lat, lon in near + [(13.08, 77.5)]:
+            Feedback.objects.create(session=session, audio_file='feedback_audios/a.m4a', latitude=lat, longitude=lon)
+        other = Test.objects.create(project=Project.objects.create(
+            organisation=self.test.project.organisation, name='Other', code='P2', parent_code='P0',
+            vehicle=self.test.project.vehicle,
+        ), notes='')
+        Feedback.objects.create(
+            session=Session.objects.create(test=other, driver_id='2', vehicle_id='1'),
+            audio_file='feedback_audios/b.m4a', latitude=12.9, longitude=77.5,
+        )
+        self.assertEqual(len(Feedback.objects.first().geohash), 9)
+
+        url = f'/project/{self.test.project_id}/location-search/'
+        found = self.client.get(url, {'lat': 12.9, 'lon': 77.5, 'radius_m': 200}).json()
+        self.assertEqual([(r['latitude'], r['longitude']) for r in found['results']], near)
+        self.assertGreater(found['results'][1]['distance_m'], 90)
+        # Members only see their own projects' feedback in a vehicle-wide search
+        vehicle = self.client.get(
+            f'/vehicle/{self.test.project.vehicle_id}/location-search/', {'bbox': '77.49,12.89,77.51,12.91'}
+        ).json()
+        self.assertEqual(vehicle['total'], 2)
+        stranger = Organisation.objects.create(name='Other org')
+        foreign = Vehicle.objects.create(organisation=stranger, name='V', body_number='BN2', manufacturer='M', year=2025)
+        self.assertEqual(self.client.get(f'/vehicle/{foreign.id}/location-search/', {'lat': 12.9}).status_code, 404)
+
+        points = [[12.9, 77.5 + i * 1e-4, self.START + i * 1000] for i in range(100)]
+        self.upload(json.dumps(points))
+        TestGPSCoordinate.create(other, 12.9, 77.5, timezone.now())
+        gps = self.client.get(url, {'source': 'gps', 'lat': 12.9, 'lon': 77.5, 'radius_m': 55}).json()
+        # 1e-4 degrees of longitude is ~10.8 m here, so points 0-5 are within 55 m
+        self.assertEqual([r['timestamp_ms'] for r in gps['results']], [p[2] for p in points[:6]])
+        self.assertEqual({r['test_id'] for r in gps['results']}, {self.test.id})
+        self.assertEqual(self.client.get(url, {'lat': 12.9}).status_code, 400)
+        # A bbox is capped like the radius: ~1 degree of longitude is ~108 km wide here
+        self.assertEqual(self.client.get(url, {'bbox': '77.0,12.9,78.0,12.95'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'bbox': '77.1,12.5,77.95,13.35'}).status_code, 200)
+
+
+class FeedbackAlignmentTests(GPSTestCase):
+    def test_feedback_is_placed_on_the_track_when_it_arrives(self):
+        session = Session.objects.create(test=self.test, driver_id=str(self.user.id), vehicle_id='1')
+        # Placed at the time the phone recorded it, not at the (later) upload time
+        during = Feedback.objects.create(
+            session=session, audio_file='feedback_audios/a.m4a', recorded_at=from_epoch_ms(self.START + 10500)
+        )
+        # Without recorded_at the upload time is used
+        after = Feedback.objects.create(session=session, audio_file='feedback_audios/a.m4a')
+        Feedback.objects.filter(id=after.id).update(timestamp=from_epoch_ms(self.START + 200000))
+
+        step = 20 / 111195.0  # 20 m/s due north at 1 Hz
+        self.upload(json.dumps([[12.9 + i * step, 77.5, self.START + i * 1000] for i in range(60)]))
+        during.refresh_from_db()
+        self.assertAlmostEqual(during.track_latitude, 12.9 + 10.5 * step, places=6)
+        self.assertAlmostEqual(during.track_speed_kmh, 72, delta=0.5)
+        self.assertEqual(during.track_gap_ms, 500)
+        self.assertEqual(during.location(), (during.track_latitude, during.track_longitude))
+        self.assertIsNotNone(during.geohash)
+        # Two minutes after the last fix there is nothing to place it on
+        self.assertIsNone(Feedback.objects.get(id=after.id).track_latitude)
+
+        # Fixes around the later comment re-align it and leave the earlier one alone
+        Feedback.objects.filter(id=during.id).update(track_gap_ms=-1)
+        self.upload(json.dumps([[12.95, 77.5 + i * step, self.START + 195000 + i * 1000] for i in range(10)]))
+        self.assertEqual(Feedback.objects.get(id=after.id).track_gap_ms, 0)
+        self.assertEqual(Feedback.objects.get(id=during.id).track_gap_ms, -1)
+
+        Feedback.objects.update(track_latitude=None, track_longitude=None, track_speed_kmh=None)
+        out = StringIO()
+        call_command('align_feedback', stdout=out)
+        self.assertIn('Placed 2 of 2', out.getvalue())
+
+
+class TrackSectionTests(GPSTestCase):
+    def test_sections_split_track_time_and_feedback(self):
+        step = 20 / 111195.0  # 20 m/s due north at 1 Hz for 60 s
+        self.upload(json.dumps([[12.9 + i * step, 77.5, self.START + i * 1000] for i in range(61)]))
+        # A square over the first 20 s of the drive
+        box = [[77.49, 12.89], [77.51, 12.89], [77.51, 12.9 + 19.5 * step], [77.49, 12.9 + 19.5 * step]]
+        created = self.client.post('/track-sections/', json.dumps({'name': 'Rough road', 'polygon': box}),
+                                   content_type='application/json')
+        self.assertEqual(created.status_code, 201)
+        session = Session.objects.create(test=self.test, driver_id=str(self.user.id), vehicle_id='1')
+        inside = Feedback.objects.create(session=session, audio_file='a.m4a', latitude=12.9 + 5 * step, longitude=77.5)
+        Feedback.objects.create(session=session, audio_file='b.m4a', latitude=12.9 + 40 * step, longitude=77.5)
+        FeedbackTag.objects.create(feedback=inside, category='noise')
+
+        url = f'/test/{self.test.id}/sections/'
+        rough, = self.client.get(url).json()['sections']
+        self.assertEqual((rough['points'], rough['visits'], rough['time_s']), (20, 1, 20.0))
+        self.assertEqual((rough['feedback_ids'], rough['tags']), ([inside.id], {'noise': 1}))
+
+        # Editing the polygon invalidates the cached summary
+        section_id = created.json()['id']
+        wider = [[77.49, 12.89], [77.51, 12.89], [77.51, 12.92], [77.49, 12.92]]
+        self.client.patch(f'/track-sections/{section_id}/', json.dumps({'polygon': wider}),
+                          content_type='application/json')
+        summary = self.client.get(url).json()
+        self.assertEqual((summary['sections'][0]['points'], summary['outside']['points']), (61, 0))
+
+
+class LiveSessionTests(GPSTestCase):
+    def test_live_fixes_are_fanned_out_and_flushed_in_one_batch(self):
+        session = Session.objects.create(test=self.test, driver_id=str(self.user.id), vehicle_id='1')
+        path = f'/ws/sessions/{session.id}/'
+        cookie = [(b'cookie', f'jwt={auth_cookie(self.user)}'.encode())]
+
+        async def drive():
+            def connect(headers):
+                return ApplicationCommunicator(session_telemetry, {'type': 'websocket', 'path': path, 'headers': headers})
+            anonymous = connect([])
+            await anonymous.send_input({'type': 'websocket.connect'})
+            self.assertEqual(await anonymous.receive_output(), {'type': 'websocket.close', 'code': 4401})
+
+            vehicle, dashboard = connect(cookie), connect(cookie)
+            for connection in (vehicle, dashboard):
+                await connection.send_input({'type': 'websocket.connect'})
+                self.assertEqual((await connection.receive_output())['type'], 'websocket.accept')
+            points = [[12.9, 77.5 + i * 1e-4, self.START + i * 100] for i in range(3)]
+            await vehicle.send_input({'type': 'websocket.receive', 'text': json.dumps({'points': points})})
+            ack = json.loads((await vehicle.receive_output())['text'])
+            fixes = json.loads((await dashboard.receive_output())['text'])
+            for connection in (vehicle, dashboard):
+                await connection.send_input({'type': 'websocket.disconnect', 'code': 1000})
+                await connection.wait()
+            return ack, fixes
+
+        ack, fixes = async_to_sync(drive)()
+        self.assertEqual((ack['accepted'], ack['rejected']), (3, 0))
+        self.assertEqual([point[2] for point in fixes['points']], [self.START, self.START + 100, self.START + 200])
+        # Buffered until the last connection left, then written together
+        self.assertEqual(TestGPSCoordinate.objects.filter(session=session, test=self.test).count(), 3)
+
+    def test_live_fixes_are_kept_when_a_write_fails(self):
+        session = Session.objects.create(test=self.test, driver_id=str(self.user.id), vehicle_id='1')
+        cookie = [(b'cookie', f'jwt={auth_cookie(self.user)}'.encode())]
+        attempts = []
+
+        def flaky_store(session_id, track):
+            attempts.append(len(track))
+            if len(attempts) <= 2:
+                raise OSError('database is locked')
+            return store_session_points(session_id, track)
+
+        async def drive():
+            vehicle = ApplicationCommunicator(
+                session_telemetry, {'type': 'websocket', 'path': f'/ws/sessions/{session.id}/', 'headers': cookie}
+            )
+            await vehicle.send_input({'type': 'websocket.connect'})
+            await vehicle.receive_output()
+            channel = live_hub.channels[session.id]
+            for batch in range(2):
+                points = [[12.9, 77.5, self.START + (batch * 100 + i) * 100] for i in range(100)]
+                await vehicle.send_input({'type': 'websocket.receive', 'text': json.dumps(points)})
+                await vehicle.receive_output()
+                while channel.pending_points:
+                    await asyncio.sleep(0.01)
+            flusher_alive = not channel._flusher.done()
+            await vehicle.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await vehicle.wait()
+            return flusher_alive
+
+        with mock.patch('testing.live.FLUSH_INTERVAL_S', 0.01), \
+                mock.patch('testing.live.store_session_points', side_effect=flaky_store), \
+                self.assertLogs('testing.live', 'ERROR') as logs:
+            flusher_alive = async_to_sync(drive)()
+        # The two failed writes were logged and retried by the same flusher, nothing was lost
+        self.assertEqual((len(logs.records), attempts[0], flusher_alive), (2, 100, True))
+        self.assertEqual(TestGPSCoordinate.objects.filter(session=session).count(), 200)
+
+
+class FeedbackHeatmapTests(GPSTestCase):
+    def test_heatmap_cells_follow_feedback_ratings_and_tags(self):
+        vehicle_id = self.test.project.vehicle_id
+        session = Session.objects.create(test=self.test, driver_id=str(self.user.id), vehicle_id=str(vehicle_id))
+        # Cells are refreshed when the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            near = Feedback.objects.create(session=session, audio_file='a.m4a', latitude=12.9, longitude=77.5,
+                                           transcription_text='A rattle from the dashboard')
+            Feedback.objects.create(session=session, audio_file='b.m4a', latitude=12.9001, longitude=77.5001)
+            far = Feedback.objects.create(session=session, audio_file='c.m4a', latitude=12.95, longitude=77.55)
+        CategoryKeyword.objects.create(organisation=self.test.project.organisation, category='Noise', keyword='rattle')
+        tag_feedback(near)
+        question = FeedbackQuestion.objects.create(
+            organisation=self.test.project.organisation, project=self.test.project, question='Ride?'
+        )
+        TestingBenchmarkParams.objects.create(
+            organisation=self.test.project.organisation, category='Ride', question=question, weightage=100
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            answer = FeedbackAnswer.objects.create(test=self.test, question=question, rating=2)
+
+        url = f'/vehicle/{vehicle_id}/heatmap/{encode_point(12.9, 77.5, 4)}/?precision=7'
+        response = self.client.get(url)
+        cells = {cell['feedback_count']: cell for cell in response.json()['cells']}
+        self.assertEqual(sorted(cells), [1, 2])
+        self.assertEqual((cells[2]['mean_rating'], cells[2]['tags']), (2, {'Noise': 1}))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        # Saving an answer and its scores refreshes the test's cells once
+        with mock.patch('testing.heatmap.refresh_tests', wraps=refresh_tests) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                answer.rating = 4
+                answer.save()
+                calculate_category_scores(self.test)
+                far.delete()
+        self.assertEqual(refresh.call_count, 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        cell, = response.json()['cells']
+        self.assertEqual((cell['feedback_count'], cell['mean_rating'], cell['category_scores']), (2, 4, {'Ride': 4}))
+        # Maintained incrementally, the cells match a rebuild from scratch
+        out = StringIO()
+        call_command('rebuild_heatmaps', stdout=out)
+        self.assertIn('(0 cells changed)', out.getvalue())
+
+
+class TelemetryChannelTests(GPSTestCase):
+    def test_telemetry_channels_are_sliced_by_chunk_and_decimated(self):
+        session = Session.objects.create(test=self.test, driver_id=str(self.user.id), vehicle_id='1')
+        url = f'/sessions/{session.id}/telemetry/'
+        with tempfile.TemporaryDirectory() as root, self.settings(TELEMETRY_ROOT=root):
+            rows = ['timestamp,accel_x,steering_deg']
+            rows += [f'{self.START + i * 10},{i % 7 / 10},{"" if i % 2 else -i}' for i in range(100)]
+            rows.append(f'{self.START + 2000},spike,1')
+            report = self.upload('\n'.join(rows), 'text/csv', url).json()
+            self.assertEqual((report['received'], report['appended'], report['rejected']), (101, 151, 1))
+            self.assertEqual(report['channels']['steering_deg']['appended'], 51)
+            # Appending merges into the last, partly filled chunk
+            report = self.upload('\n'.join(rows[:1] + [f'{self.START + 5000},0.5,'] + rows[1:]), 'text/csv', url).json()
+            self.assertEqual((report['appended'], report['already_stored']), (1, 151))
+            channels = {channel['name']: channel for channel in self.client.get(url).json()['channels']}
+            self.assertEqual((channels['accel_x']['sample_count'], channels['accel_x']['chunk_count']), (101, 1))
+
+            # 100 Hz for the length of four chunks, with one spike
+            count = CHUNK_SAMPLES * 4
+            timestamp_us = (self.START + 10_000) * 1000 + np.arange(count, dtype=np.int64) * 10_000
+            values = np.sin(np.arange(count) / 100.0)
+            values[count // 2] = 9.0
+            self.assertEqual(append_samples(session.id, 'accel_x', timestamp_us, values), (count, 0))
+
+            start_ms, end_ms = timestamp_us[CHUNK_SAMPLES + 10] / 1000, timestamp_us[CHUNK_SAMPLES + 509] / 1000
+            data = self.client.get(f'{url}accel_x/', {'start': start_ms, 'end': end_ms}).json()
+            self.assertFalse(data['decimated'])
+            self.assertEqual((data['chunks_read'], data['chunks_total']), (1, 5))
+            self.assertEqual((len(data['values']), data['timestamp_ms'][0]), (500, start_ms))
+            self.assertAlmostEqual(data['values'][0], values[CHUNK_SAMPLES + 10], places=6)
+
+            data = self.client.get(f'{url}accel_x/', {'max_points': 100}).json()
+            self.assertTrue(data['decimated'])
+            self.assertEqual((data['sample_count'], sum(data['count'])), (count + 101, count + 101))
+            self.assertLessEqual(len(data['mean']), 100)
+            self.assertEqual((max(data['max']), round(min(data['min']), 3)), (9.0, -1.0))
+            self.assertEqual(self.client.get(f'{url}unknown/').status_code, 404)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                session.delete()
+                # Until the delete commits, a rollback would still find the files
+                self.assertNotEqual(os.listdir(root), [])
+            self.assertEqual(os.listdir(root), [])
+
+    def test_telemetry_channel_survives_a_crash_before_the_index_is_replaced(self):
+        session = Session.objects.create(test=self.test, driver_id=str(self.user.id), vehicle_id='1')
+        timestamp_us = self.START * 1000 + np.arange(CHUNK_SAMPLES * 3, dtype=np.int64) * 10_000
+        values = np.arange(CHUNK_SAMPLES * 3, dtype=np.float64)
+        first = CHUNK_SAMPLES + 100
+        with tempfile.TemporaryDirectory() as root, self.settings(TELEMETRY_ROOT=root):
+            append_samples(session.id, 'steering_deg', timestamp_us[:first], values[:first])
+            # The chunks are written, then the process dies before the new index is in place
+            with mock.patch('testing.telemetry._write_index', side_effect=OSError('crash')):
+                with self.assertRaises(OSError):
+                    append_samples(session.id, 'steering_deg', timestamp_us[first:], values[first:])
+
+            data = query_channel(session.id, 'steering_deg', max_points=CHUNK_SAMPLES * 3)
+            self.assertEqual(data['values'], values[:first].tolist())
+            self.assertEqual(
+                append_samples(session.id, 'steering_deg', timestamp_us[first:], values[first:]),
+                (len(values) - first, 0),
+            )
+            data = query_channel(session.id, 'steering_deg', max_points=CHUNK_SAMPLES * 3)
+            self.assertEqual((data['chunks_total'], data['values']), (3, values.tolist()))
+
+
+class IdempotencyKeyTests(ProjectFixtureTestCase):
+    ROLE = 'driver'
+
+    def start_session(self, driver, key):
+        body = json.dumps({'driver_id': driver.id, 'vehicle_id': self.vehicle.id})
+        return self.client.post('/start-session/', body, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.start_session(self.user, 'retry-1')
+        second = self.start_session(self.user, 'retry-1')
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Session.objects.count(), 1)
+
+        self.start_session(self.user, 'retry-2')
+        self.assertEqual(Session.objects.count(), 2)
+
+    def test_abandoned_key_is_taken_over_after_its_lease(self):
+        body = json.dumps({'driver_id': self.user.id, 'vehicle_id': self.vehicle.id})
+        IdempotencyKey.objects.create(
+            user_id=self.user.id, key='crashed', fingerprint=request_fingerprint(
+                RequestFactory().post('/start-session/', body, content_type='application/json')
+            ),
+            lease_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        response = self.start_session(self.user, 'crashed')
+        self.assertEqual((response.status_code, Session.objects.count()), (201, 1))
+        self.assertEqual(self.start_session(self.user, 'crashed')['Idempotent-Replayed'], 'true')
+
+    def test_key_reused_for_a_different_request_is_rejected(self):
+        self.start_session(self.user, 'retry-1')
+        other = User.objects.create(username='other', organisation=self.user.organisation)
+        self.assertEqual(self.start_session(other, 'retry-1').status_code, 422)
+        self.assertEqual(Session.objects.count(), 1)
 
-# Create your tests here.
@@ -0,0 +1,196 @@
+import struct
+import zlib
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Max
+
+from testing.models import Test, TestGPSCoordinate, TestGPSTrack
+
+# Blob layout: header, then the zlib-compressed delta columns: millisecond offsets
+# as little-endian int64, then lat and lon as int32, each with its bytes regrouped
+# by significance, which compresses far better than interleaved values because the
+# high bytes of deltas are mostly 0 (the four top bytes of the offsets almost always)
+HEADER = struct.Struct('<4sIq')  # magic, point count, start time (epoch ms)
+MAGIC = b'GTK2'
+MICRODEGREES = 1_000_000
+COMPRESSION_LEVEL = 6
+
+
+class Track:
+    """A GPS track as parallel NumPy arrays sorted by time: epoch ms, lat and lon."""
+
+    def __init__(self, timestamp_ms, lat, lon):
+        self.timestamp_ms = timestamp_ms
+        self.lat = lat
+        self.lon = lon
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+
+    def __len__(self):
+        return len(self.timestamp_ms)
+
+    def select(self, index):
+        """The points picked by a boolean mask, slice or index array."""
+        return Track(self.timestamp_ms[index], self.lat[index], self.lon[index])
+
+    def datetimes(self):
+        """Timestamps as aware datetimes (UTC)."""
+        return [
+            value.replace(tzinfo=dt_timezone.utc)
+            for value in self.timestamp_ms.astype('datetime64[ms]').astype(datetime)
+        ]
+
+
+def to_epoch_ms(value):
+    return round(value.timestamp() * 1000)
+
+
+def from_epoch_ms(value):
+    return datetime.fromtimestamp(int(value) / 1000.0, tz=dt_timezone.utc)
+
+
+def encode_track(track):
+    """Pack a time-sorted Track into bytes (coordinates rounded to micro-degrees)."""
+    count = len(track)
+    start = int(track.timestamp_ms[0]) if count else 0
+    offsets = np.asarray(track.timestamp_ms - start, dtype='<i8')
+    time_deltas = np.diff(offsets, prepend=np.int64(0)).astype('<i8')
+    coordinates = np.stack([
+        np.rint(track.lat * MICRODEGREES),
+        np.rint(track.lon * MICRODEGREES),
+    ]).astype('<i4')
+    # Lat/lon deltas are within +-360e6, so they fit in int32
+    deltas = np.diff(coordinates, axis=1, prepend=np.zeros((2, 1), dtype='<i4')).astype('<i4')
+    time_planes = time_deltas.view(np.uint8).reshape(count, 8).T
+    planes = deltas.view(np.uint8).reshape(2, count, 4).transpose(0, 2, 1)
+    payload = zlib.compress(
+        np.ascontiguousarray(time_planes).tobytes() + np.ascontiguousarray(planes).tobytes(), COMPRESSION_LEVEL,
+    )
+    return HEADER.pack(MAGIC, count, start) + payload
+
+
+def decode_track(blob):
+    """Unpack bytes written by encode_track into a Track."""
+    blob = memoryview(blob)
+    magic, count, start = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError('Not a packed GPS track')
+    data = np.frombuffer(zlib.decompress(blob[HEADER.size:]), dtype=np.uint8)
+    time_deltas = np.ascontiguousarray(data[:8 * count].reshape(8, count).T).view('<i8').ravel()
+    deltas = np.ascontiguousarray(data[8 * count:].reshape(2, 4, count).transpose(0, 2, 1)).view('<i4')
+    deltas = deltas.reshape(2, count)
+    offsets = np.cumsum(time_deltas, dtype=np.int64)
+    coordinates = np.cumsum(deltas, axis=1, dtype=np.int64)
+    return Track(start + offsets, coordinates[0] / MICRODEGREES, coordinates[1] / MICRODEGREES)
+
+
+def merge_tracks(*tracks):
+    """One time-sorted Track; where timestamps repeat, the later argument wins."""
+    timestamp = np.concatenate([track.timestamp_ms for track in tracks])
+    lat = np.concatenate([track.lat for track in tracks])
+    lon = np.concatenate([track.lon for track in tracks])
+    order = np.argsort(timestamp, kind='stable')
+    timestamp, lat, lon = timestamp[order], lat[order], lon[order]
+    last_of_run = np.append(timestamp[1:] != timestamp[:-1], True) if len(timestamp) else np.empty(0, dtype=bool)
+    return Track(timestamp[last_of_run], lat[last_of_run], lon[last_of_run])
+
+
+def rows_track(queryset):
+    """Track of TestGPSCoordinate rows, read as tuples rather than model instances."""
+    rows = list(queryset.order_by('timestamp').values_list('timestamp', 'lat', 'lon'))
+    if not rows:
+        return Track.empty()
+    timestamps, lats, lons = zip(*rows)
+    return Track(
+        np.fromiter((to_epoch_ms(value) for value in timestamps), dtype=np.int64, count=len(rows)),
+        np.asarray(lats, dtype=np.float64),
+        np.asarray(lons, dtype=np.float64),
+    )
+
+
+def row_timestamps_within(queryset, track):
+    """Epoch ms of the rows of queryset that fall within the span of track."""
+    if not len(track):
+        return np.empty(0, dtype=np.int64)
+    return rows_track(queryset.filter(
+        timestamp__gte=from_epoch_ms(track.timestamp_ms[0]), timestamp__lte=from_epoch_ms(track.timestamp_ms[-1])
+    )).timestamp_ms
+
+
+def packed_track(test_id):
+    data = TestGPSTrack.objects.filter(test_id=test_id).values_list('data', flat=True).first()
+    return decode_track(data) if data is not None else Track.empty()
+
+
+def load_track(test_id):
+    """
+    A test's whole GPS track, whichever form it is stored in: the packed blob and
+    any TestGPSCoordinate rows are merged (two queries, no model instances).
+    """
+    return merge_tracks(packed_track(test_id), rows_track(TestGPSCoordinate.objects.filter(test_id=test_id)))
+
+
+def track_fingerprint(test_id):
+    """
+    A string that changes whenever the test's track does: the packed track's
+    updatedAt plus the count and latest updatedAt of its rows, in one query. Used to
+    key caches of values derived from the track.
+    """
+    state = Test.objects.filter(id=test_id).aggregate(
+        packed=Max('gps_track__updatedAt'),
+        rows=Count('testgpscoordinate'),
+        latest=Max('testgpscoordinate__updatedAt'),
+    )
+    packed = state['packed'].timestamp() if state['packed'] else 0
+    latest = state['latest'].timestamp() if state['latest'] else 0
+    return f'{packed}:{state["rows"]}:{latest}'
+
+
+def _save_packed(test_id, track):
+    TestGPSTrack.objects.update_or_create(test_id=test_id, defaults={
+        'point_count': len(track),
+        'start_time': from_epoch_ms(track.timestamp_ms[0]) if len(track) else None,
+        'end_time': from_epoch_ms(track.timestamp_ms[-1]) if len(track) else None,
+        'min_lat': float(track.lat.min()) if len(track) else None,
+        'min_lon': float(track.lon.min()) if len(track) else None,
+        'max_lat': float(track.lat.max()) if len(track) else None,
+        'max_lon': float(track.lon.max()) if len(track) else None,
+        'data': encode_track(track),
+    })
+
+
+def append_to_track(test_id, track):
+    """
+    Add a time-sorted Track to a test's packed track. Timestamps the test already has,
+    packed or as rows, are skipped. Returns (inserted, already_stored).
+    """
+    with transaction.atomic():
+        # Serialise concurrent uploads for the same test (a no-op lock on SQLite)
+        existing = TestGPSTrack.objects.select_for_update().filter(test_id=test_id).values_list('data', flat=True).first()
+        stored = decode_track(existing) if existing is not None else Track.empty()
+        rows = row_timestamps_within(TestGPSCoordinate.objects.filter(test_id=test_id), track)
+        known = np.concatenate([stored.timestamp_ms, rows])
+        new = ~np.isin(track.timestamp_ms, known)
+        inserted = int(np.count_nonzero(new))
+        if inserted:
+            _save_packed(test_id, merge_tracks(stored, track.select(new)))
+    return inserted, len(track) - inserted
+
+
+def pack_test_track(test_id, delete_rows=False):
+    """
+    Move a test's TestGPSCoordinate rows into its packed track. With delete_rows the
+    rows that carry nothing beyond the point (no session link) are deleted afterwards.
+    Returns the number of points in the packed track.
+    """
+    with transaction.atomic():
+        track = load_track(test_id)
+        if len(track):
+            _save_packed(test_id, track)
+        if delete_rows:
+            TestGPSCoordinate.objects.filter(test_id=test_id, session__isnull=True).delete()
+    return len(track)
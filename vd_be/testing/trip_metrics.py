@@ -0,0 +1,138 @@
+import numpy as np
+from django.core.cache import cache
+
+from testing.tracks import load_track, track_fingerprint
+
+TRIP_METRICS_CACHE_TIMEOUT = 60 * 60 * 24
+EARTH_RADIUS_M = 6371008.8
+# Fixes implying more than this speed into and out of a point are GPS jumps (~300 km/h)
+MAX_PLAUSIBLE_SPEED_MS = 83.0
+OUTLIER_PASSES = 3
+# Intervals longer than this are signal gaps: their distance counts, their speed does not
+MAX_GAP_S = 10.0
+# Below this speed the vehicle counts as stopped and headings are too noisy for lateral g
+MOVING_SPEED_MS = 1.0
+LATERAL_MIN_SPEED_MS = 3.0
+# Centered moving average over this many intervals before differentiating speed
+SMOOTHING_WINDOW = 5
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distances in metres between arrays of points (degrees)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _bearing(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    y = np.sin(lon2 - lon1) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return np.arctan2(y, x)
+
+
+def _smooth(values):
+    if len(values) < SMOOTHING_WINDOW:
+        return values
+    kernel = np.ones(SMOOTHING_WINDOW) / SMOOTHING_WINDOW
+    # Edges are averaged over the samples available rather than padded with zeros
+    weights = np.convolve(np.ones(len(values)), kernel, mode='same')
+    return np.convolve(values, kernel, mode='same') / weights
+
+
+def remove_outliers(track):
+    """
+    Drop isolated GPS jumps: points reached and left at an implausible speed. Repeated
+    a few times so that short bursts of bad fixes are peeled off too. Returns
+    (track, removed).
+    """
+    removed = 0
+    for _ in range(OUTLIER_PASSES):
+        if len(track) < 3:
+            break
+        distance = haversine_m(track.lat[:-1], track.lon[:-1], track.lat[1:], track.lon[1:])
+        dt = np.diff(track.timestamp_ms) / 1000.0
+        speed = distance / np.maximum(dt, 1e-3)
+        fast = speed > MAX_PLAUSIBLE_SPEED_MS
+        jump = np.zeros(len(track), dtype=bool)
+        jump[1:-1] = fast[:-1] & fast[1:]
+        if not jump.any():
+            break
+        removed += int(np.count_nonzero(jump))
+        track = track.select(~jump)
+    return track, removed
+
+
+def compute_trip_metrics(track):
+    """
+    Distance, duration and speed and acceleration statistics of a Track, computed over
+    whole arrays. Speeds are smoothed over SMOOTHING_WINDOW intervals before they are
+    differentiated, and signal gaps longer than MAX_GAP_S are left out of the speed
+    and acceleration series.
+    """
+    track, outliers = remove_outliers(track)
+    metrics = {
+        'points': len(track),
+        'outliers_removed': outliers,
+        'distance_m': 0.0,
+        'duration_s': 0.0,
+        'moving_time_s': 0.0,
+        'avg_speed_kmh': None,
+        'max_speed_kmh': None,
+        'max_acceleration_ms2': None,
+        'max_deceleration_ms2': None,
+        'max_lateral_acceleration_ms2': None,
+        'start': None,
+        'end': None,
+    }
+    if len(track) < 2:
+        return metrics
+
+    distance = haversine_m(track.lat[:-1], track.lon[:-1], track.lat[1:], track.lon[1:])
+    dt = np.diff(track.timestamp_ms) / 1000.0
+    continuous = dt <= MAX_GAP_S
+    speed = _smooth(np.where(continuous, distance / dt, 0.0))
+    moving = continuous & (speed >= MOVING_SPEED_MS)
+    moving_time = float(dt[moving].sum())
+
+    metrics.update({
+        'distance_m': round(float(distance.sum()), 1),
+        'duration_s': round(float(dt.sum()), 1),
+        'moving_time_s': round(moving_time, 1),
+        'avg_speed_kmh': round(float(distance[moving].sum()) / moving_time * 3.6, 2) if moving_time else 0.0,
+        'max_speed_kmh': round(float(speed[continuous].max()) * 3.6, 2) if continuous.any() else None,
+        'start': int(track.timestamp_ms[0]),
+        'end': int(track.timestamp_ms[-1]),
+    })
+
+    if len(speed) >= 2:
+        # Consecutive intervals are (dt[i] + dt[i+1]) / 2 apart, measured at their midpoints
+        step = (dt[:-1] + dt[1:]) / 2
+        both = continuous[:-1] & continuous[1:]
+        longitudinal = np.diff(speed)[both] / step[both]
+        if len(longitudinal):
+            metrics['max_acceleration_ms2'] = round(max(float(longitudinal.max()), 0.0), 2)
+            metrics['max_deceleration_ms2'] = round(max(float(-longitudinal.min()), 0.0), 2)
+
+        heading = _bearing(track.lat[:-1], track.lon[:-1], track.lat[1:], track.lon[1:])
+        turn = np.angle(np.exp(1j * np.diff(heading)))  # wrapped to [-pi, pi]
+        mean_speed = (speed[:-1] + speed[1:]) / 2
+        turning = both & (mean_speed >= LATERAL_MIN_SPEED_MS)
+        lateral = np.abs(_smooth(np.where(turning, turn / step, 0.0))) * mean_speed
+        if turning.any():
+            metrics['max_lateral_acceleration_ms2'] = round(float(lateral[turning].max()), 2)
+    return metrics
+
+
+def trip_metrics(test_id, track=None):
+    """
+    compute_trip_metrics of a test's track, cached until the track changes (the key
+    includes the track fingerprint, one aggregate query to check). Pass the track if
+    it is already loaded.
+    """
+    cache_key = f'trip_metrics:{test_id}:{track_fingerprint(test_id)}'
+    metrics = cache.get(cache_key)
+    if metrics is None:
+        metrics = compute_trip_metrics(load_track(test_id) if track is None else track)
+        cache.set(cache_key, metrics, TRIP_METRICS_CACHE_TIMEOUT)
+    return metrics
@@ -1,21 +1,48 @@
 from django.shortcuts import render
 from django.http import JsonResponse
 from testing.models import Test, TestSpecValue, TestParticipant
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
 from django.views.decorators.csrf import csrf_exempt
 from vd_be.middleware import jwt_authentication
-from testing.serializers import TestSerializer, TestSpecValueSerializer, TestParticipantSerializer
+from testing.serializers import TestSerializer
 import json
-from testing.dto import TestDTO, TestSpecUpdateDTO
-from organisation.models import Project, User, SpecValue, ProjectEmployee
+from testing.dto import TestDTO, TestSpecUpdateDTO, ProjectTestsQueryDTO, TestBatchCreateDTO, TestBatchUpdateDTO, TrackQueryDTO, SpatialQueryDTO, TrackSectionDTO, TrackSectionUpdateDTO, HeatmapTileDTO, TelemetryQueryDTO
+from organisation.models import Project, User
 from django.db import transaction
+from django.utils import timezone
 from pydantic import ValidationError as PydanticValidationError
 
-from .models import Session, Feedback, TestGPSCoordinate, FeedbackAnswer, FeedbackQuestion, TestingBenchmarkParams, CategoryScore, Report
-from .serializers import SessionSerializer, FeedbackSerializer, FeedbackQuestionSerializer, FeedbackAnswerSerializer, FeedbackAnswerCreateSerializer
+from .models import Session, Feedback, FeedbackAnswer, FeedbackQuestion, TestingBenchmarkParams, CategoryScore, Report
+from .serializers import SessionSerializer, FeedbackSerializer, FeedbackQuestionSerializer, FeedbackAnswerSerializer, FeedbackAnswerCreateSerializer, FeedbackRowSerializer
 from organisation.models import User, Vehicle, Organisation, VehicleSpec
+from .analysis import spec_impact_analysis
+from .creation import TestCreationError, clone_source, create_test, create_tests_from_template
+from .alignment import align_instances
+from .access import form_field, has_project_access, json_field, project_access, project_for_test, vehicle_access
+from .gps import GPSIngestError, ingest_gps_points, parse_moment
+from .heatmap import heatmap_tile, tile_fingerprint
+from .idempotency import idempotent
+from .live import hub as live_hub
+from .pyramid import load_pyramid, select_points
+from .sections import section_summary
+from .spatial import find_feedback, find_gps_points, radius_bbox
+from .tracks import from_epoch_ms, load_track, to_epoch_ms
+from .trip_metrics import trip_metrics
+from .mutations import apply_test_operations
+from .models import ProjectSummary, TelemetryChannel, TrackSection
+from .summary import project_summary_data, rebuild_project_summary
+from .telemetry import TelemetryError, ingest_telemetry, query_channel
+from .tagging import tag_feedback
+from .questionnaire import get_questionnaire_bundle, get_questionnaire_version
+from .listing import (
+    bump_tests_version, filter_project_tests, flatten_test_rows, flatten_tests, paginate_tests, test_fieldset,
+    tests_fingerprint
+)
+from vd_be.conditional import fingerprint_condition
+from vd_be.row_serializers import FieldsetError, parse_fieldset
 
 import whisper
+import logging
 import os
 from io import BytesIO
 from django.http import HttpResponse
@@ -30,6 +57,8 @@ from datetime import datetime
 
 model = whisper.load_model("base") 
 
+logger = logging.getLogger(__name__)
+
 def calculate_category_scores(test):
     """
     Calculate category scores for a test based on feedback answers and benchmark parameters.
@@ -100,10 +129,10 @@ def calculate_category_scores(test):
                 'contribution': round(contribution, 2)
             })
     
-    # Store scores in database
+    # Store scores in database; through the related manager each score keeps the
+    # loaded test, so the summary signal does not look its project up again
     for category, score in category_scores.items():
-        CategoryScore.objects.update_or_create(
-            test=test,
+        test.category_scores.update_or_create(
             category=category,
             defaults={'score': round(score, 2)}
         )
@@ -114,87 +143,61 @@ def calculate_category_scores(test):
     }
 
 # Create your views here.
+def project_tests_fingerprint(request, project_id):
+    return tests_fingerprint(project_id)
+
 @csrf_exempt
 @require_http_methods(["GET"])
 @jwt_authentication   
+@project_access('project')
+@fingerprint_condition(project_tests_fingerprint)
 def get_project_tests_view(request, project_id):
-    tests = Test.objects.filter(project=project_id).order_by('-updatedAt')
-    tests_data = TestSerializer(tests, many=True).data
-    test_spec_values = TestSpecValue.objects.filter(test__in=tests)
-    test_spec_values_data = TestSpecValueSerializer(test_spec_values, many=True).data
-    test_participants = TestParticipant.objects.filter(test__in=tests)  
-    test_participants_data = TestParticipantSerializer(test_participants, many=True).data
-
-    # Create a dictionary to map test IDs to their corresponding test_spec_values
-    test_spec_values_dict = {}
-    test_participants_dict = {}
-    
-    for spec_value in test_spec_values_data:
-        # TestSpecValueSerializer serializes test as a nested object, so we need to get the id from it
-        test_id = spec_value.get('test', {}).get('id') if isinstance(spec_value.get('test'), dict) else spec_value.get('test')
-        if test_id is not None:
-            if test_id not in test_spec_values_dict:
-                test_spec_values_dict[test_id] = []
-            test_spec_values_dict[test_id].append(spec_value)
-    
-    for participant in test_participants_data:
-        # TestParticipantSerializer serializes test as just an ID (integer), not a nested object
-        test_id = participant.get('test')
-        if test_id is not None:
-            if test_id not in test_participants_dict:
-                test_participants_dict[test_id] = []
-            test_participants_dict[test_id].append(participant)
-    
-    # Append the relevant test_spec_values to each test in tests_data
-    for test in tests_data:
-        test_id = test.get('id')
-        if test_id is not None:
-            test['spec_values'] = test_spec_values_dict.get(test_id, [])
-            test['participants'] = test_participants_dict.get(test_id, [])
-        else:
-            test['spec_values'] = []
-            test['participants'] = []
+    """
+    List the tests of a project, newest first, in a constant number of queries.
+    Each test references its spec values by id; the SpecValues and Specs themselves
+    are listed once in 'spec_values' and 'specs'.
 
-    return JsonResponse({'tests': tests_data}, status=200)
+    Optional query parameters:
+    - status (comma separated), isReviewed, created_from / created_to (YYYY-MM-DD), participant (user id)
+    - limit (1-500) and cursor for keyset pagination; the response then includes next_cursor
+    - fields (test columns, id is always returned) and include (spec_values, participants, specs);
+      relations left out of include are not queried
+
+    Responses carry an ETag and Last-Modified; a matching If-None-Match gets 304 without
+    the listing being queried.
+    """
+    try:
+        query = ProjectTestsQueryDTO(**request.GET.dict())
+        fields, include = test_fieldset(*parse_fieldset(request))
+    except PydanticValidationError as e:
+        return JsonResponse({'error': f'Validation error: {str(e)}'}, status=400)
+    except FieldsetError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    tests = filter_project_tests(Test.objects.filter(project=project_id), query)
+    if query.limit is None and query.cursor is None:
+        return JsonResponse(flatten_tests(tests.order_by('-updatedAt', '-id'), fields, include), status=200)
+
+    try:
+        test_rows, next_cursor = paginate_tests(tests, query.limit or 50, query.cursor, fields)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({**flatten_test_rows(test_rows, include), 'next_cursor': next_cursor}, status=200)
 
 @csrf_exempt
 @require_http_methods(["POST"])
 @jwt_authentication
-@transaction.atomic
+@project_access('project')
+@idempotent
 def create_test_view(request, project_id):
     try:
         test_dto = TestDTO(**json.loads(request.body))
-        project = Project.get_by_id(project_id) 
-        test_data = {
-            'project': project,
-            'status': 'pending',
-            'notes': '',
-            'isReviewed': False
-        }
-        participants_data = test_dto.participants
-        spec_values_data = test_dto.spec_values
-        test = Test.objects.create(**test_data)
-
-        # Verify if the user is part of the project using ProjectEmployee
-        for participant in participants_data:
-            user = User.get_by_id(participant.user)
-            if not ProjectEmployee.objects.filter(project_id=project_id, user=user).exists():
-                return JsonResponse({'error': f'User {user.id} is not part of the project'}, status=403)
-
-            # Create participants and their roles
-            TestParticipant.objects.create(test=test, role=participant.role, user=user)
-
-        # Create test spec values
-        for spec_value in spec_values_data:
-            try:
-                spec_value_obj = SpecValue.get_by_id(spec_value.spec)
-                TestSpecValue.objects.create(test=test, spec=spec_value_obj, isTestingParam=spec_value.isTestingParam)
-            except SpecValue.DoesNotExist:
-                return JsonResponse({'error': f'SpecValue with id {spec_value.spec} does not exist'}, status=400)
-            except Exception as e:
-                return JsonResponse({'error': f'Error creating TestSpecValue for spec {spec_value.spec}: {str(e)}'}, status=400)
-
+        project = Project.get_by_id(project_id)
+        # Participants and spec values are validated up front and inserted in bulk in one transaction
+        test = create_test(project, test_dto.participants, test_dto.spec_values)
         return JsonResponse({'message': 'success', 'id': test.id}, status=201)
+    except TestCreationError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
     except PydanticValidationError as e:
         return JsonResponse({'error': f'Validation error: {str(e)}'}, status=400)
     except Exception as e:
@@ -203,14 +206,96 @@ def create_test_view(request, project_id):
 @csrf_exempt
 @require_http_methods(["POST"])
 @jwt_authentication
+@project_access('project')
+def create_tests_batch_view(request, project_id):
+    """
+    Create many near-identical tests in one request. Either a template (participants and
+    spec values, as in TestDTO) or clone_from (an existing test of the project whose
+    participants and spec values are copied) is combined with one entry per new test:
+    {
+        "template": {"participants": [...], "spec_values": [...]} | "clone_from": <test_id>,
+        "tests": [{"spec_values": [{"spec": <spec_value_id>, "isTestingParam": true}]}, ...]
+    }
+    A test's spec_values replace the base values of the same Spec. All tests are created
+    in one transaction with bulk inserts; returns their ids in order.
+    """
+    try:
+        batch_dto = TestBatchCreateDTO(**json.loads(request.body))
+        project = Project.get_by_id(project_id)
+        if batch_dto.template is not None:
+            participants = [(participant.user, participant.role) for participant in batch_dto.template.participants]
+            spec_values = [(spec_value.spec, spec_value.isTestingParam) for spec_value in batch_dto.template.spec_values]
+        else:
+            participants, spec_values = clone_source(project.id, batch_dto.clone_from)
+        overrides = [
+            [(spec_value.spec, spec_value.isTestingParam) for spec_value in test.spec_values]
+            for test in batch_dto.tests
+        ]
+        test_ids = create_tests_from_template(project, participants, spec_values, overrides)
+        return JsonResponse({'message': 'success', 'ids': test_ids}, status=201)
+    except TestCreationError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    except Project.DoesNotExist:
+        return JsonResponse({'error': 'Project not found'}, status=404)
+    except PydanticValidationError as e:
+        return JsonResponse({'error': f'Validation error: {str(e)}'}, status=400)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON in request body'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@jwt_authentication
+def batch_update_tests_view(request):
+    """
+    Apply many status changes, review flags and spec swaps in one request:
+    {
+        "operations": [
+            {"type": "status", "test": 1, "status": "completed"},
+            {"type": "review", "test": 1, "isReviewed": true},
+            {"type": "spec", "test": 2, "old_spec_id": 3, "new_spec_id": 4, "isTestingParam": true}
+        ],
+        "all_or_nothing": false
+    }
+    Operations are validated together and applied with a few set-based UPDATEs in one
+    transaction. Invalid operations and tests of projects the user does not work on are
+    skipped (or, with all_or_nothing, nothing is applied and the response is 400);
+    results are listed per operation.
+    """
+    try:
+        batch_dto = TestBatchUpdateDTO(**json.loads(request.body))
+        results, applied = apply_test_operations(
+            batch_dto.operations, batch_dto.all_or_nothing, project_ids=request.principal.project_roles
+        )
+        return JsonResponse({
+            'applied': applied,
+            'succeeded': sum(1 for result in results if result['ok']) if applied else 0,
+            'failed': sum(1 for result in results if not result['ok']),
+            'results': results,
+        }, status=200 if applied else 400)
+    except PydanticValidationError as e:
+        return JsonResponse({'error': f'Validation error: {str(e)}'}, status=400)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON in request body'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@jwt_authentication
+@project_access('test')
 def update_test_spec_value_view(request, test_id):
     update_dto = TestSpecUpdateDTO(**json.loads(request.body))
-    TestSpecValue.objects.filter(test=test_id, spec=update_dto.old_spec_id).update(spec=update_dto.new_spec_id, isTestingParam=update_dto.isTestingParam)
+    TestSpecValue.objects.filter(test=test_id, spec=update_dto.old_spec_id).update(spec=update_dto.new_spec_id, isTestingParam=update_dto.isTestingParam, updatedAt=timezone.now())
+    # .update() skips the post_save signal, so mark the tests listing as changed here
+    bump_tests_version(project_for_test(test_id))
     return JsonResponse({'message': 'success'}, status=200)
 
 @csrf_exempt
 @require_http_methods(["POST"])
 @jwt_authentication
+@project_access('test')
 def mark_test_as_reviewed(request, test_id):
     test = Test.objects.get(id=test_id)
     test.isReviewed = True
@@ -220,6 +305,7 @@ def mark_test_as_reviewed(request, test_id):
 @csrf_exempt
 @require_http_methods(["PATCH"])
 @jwt_authentication
+@project_access('test')
 def update_test_status_view(request, test_id):
     """
     Update the status of a test.
@@ -268,6 +354,8 @@ def update_test_status_view(request, test_id):
 @csrf_exempt
 @require_http_methods(["POST"])
 @jwt_authentication
+@project_access('test', json_field('test_id'))
+@idempotent
 def start_session(request):
     try:
         data = json.loads(request.body)
@@ -316,6 +404,8 @@ def start_session(request):
 @csrf_exempt
 @require_http_methods(["POST"])
 @jwt_authentication
+@project_access('session', form_field('session_id'))
+@idempotent
 def upload_feedback(request):
     try:
         # For multipart/form-data, get data from POST and files from FILES
@@ -323,6 +413,8 @@ def upload_feedback(request):
         audio_file = request.FILES.get('file')
         latitude = request.POST.get('latitude')
         longitude = request.POST.get('longitude')
+        # When the comment was recorded, given like a GPS fix timestamp (epoch or ISO 8601)
+        recorded_at = request.POST.get('recorded_at')
 
         if not session_id or not audio_file:
             return JsonResponse({'error': 'Missing session_id or audio file'}, status=400)
@@ -369,13 +461,29 @@ def upload_feedback(request):
             except (ValueError, TypeError):
                 return JsonResponse({'error': 'Invalid longitude format'}, status=400)
 
+        # Without recorded_at the comment is placed on the track at the upload time
+        recorded_at_value = None
+        if recorded_at:
+            recorded_at_ms = parse_moment(recorded_at)
+            if recorded_at_ms is None:
+                return JsonResponse({
+                    'error': 'recorded_at must be an epoch number or ISO 8601 string, after 2000 and not in the future'
+                }, status=400)
+            recorded_at_value = from_epoch_ms(recorded_at_ms)
+
         # Create feedback
         feedback = Feedback.objects.create(
             session=session,
             audio_file=audio_file,
             latitude=latitude_float,
-            longitude=longitude_float
+            longitude=longitude_float,
+            recorded_at=recorded_at_value
         )
+        # Place the comment on the session's GPS track, if the track already covers it
+        try:
+            align_instances([feedback])
+        except Exception:
+            logger.exception('Aligning feedback %s to the GPS track failed', feedback.id)
 
         # Transcription logic
         audio_path = feedback.audio_file.path
@@ -390,8 +498,17 @@ def upload_feedback(request):
             # Log error but don't fail the request - feedback is still created
             print(f"Transcription failed: {e}")
 
+        # Tag the transcript with benchmark categories
+        if feedback.transcription_text:
+            try:
+                tag_feedback(feedback)
+            except Exception:
+                logger.exception('Tagging feedback %s failed', feedback.id)
+
         serializer = FeedbackSerializer(feedback)
         response_data = serializer.data
+        # Control room dashboards watching the session see the note straight away
+        live_hub.publish_threadsafe(session.id, {'type': 'feedback', 'session_id': session.id, 'feedback': dict(response_data)})
         
         # Include transcription error in response if it occurred
         if transcription_error:
@@ -406,6 +523,7 @@ def upload_feedback(request):
 @csrf_exempt
 @require_http_methods(["GET"])
 @jwt_authentication
+@project_access('test')
 def generate_test_report_pdf(request, test_id):
     """
     Generate a comprehensive PDF report for a test including:
@@ -428,7 +546,7 @@ def generate_test_report_pdf(request, test_id):
         # Fetch all related data
         participants = TestParticipant.objects.filter(test=test).select_related('user')
         test_specs = TestSpecValue.objects.filter(test=test).select_related('spec__spec')
-        gps_coordinates = TestGPSCoordinate.objects.filter(test=test).order_by('timestamp')
+        gps_track = load_track(test.id)  # Packed or row storage
         sessions = Session.objects.filter(test=test)
         feedbacks = Feedback.objects.filter(session__in=sessions).order_by('timestamp')
         feedback_answers = FeedbackAnswer.objects.filter(test=test).select_related('question', 'question__project', 'question__organisation')
@@ -710,16 +828,51 @@ def generate_test_report_pdf(request, test_id):
             story.append(test_spec_table)
             story.append(Spacer(1, 0.3*inch))
         
+        # Trip Metrics
+        if len(gps_track) >= 2:
+            metrics = trip_metrics(test.id, gps_track)
+            story.append(Paragraph("Trip Metrics", heading_style))
+
+            def metric(value, unit):
+                return f"{value:.2f} {unit}" if value is not None else "N/A"
+
+            metrics_data = [
+                ['Metric', 'Value'],
+                ['Distance', f"{metrics['distance_m'] / 1000:.2f} km"],
+                ['Duration', f"{metrics['duration_s'] / 60:.1f} min"],
+                ['Moving Time', f"{metrics['moving_time_s'] / 60:.1f} min"],
+                ['Average Speed', metric(metrics['avg_speed_kmh'], 'km/h')],
+                ['Max Speed', metric(metrics['max_speed_kmh'], 'km/h')],
+                ['Max Acceleration', metric(metrics['max_acceleration_ms2'], 'm/s²')],
+                ['Max Deceleration', metric(metrics['max_deceleration_ms2'], 'm/s²')],
+                ['Max Lateral Acceleration', metric(metrics['max_lateral_acceleration_ms2'], 'm/s²')],
+                ['GPS Outliers Removed', str(metrics['outliers_removed'])],
+            ]
+            metrics_table = Table(metrics_data, colWidths=[3*inch, 3*inch])
+            metrics_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 10),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+                ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ]))
+            story.append(metrics_table)
+            story.append(Spacer(1, 0.3*inch))
+
         # GPS Coordinates
-        if gps_coordinates.exists():
+        if len(gps_track):
             story.append(Paragraph("GPS Coordinates", heading_style))
             gps_headers = [['Latitude', 'Longitude', 'Timestamp']]
             gps_data = []
-            for gps in gps_coordinates:
+            for lat, lon, timestamp in zip(gps_track.lat.tolist(), gps_track.lon.tolist(), gps_track.datetimes()):
                 gps_data.append([
-                    f"{gps.lat:.6f}",
-                    f"{gps.lon:.6f}",
-                    gps.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+                    f"{lat:.6f}",
+                    f"{lon:.6f}",
+                    timestamp.strftime('%Y-%m-%d %H:%M:%S')
                 ])
             
             gps_table = Table(gps_headers + gps_data, colWidths=[2*inch, 2*inch, 2*inch])
@@ -747,8 +900,11 @@ def generate_test_report_pdf(request, test_id):
                     ['Session ID:', str(feedback.session.id)],
                     ['Timestamp:', feedback.timestamp.strftime('%Y-%m-%d %H:%M:%S')],
                 ]
-                if feedback.latitude and feedback.longitude:
-                    feedback_data.append(['Location:', f"Lat: {feedback.latitude:.6f}, Lon: {feedback.longitude:.6f}"])
+                latitude, longitude = feedback.location()
+                if latitude and longitude:
+                    feedback_data.append(['Location:', f"Lat: {latitude:.6f}, Lon: {longitude:.6f}"])
+                if feedback.track_speed_kmh is not None:
+                    feedback_data.append(['Speed:', f"{feedback.track_speed_kmh:.1f} km/h"])
                 if feedback.transcription_text:
                     feedback_data.append(['Transcription:', feedback.transcription_text[:500] + ('...' if len(feedback.transcription_text) > 500 else '')])
                 
@@ -1119,6 +1275,7 @@ def generate_test_report_pdf(request, test_id):
 @csrf_exempt
 @require_http_methods(["GET"])
 @jwt_authentication
+@project_access('project')
 def get_feedback_questions_view(request, project_id):
     """
     Get all feedback questions for a specific project
@@ -1140,6 +1297,8 @@ def get_feedback_questions_view(request, project_id):
 @csrf_exempt
 @require_http_methods(["POST"])
 @jwt_authentication
+@project_access('test', json_field('test'))
+@idempotent
 def create_feedback_answer_view(request):
     """
     Create a feedback answer for a test
@@ -1188,30 +1347,33 @@ def create_feedback_answer_view(request):
         except ValueError:
             return JsonResponse({'error': 'Invalid question_id format'}, status=400)
         
-        # Check if answer already exists for this test and question
-        existing_answer = FeedbackAnswer.objects.filter(test=test, question=question).first()
-        if existing_answer:
-            # Update existing answer
-            existing_answer.rating = rating
-            existing_answer.comment = comment
-            existing_answer.save()
+        # The answer and its category scores are saved together, so the heatmap
+        # cells of the test are refreshed once, on commit
+        with transaction.atomic():
+            # Check if answer already exists for this test and question
+            existing_answer = test.feedbackanswer_set.filter(question=question).first()
+            if existing_answer:
+                # Update existing answer
+                existing_answer.rating = rating
+                existing_answer.comment = comment
+                existing_answer.save()
+                
+                # Recalculate category scores after update
+                calculate_category_scores(test)
+                
+                serializer = FeedbackAnswerSerializer(existing_answer)
+                return JsonResponse(serializer.data, status=200)
             
-            # Recalculate category scores after update
-            calculate_category_scores(test)
+            # Create new answer
+            answer = FeedbackAnswer.objects.create(
+                test=test,
+                question=question,
+                rating=rating,
+                comment=comment
+            )
             
-            serializer = FeedbackAnswerSerializer(existing_answer)
-            return JsonResponse(serializer.data, status=200)
-        
-        # Create new answer
-        answer = FeedbackAnswer.objects.create(
-            test=test,
-            question=question,
-            rating=rating,
-            comment=comment
-        )
-        
-        # Calculate and store category scores after answer is saved
-        calculate_category_scores(test)
+            # Calculate and store category scores after answer is saved
+            calculate_category_scores(test)
         
         serializer = FeedbackAnswerSerializer(answer)
         return JsonResponse(serializer.data, status=201)
@@ -1224,6 +1386,7 @@ def create_feedback_answer_view(request):
 @csrf_exempt
 @require_http_methods(["GET"])
 @jwt_authentication
+@project_access('test')
 def get_category_scores_view(request, test_id):
     """
     Get category scores for a test.
@@ -1289,6 +1452,7 @@ def get_category_scores_view(request, test_id):
 @csrf_exempt
 @require_http_methods(["GET"])
 @jwt_authentication
+@project_access('test')
 def get_test_voice_feedback_view(request, test_id):
     """
     Get all voice feedback (audio feedback) for a specific test.
@@ -1298,7 +1462,8 @@ def get_test_voice_feedback_view(request, test_id):
     1. Find all sessions associated with the test
     2. Find all feedbacks associated with those sessions
     
-    Returns all feedback entries with audio files, transcriptions, and metadata.
+    Returns all feedback entries with audio files, transcriptions, category tags and metadata.
+    Use ?category=<category> to only return feedback tagged with that category.
     """
     try:
         # Validate test exists
@@ -1306,10 +1471,24 @@ def get_test_voice_feedback_view(request, test_id):
         
         # Get all feedbacks for sessions linked to this test
         # Using relationship traversal: Feedback -> Session -> Test
-        feedbacks = Feedback.objects.filter(
-            session__test=test
-        ).select_related('session').order_by('timestamp')
-        
+        feedbacks = Feedback.objects.filter(session__test=test).order_by('timestamp')
+
+        # Optional ?category= filter on transcript tags, e.g. ?category=noise
+        category = request.GET.get('category')
+        if category:
+            feedbacks = feedbacks.filter(tags__category__iexact=category)
+
+        # Sparse fieldsets (?fields= / ?include=) are served straight from values() rows
+        fields, include = parse_fieldset(request)
+        if fields is not None or include is not None:
+            feedbacks_data = FeedbackRowSerializer.serialize(feedbacks, fields, include, context={'request': request})
+            return JsonResponse({
+                'test_id': test_id,
+                'total_feedbacks': len(feedbacks_data),
+                'feedbacks': feedbacks_data
+            }, status=200)
+
+        feedbacks = feedbacks.select_related('session').prefetch_related('tags')
         if not feedbacks.exists():
             return JsonResponse({
                 'test_id': test_id,
@@ -1330,12 +1509,15 @@ def get_test_voice_feedback_view(request, test_id):
         
     except Test.DoesNotExist:
         return JsonResponse({'error': f'Test with id {test_id} not found'}, status=404)
+    except FieldsetError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
 
 @csrf_exempt
 @require_http_methods(["GET", "PATCH"])
 @jwt_authentication
+@project_access('session')
 def session_detail_view(request, session_id):
     """
     Get or update a session by ID.
@@ -1358,6 +1540,8 @@ def session_detail_view(request, session_id):
                 if test_id is not None:
                     try:
                         test = Test.get_by_id(test_id)
+                        if not has_project_access(request, test.project_id):
+                            return JsonResponse({'error': 'You do not have access to this project'}, status=403)
                         session.test = test
                     except Test.DoesNotExist:
                         return JsonResponse({'error': f'Test with id {test_id} not found'}, status=404)
@@ -1393,4 +1577,442 @@ def session_detail_view(request, session_id):
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON in request body'}, status=400)
     except Exception as e:
-        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@jwt_authentication
+@project_access('project')
+def project_spec_impact_view(request, project_id):
+    """
+    Compare category scores across the testing-parameter spec values used by the tests of a project.
+    For each parameter and variant returns per-category test count, mean, variance and
+    effect size (Cohen's d against the other variants of the same parameter).
+    """
+    try:
+        project = Project.get_by_id(project_id)
+        analysis = spec_impact_analysis(project_id=project.id)
+        return JsonResponse({'project_id': project.id, **analysis}, status=200)
+    except Project.DoesNotExist:
+        return JsonResponse({'error': 'Project not found'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@jwt_authentication
+@vehicle_access
+def vehicle_spec_impact_view(request, vehicle_id):
+    """
+    Same analysis as project_spec_impact_view across the projects of a vehicle that
+    the user works on; the response lists them in project_ids.
+    """
+    try:
+        project_ids = sorted(
+            Project.objects.filter(vehicle_id=vehicle_id, id__in=list(request.principal.project_roles)).values_list(
+                'id', flat=True,
+            )
+        )
+        analysis = spec_impact_analysis(vehicle_id=vehicle_id, project_ids=project_ids)
+        return JsonResponse({'vehicle_id': vehicle_id, 'project_ids': project_ids, **analysis}, status=200)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@jwt_authentication
+@project_access('project')
+def project_summary_view(request, project_id):
+    """
+    Dashboard summary for a project: test counts by status, reviewed share, average
+    category scores, feedback counts and latest activity. Reads the materialised
+    ProjectSummary row; it is built on first access.
+    """
+    try:
+        summary = ProjectSummary.objects.filter(project_id=project_id).first()
+        if summary is None:
+            if not Project.objects.filter(id=project_id).exists():
+                return JsonResponse({'error': 'Project not found'}, status=404)
+            summary = rebuild_project_summary(project_id)
+        return JsonResponse({'summary': project_summary_data(summary)}, status=200)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+def questionnaire_etag(request, project_id):
+    version = get_questionnaire_version(project_id)
+    return f'questionnaire-{project_id}-v{version}' if version is not None else None
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@jwt_authentication
+@project_access('project')
+@condition(etag_func=questionnaire_etag)
+def get_questionnaire_bundle_view(request, project_id):
+    """
+    Compact, versioned questionnaire for a project: questions with their categories and
+    weightages, plus category -> question ids. Clients send If-None-Match with the last
+    ETag and get 304 Not Modified until a question or benchmark param changes.
+    """
+    try:
+        version, payload = get_questionnaire_bundle(project_id)
+        response = JsonResponse(payload, status=200)
+        response['ETag'] = f'"questionnaire-{project_id}-v{version}"'
+        return response
+    except Project.DoesNotExist:
+        return JsonResponse({'error': 'Project not found'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+def _gps_ingest_response(request, test_id=None, session_id=None):
+    try:
+        report = ingest_gps_points(request, request.content_type, test_id=test_id, session_id=session_id)
+        return JsonResponse(report, status=200)
+    except GPSIngestError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@jwt_authentication
+@project_access('test')
+def ingest_test_gps_view(request, test_id):
+    """
+    Bulk upload of a GPS track for a test. The body is a JSON array (application/json),
+    NDJSON (application/x-ndjson) or CSV (text/csv) of (lat, lon, timestamp) records:
+        [{"lat": 12.97, "lon": 77.59, "timestamp": "2025-01-01T10:00:00.100Z"}, ...]
+        {"lat": 12.97, "lon": 77.59, "timestamp": 1735725600100}
+        lat,lon,timestamp
+    Timestamps are ISO 8601 or epoch seconds/milliseconds. Invalid rows are reported and
+    skipped; points are stored in time order, once per timestamp, so re-sending an upload
+    inserts nothing new. Returns counts and throughput.
+    """
+    if not Test.objects.filter(id=test_id).exists():
+        return JsonResponse({'error': f'Test with id {test_id} not found'}, status=404)
+    return _gps_ingest_response(request, test_id=test_id)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@jwt_authentication
+@project_access('session')
+def ingest_session_gps_view(request, session_id):
+    """
+    Same as ingest_test_gps_view for a session; points are also linked to the session's
+    test when it has one.
+    """
+    session = Session.objects.filter(id=session_id).values_list('test_id').first()
+    if session is None:
+        return JsonResponse({'error': f'Session with id {session_id} not found'}, status=404)
+    return _gps_ingest_response(request, test_id=session[0], session_id=session_id)
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+@jwt_authentication
+@project_access('session')
+def session_telemetry_view(request, session_id):
+    """
+    GET: the session's telemetry channels with their sample counts and time spans.
+    POST: streaming upload of high-rate samples, as CSV (text/csv) with a timestamp
+    column and one column per channel, or NDJSON (application/x-ndjson) objects:
+        timestamp,accel_x,accel_y,steering_deg,wheel_speed_fl
+        {"timestamp": 1735725600010, "accel_x": 0.12, "steering_deg": -4.5}
+    Empty cells and absent keys are missing samples. Timestamps are ISO 8601 or epoch
+    seconds/milliseconds (fractions kept to the microsecond). Channels are append-only:
+    samples at or before a channel's last stored timestamp are counted as already stored,
+    so re-sending an upload stores nothing new. Returns counts and throughput.
+    """
+    try:
+        if not Session.objects.filter(id=session_id).exists():
+            return JsonResponse({'error': f'Session with id {session_id} not found'}, status=404)
+        if request.method == 'POST':
+            return JsonResponse(ingest_telemetry(request, request.content_type, session_id), status=200)
+        channels = TelemetryChannel.objects.filter(session_id=session_id).order_by('name')
+        return JsonResponse({
+            'session_id': session_id,
+            'channels': [
+                {
+                    'name': channel.name,
+                    'sample_count': channel.sample_count,
+                    'chunk_count': channel.chunk_count,
+                    'stored_bytes': channel.stored_bytes,
+                    'start_time': channel.start_time.isoformat() if channel.start_time else None,
+                    'end_time': channel.end_time.isoformat() if channel.end_time else None,
+                    'min_value': channel.min_value,
+                    'max_value': channel.max_value,
+                }
+                for channel in channels
+            ],
+        }, status=200)
+    except TelemetryError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@jwt_authentication
+@project_access('session')
+def session_telemetry_channel_view(request, session_id, name):
+    """
+    Samples of one telemetry channel.
+
+    Optional query parameters:
+    - start / end (ISO 8601 or epoch) to restrict the time window
+    - max_points (2-20000, default 2000)
+
+    Only the chunks overlapping the window are read. Up to max_points samples come back
+    as they are ({"decimated": false, "timestamp_ms", "values"}); a longer window is
+    decimated server-side into max_points equal time buckets ({"decimated": true,
+    "bucket_ms", "timestamp_ms", "min", "max", "mean", "count"}), timestamp_ms being
+    each bucket's start.
+    """
+    try:
+        query = TelemetryQueryDTO(**request.GET.dict())
+    except PydanticValidationError as e:
+        return JsonResponse({'error': f'Validation error: {str(e)}'}, status=400)
+    try:
+        data = query_channel(
+            session_id, name,
+            start_us=int(query.start.timestamp() * 1_000_000) if query.start else None,
+            end_us=int(query.end.timestamp() * 1_000_000) if query.end else None,
+            max_points=query.max_points,
+        )
+        if data is None:
+            return JsonResponse({'error': f'Session {session_id} has no telemetry channel {name}'}, status=404)
+        return JsonResponse({'session_id': session_id, 'channel': name, **data}, status=200)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@jwt_authentication
+@project_access('test')
+def get_test_track_view(request, test_id):
+    """
+    A test's GPS track at a resolution that fits max_points.
+
+    Optional query parameters:
+    - start / end (ISO 8601 or epoch) to restrict the time window
+    - bbox=min_lon,min_lat,max_lon,max_lat to restrict the area
+    - max_points (2-20000, default 2000)
+
+    Points come from the finest precomputed Douglas-Peucker level that has at most
+    max_points in the window, so an overview of a long drive and a zoomed-in corner
+    both return a bounded payload: {"level", "total_points", "returned",
+    "points": [[lat, lon, timestamp_ms], ...]}. Level 0 is full resolution.
+    """
+    try:
+        query = TrackQueryDTO(**request.GET.dict())
+    except PydanticValidationError as e:
+        return JsonResponse({'error': f'Validation error: {str(e)}'}, status=400)
+    try:
+        if not Test.objects.filter(id=test_id).exists():
+            return JsonResponse({'error': f'Test with id {test_id} not found'}, status=404)
+        track, levels = load_pyramid(test_id)
+        level, index = select_points(
+            track, levels,
+            start_ms=to_epoch_ms(query.start) if query.start else None,
+            end_ms=to_epoch_ms(query.end) if query.end else None,
+            bbox=query.bbox,
+            max_points=query.max_points,
+        )
+        points = track.select(index)
+        return JsonResponse({
+            'test_id': test_id,
+            'level': level,
+            'total_points': len(track),
+            'returned': len(points),
+            'points': [list(point) for point in zip(points.lat.tolist(), points.lon.tolist(), points.timestamp_ms.tolist())],
+        }, status=200)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@jwt_authentication
+@project_access('test')
+def get_test_trip_metrics_view(request, test_id):
+    """
+    Distance, duration, speed and acceleration metrics of a test's GPS track.
+
+    Computed over the whole track with NumPy after dropping isolated GPS jumps, and
+    cached per test until the track changes.
+    """
+    try:
+        if not Test.objects.filter(id=test_id).exists():
+            return JsonResponse({'error': f'Test with id {test_id} not found'}, status=404)
+        return JsonResponse({'test_id': test_id, **trip_metrics(test_id)}, status=200)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+def _location_search_response(request, scope, owner):
+    """Run a SpatialQueryDTO query over the tests matched by scope (a dict of Test lookups)."""
+    try:
+        query = SpatialQueryDTO(**request.GET.dict())
+    except PydanticValidationError as e:
+        return JsonResponse({'error': f'Validation error: {str(e)}'}, status=400)
+    if query.bbox is not None:
+        bbox, center = query.bbox, None
+    else:
+        bbox, center = radius_bbox(query.lat, query.lon, query.radius_m), (query.lat, query.lon, query.radius_m)
+    find = find_feedback if query.source == 'feedback' else find_gps_points
+    total, results = find(scope, bbox, center=center, limit=query.limit)
+    return JsonResponse({
+        **owner,
+        'source': query.source,
+        'total': total,
+        'returned': len(results),
+        'results': results,
+    }, status=200)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@jwt_authentication
+@project_access('project')
+def project_location_search_view(request, project_id):
+    """
+    Voice feedback (source=feedback, the default) or GPS points (source=gps) of a
+    project's tests inside an area: a circle (lat, lon, radius_m up to 50 km,
+    nearest first) or a bbox=min_lon,min_lat,max_lon,max_lat (in time order).
+
+    Candidates are read through the geohash index and checked exactly, so the cost
+    follows the size of the area rather than the number of rows.
+    """
+    try:
+        if not Project.objects.filter(id=project_id).exists():
+            return JsonResponse({'error': 'Project not found'}, status=404)
+        return _location_search_response(request, {'project_id': project_id}, {'project_id': project_id})
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@jwt_authentication
+@vehicle_access
+def vehicle_location_search_view(request, vehicle_id):
+    """
+    Same search as project_location_search_view across the vehicle's projects that
+    the user is a member of.
+    """
+    try:
+        scope = {'project__vehicle_id': vehicle_id, 'project_id__in': list(request.principal.project_roles)}
+        return _location_search_response(request, scope, {'vehicle_id': vehicle_id})
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+def vehicle_heatmap_fingerprint(request, vehicle_id, tile):
+    return tile_fingerprint(vehicle_id, tile.lower())
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@jwt_authentication
+@vehicle_access
+@fingerprint_condition(vehicle_heatmap_fingerprint)
+def vehicle_heatmap_tile_view(request, vehicle_id, tile):
+    """
+    Feedback heatmap of all tests of one of the organisation's vehicles inside a geohash tile, split into
+    cells of ?precision= (up to 3 characters finer than the tile, by default 2):
+    feedback count, mean test rating, tag counts and mean category scores per cell.
+
+    Read from the precomputed FeedbackHeatCells; responses are cached per tile and
+    carry an ETag that changes only when a cell of the tile does.
+    """
+    try:
+        query = HeatmapTileDTO(tile=tile, **request.GET.dict())
+    except PydanticValidationError as e:
+        return JsonResponse({'error': f'Validation error: {str(e)}'}, status=400)
+    try:
+        return JsonResponse(heatmap_tile(vehicle_id, query.tile, query.precision), status=200)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+def _track_section_data(section):
+    return {
+        'id': section.id,
+        'name': section.name,
+        'polygon': section.polygon,
+        'bbox': [section.min_lon, section.min_lat, section.max_lon, section.max_lat],
+        'updatedAt': section.updatedAt.isoformat(),
+    }
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+@jwt_authentication
+def track_sections_view(request):
+    """
+    GET: the track sections of the user's organisation.
+    POST: create one: {"name": str, "polygon": [[lon, lat], ...]} (at least 3 vertices).
+    """
+    try:
+        organisation_id = request.principal.organisation_id
+        if request.method == 'GET':
+            sections = TrackSection.objects.filter(organisation_id=organisation_id).order_by('id')
+            return JsonResponse({'track_sections': [_track_section_data(section) for section in sections]}, status=200)
+
+        dto = TrackSectionDTO(**json.loads(request.body))
+        if TrackSection.objects.filter(organisation_id=organisation_id, name=dto.name).exists():
+            return JsonResponse({'error': f'A track section named {dto.name} already exists'}, status=400)
+        section = TrackSection.objects.create(
+            organisation_id=organisation_id, name=dto.name, polygon=[list(vertex) for vertex in dto.polygon]
+        )
+        return JsonResponse(_track_section_data(section), status=201)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON in request body'}, status=400)
+    except PydanticValidationError as e:
+        return JsonResponse({'error': f'Validation error: {str(e)}'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+@csrf_exempt
+@require_http_methods(["PATCH", "DELETE"])
+@jwt_authentication
+def track_section_detail_view(request, section_id):
+    """
+    PATCH: rename a section or replace its polygon ({"name"}, {"polygon"} or both).
+    DELETE: remove it. Only sections of the user's organisation are visible.
+    """
+    try:
+        section = TrackSection.objects.filter(id=section_id, organisation_id=request.principal.organisation_id).first()
+        if section is None:
+            return JsonResponse({'error': f'Track section with id {section_id} not found'}, status=404)
+        if request.method == 'DELETE':
+            section.delete()
+            return JsonResponse({'message': 'Track section deleted'}, status=200)
+
+        dto = TrackSectionUpdateDTO(**json.loads(request.body))
+        if dto.name is not None and dto.name != section.name:
+            if TrackSection.objects.filter(organisation_id=section.organisation_id, name=dto.name).exists():
+                return JsonResponse({'error': f'A track section named {dto.name} already exists'}, status=400)
+            section.name = dto.name
+        if dto.polygon is not None:
+            section.polygon = [list(vertex) for vertex in dto.polygon]
+        section.save()
+        return JsonResponse(_track_section_data(section), status=200)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON in request body'}, status=400)
+    except PydanticValidationError as e:
+        return JsonResponse({'error': f'Validation error: {str(e)}'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@jwt_authentication
+@project_access('test')
+def get_test_sections_view(request, test_id):
+    """
+    A test split by its organisation's track sections: per section the GPS points,
+    visits, time spent and distance, and the voice feedback placed in it with its
+    transcript tag counts; "outside" holds the rest. Cached per test until the
+    track, the sections or the feedback change.
+    """
+    try:
+        summary = section_summary(test_id)
+        if summary is None:
+            return JsonResponse({'error': f'Test with id {test_id} not found'}, status=404)
+        return JsonResponse({'test_id': test_id, **summary}, status=200)
+    except Exception as e:
+        return JsonResponse({'error': f'Unexpected error: {str(e)}'}, status=500)
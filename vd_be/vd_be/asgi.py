@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vd_be.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once the app registry is ready
+from testing.live import session_telemetry  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """HTTP goes to Django; WebSockets (/ws/sessions/<id>/) to the live session telemetry."""
+    if scope['type'] == 'websocket':
+        await session_telemetry(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,36 @@
+import hashlib
+
+from django.views.decorators.http import condition
+
+
+def fingerprint_condition(fingerprint_func, last_modified=True):
+    """
+    Conditional GET for list endpoints. fingerprint_func(request, *args, **kwargs)
+    returns (row count, latest updatedAt, version or None) from one aggregate query;
+    it is evaluated once per request and yields both the ETag (which also covers the
+    query string) and Last-Modified. Matching If-None-Match / If-Modified-Since
+    requests get 304 before the view runs, so nothing is queried or serialised.
+
+    Pass last_modified=False when the latest updatedAt can move backwards (deleting
+    the newest row) and no version row keeps it moving: only the ETag is sent then.
+    """
+    def fingerprint(request, *args, **kwargs):
+        if not hasattr(request, '_fingerprint'):
+            request._fingerprint = fingerprint_func(request, *args, **kwargs)
+        return request._fingerprint
+
+    def etag(request, *args, **kwargs):
+        count, latest, version = fingerprint(request, *args, **kwargs)
+        raw = '|'.join([
+            request.path,
+            '&'.join(sorted(f'{key}={value}' for key, values in request.GET.lists() for value in values)),
+            str(count),
+            latest.isoformat() if latest else '',
+            str(version),
+        ])
+        return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+    def last_modified_func(request, *args, **kwargs):
+        return fingerprint(request, *args, **kwargs)[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified_func if last_modified else None)
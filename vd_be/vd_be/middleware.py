@@ -1,7 +1,101 @@
 from django.http import JsonResponse
 import jwt
 from django.conf import settings
-from functools import wraps
+from functools import cached_property, wraps
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+# Verified claims are reused for this long at most (and never past the token's exp)
+TOKEN_CACHE_TTL = 300
+TOKEN_CACHE_SIZE = 4096
+
+
+class TokenCache:
+    """
+    Bounded LRU of verified JWT claims keyed by the SHA-256 digest of the token, so a
+    warm token costs a dictionary lookup instead of an HMAC verification. Entries
+    expire after ttl seconds or at the token's exp, whichever comes first.
+    """
+
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, digest):
+        """Cached claims, or None if unknown or expired."""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return claims
+
+    def set(self, digest, claims):
+        expires_at = time.time() + self.ttl
+        if 'exp' in claims:
+            expires_at = min(expires_at, float(claims['exp']))
+        with self._lock:
+            self._entries[digest] = (claims, expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class Principal:
+    """
+    The authenticated user of a request. The user row (with its organisation) and the
+    project memberships are loaded on first access and then reused for the request.
+    """
+
+    def __init__(self, user_id, claims):
+        self.user_id = user_id
+        self.claims = claims
+
+    @cached_property
+    def user(self):
+        """Raises User.DoesNotExist if the account was deleted after the token was issued."""
+        from organisation.models import User
+        return User.objects.select_related('organisation').get(id=self.user_id)
+
+    @property
+    def organisation_id(self):
+        return self.user.organisation_id
+
+    @cached_property
+    def project_roles(self):
+        """{project_id: role} for every project the user works on."""
+        from organisation.membership import get_project_roles
+        return get_project_roles(self.user_id)
+
+
+def verify_token(token):
+    """Claims of a valid token, from the cache when possible. Raises jwt.InvalidTokenError."""
+    digest = TokenCache.digest(token)
+    claims = token_cache.get(digest)
+    if claims is None:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
+        token_cache.set(digest, claims)
+    return claims
+
 
 def jwt_authentication(view_func):
     @wraps(view_func)
@@ -9,14 +103,15 @@ def jwt_authentication(view_func):
         token = request.COOKIES.get('jwt')  # Get the token from the 'jwt' cookie
         if token is not None:
             try:
-                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
+                payload = verify_token(token)
                 request.user_id = payload['user_id']
+                request.principal = Principal(payload['user_id'], payload)
             except jwt.ExpiredSignatureError:
                 return JsonResponse({'error': 'Token has expired'}, status=401)
-            except jwt.InvalidTokenError:
+            except (jwt.InvalidTokenError, KeyError):
                 return JsonResponse({'error': 'Invalid token'}, status=401)
         else:
             return JsonResponse({'error': 'Authorization cookie missing'}, status=401)
 
         return view_func(request, *args, **kwargs)
-    return _wrapped_view
\ No newline at end of file
+    return _wrapped_view
@@ -0,0 +1,211 @@
+from functools import lru_cache
+from operator import itemgetter
+
+from django.db import models
+from rest_framework import serializers
+
+# (fields, include) combinations compiled per serializer; the least recently used are dropped
+PLAN_CACHE_SIZE = 128
+
+# Model fields whose values are rendered the way the DRF serializers of the list
+# endpoints render them (e.g. datetimes with microseconds and a Z suffix), so a
+# sparse response carries the same strings as the full one. DateTimeField comes
+# before its parent DateField.
+_REPRESENTATIONS = [
+    (models.DateTimeField, serializers.DateTimeField().to_representation),
+    (models.DateField, serializers.DateField().to_representation),
+    (models.TimeField, serializers.TimeField().to_representation),
+    (models.UUIDField, serializers.UUIDField().to_representation),
+]
+
+
+class FieldsetError(ValueError):
+    pass
+
+
+def parse_fieldset(request):
+    """
+    Read the sparse fieldset parameters of a list request:
+    ?fields=id,status&include=user,spec.spec
+    Returns (fields, include); each is a list of names or None when absent.
+    """
+    def split(name):
+        value = request.GET.get(name)
+        if value is None:
+            return None
+        return [part.strip() for part in value.split(',') if part.strip()]
+    return split('fields'), split('include')
+
+
+def _representation(model, lookup):
+    """The DRF to_representation for the model field a lookup ends on, or None."""
+    field = None
+    for part in lookup.split('__'):
+        field = model._meta.get_field(part)
+        if field.is_relation:
+            model = field.related_model
+    for field_class, represent in _REPRESENTATIONS:
+        if isinstance(field, field_class):
+            return lambda value: None if value is None else represent(value)
+    return None
+
+
+def represent_rows(model, rows):
+    """
+    Render the columns of values() rows of model in place the way the DRF
+    serializers do (see _REPRESENTATIONS); returns the rows.
+    """
+    if rows:
+        represented = [
+            (name, represent) for name in rows[0] if (represent := _representation(model, name)) is not None
+        ]
+        for row in rows:
+            for name, represent in represented:
+                row[name] = represent(row[name])
+    return rows
+
+
+class _Plan:
+    def __init__(self, columns, build, many):
+        self.columns = columns
+        self.build = build
+        self.many = many
+
+
+class RowSerializer:
+    """
+    Serialises querysets straight from values_list() rows, without creating model
+    instances or per-object serializer instances.
+
+    fields:   output name -> ORM lookup, e.g. {'id': 'id', 'user': 'user_id'}
+    related:  include name -> (lookup prefix, RowSerializer) for forward foreign keys;
+              the related columns are fetched in the same query through a join
+    many:     include name -> (lookup from the child to this model, RowSerializer) for
+              reverse foreign keys; fetched with one extra query per include
+    computed: output name -> (lookups it needs, function(values, context))
+
+    The column list and row builder for each requested (fields, include) combination
+    are compiled once and reused. Names are de-duplicated and put in declaration
+    order first, so permutations of a request share a plan, and at most
+    PLAN_CACHE_SIZE plans are kept.
+    """
+
+    def __init__(self, model, fields, default_fields=None, related=None, many=None, computed=None):
+        self.model = model
+        self.fields = fields
+        self.default_fields = list(default_fields or fields)
+        self.related = related or {}
+        self.many = many or {}
+        self.computed = computed or {}
+        self._compile_plan = lru_cache(maxsize=PLAN_CACHE_SIZE)(self._build_plan)
+
+    @property
+    def available_fields(self):
+        return list(self.fields) + list(self.computed)
+
+    def _split_include(self, include):
+        direct = {}
+        for name in include:
+            head, _, rest = name.partition('.')
+            if head not in self.related and head not in self.many:
+                raise FieldsetError(f'Unknown include: {name}')
+            nested = direct.setdefault(head, [])
+            if rest:
+                nested.append(rest)
+        return direct
+
+    def compile(self, fields=None, include=None, prefix=''):
+        if fields is not None:
+            order = {name: index for index, name in enumerate(self.available_fields)}
+            for name in fields:
+                if name not in order:
+                    raise FieldsetError(f'Unknown field: {name}')
+            fields = tuple(sorted(set(fields), key=order.__getitem__))
+        include = tuple(sorted(set(include or ())))
+        self._split_include(include)
+        return self._compile_plan(fields, include, prefix)
+
+    def _build_plan(self, fields, include, prefix):
+        fields = self.default_fields if fields is None else fields
+        include = self._split_include(include)
+
+        # values_list() drops repeated column names, so each lookup is selected once
+        columns = [prefix + 'id']
+        positions = {prefix + 'id': 0}
+
+        def position(lookup):
+            column = prefix + lookup
+            if column not in positions:
+                positions[column] = len(columns)
+                columns.append(column)
+            return positions[column]
+
+        plain = [name for name in fields if name in self.fields]
+        plain_getter = itemgetter(*[position(self.fields[name]) for name in plain]) if plain else None
+        represented = [
+            (name, represent) for name in plain
+            if (represent := _representation(self.model, self.fields[name])) is not None
+        ]
+
+        computed = []
+        for name in fields:
+            if name in self.computed:
+                lookups, function = self.computed[name]
+                computed.append((name, itemgetter(*[position(lookup) for lookup in lookups]), len(lookups), function))
+
+        nested = []
+        many = []
+        for name, nested_include in include.items():
+            if name in self.related:
+                lookup_prefix, serializer = self.related[name]
+                plan = serializer.compile(None, nested_include, prefix + lookup_prefix + '__')
+                start = len(columns)
+                columns.extend(plan.columns)
+                nested.append((name, start, len(plan.columns), plan))
+            else:
+                lookup, serializer = self.many[name]
+                many.append((name, lookup, serializer, nested_include))
+
+        def build(row, context):
+            if row[0] is None:
+                return None
+            if plain_getter is None:
+                values = ()
+            elif len(plain) == 1:
+                values = (plain_getter(row),)
+            else:
+                values = plain_getter(row)
+            output = dict(zip(plain, values))
+            for name, represent in represented:
+                output[name] = represent(output[name])
+            for name, getter, count, function in computed:
+                value = getter(row)
+                output[name] = function(value if count > 1 else (value,), context)
+            for name, start, count, plan in nested:
+                output[name] = plan.build(row[start:start + count], context)
+            return output
+
+        return _Plan(columns, build, many)
+
+    def serialize(self, queryset, fields=None, include=None, context=None):
+        """Serialise a queryset of self.model. Raises FieldsetError for unknown names."""
+        plan = self.compile(fields, include)
+        rows = list(queryset.values_list(*plan.columns))
+        if rows and len(rows[0]) != len(plan.columns):
+            raise FieldsetError('Overlapping columns between included relations')
+        output = [plan.build(row, context) for row in rows]
+
+        for name, lookup, serializer, nested_include in plan.many:
+            ids = [row[0] for row in rows]
+            child_plan = serializer.compile(None, nested_include)
+            if child_plan.many:
+                raise FieldsetError(f'Nested list includes under {name} are not supported')
+            children = {}
+            child_rows = serializer.model.objects.filter(**{f'{lookup}__in': ids}).order_by('id').values_list(
+                lookup, *child_plan.columns
+            )
+            for child in child_rows:
+                children.setdefault(child[0], []).append(child_plan.build(child[1:], context))
+            for row, item in zip(rows, output):
+                item[name] = children.get(row[0], [])
+        return output
@@ -131,4 +131,28 @@ MEDIA_ROOT = BASE_DIR  # Files are stored in BASE_DIR/feedback_audios/ as per ex
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-AUTH_USER_MODEL = 'organisation.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'organisation.User'
+# The project membership map (organisation/membership.py) and the test/session
+# owner lookups of the access checks (testing/access.py) are cached here and
+# invalidated by signals. The default LocMemCache is per process: an invalidation
+# only reaches the worker that made the change, and the others keep the old entry
+# until its short TTL (5 minutes and 60 seconds) runs out. Set REDIS_URL to share
+# one cache between workers so changes apply everywhere at once (needs `redis`).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Where bulk GPS uploads for a test are stored: 'packed' keeps one compressed
+# TestGPSTrack per test, 'rows' one TestGPSCoordinate per point
+GPS_TRACK_STORAGE = os.environ.get('GPS_TRACK_STORAGE', 'packed')
+# Directory of the per-session telemetry channel files (testing/telemetry.py)
+TELEMETRY_ROOT = os.environ.get('TELEMETRY_ROOT', os.path.join(BASE_DIR, 'telemetry'))
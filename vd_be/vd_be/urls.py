@@ -19,10 +19,16 @@ from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
 from organisation.views import login_view, signup_view, user_details_view, user_projects_view, project_employees_view, vehicle_specs_view
-from testing.views import get_project_tests_view, create_test_view, mark_test_as_reviewed, update_test_spec_value_view, update_test_status_view
+from testing.views import get_project_tests_view, create_test_view, create_tests_batch_view, batch_update_tests_view, mark_test_as_reviewed, update_test_spec_value_view, update_test_status_view
 from testing.views import upload_feedback, start_session, generate_test_report_pdf
 from testing.views import get_feedback_questions_view, create_feedback_answer_view, get_category_scores_view
 from testing.views import get_test_voice_feedback_view, session_detail_view
+from testing.views import project_spec_impact_view, vehicle_spec_impact_view, project_summary_view
+from testing.views import get_questionnaire_bundle_view
+from testing.views import project_location_search_view, vehicle_location_search_view, vehicle_heatmap_tile_view
+from testing.views import track_sections_view, track_section_detail_view, get_test_sections_view
+from testing.views import ingest_test_gps_view, ingest_session_gps_view, get_test_track_view, get_test_trip_metrics_view
+from testing.views import session_telemetry_view, session_telemetry_channel_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -34,6 +40,8 @@ urlpatterns = [
     path('project/<int:project_id>/employees/', project_employees_view, name='project_employees'),
     path('project/<int:project_id>/tests/', get_project_tests_view, name='get_project_tests'),
     path('project/<int:project_id>/test/', create_test_view, name='create_test'),
+    path('project/<int:project_id>/tests/batch/', create_tests_batch_view, name='create_tests_batch'),
+    path('tests/batch-update/', batch_update_tests_view, name='batch_update_tests'),
     path('test/<int:test_id>/reviewed/', mark_test_as_reviewed, name='mark_test_as_reviewed'),
     path('test/<int:test_id>/status/', update_test_status_view, name='update_test_status'),
     path('test/<int:test_id>/spec/', update_test_spec_value_view, name='update_test_spec_value'),
@@ -46,6 +54,22 @@ urlpatterns = [
     path('test/<int:test_id>/voice-feedback/', get_test_voice_feedback_view, name='get_test_voice_feedback'),
     path('test/<int:test_id>/voice-recordings/', get_test_voice_feedback_view, name='get_test_voice_recordings'),
     path('sessions/<int:session_id>/', session_detail_view, name='session_detail'),
+    path('test/<int:test_id>/gps/', ingest_test_gps_view, name='ingest_test_gps'),
+    path('test/<int:test_id>/track/', get_test_track_view, name='get_test_track'),
+    path('test/<int:test_id>/trip-metrics/', get_test_trip_metrics_view, name='get_test_trip_metrics'),
+    path('test/<int:test_id>/sections/', get_test_sections_view, name='get_test_sections'),
+    path('track-sections/', track_sections_view, name='track_sections'),
+    path('track-sections/<int:section_id>/', track_section_detail_view, name='track_section_detail'),
+    path('sessions/<int:session_id>/gps/', ingest_session_gps_view, name='ingest_session_gps'),
+    path('sessions/<int:session_id>/telemetry/', session_telemetry_view, name='session_telemetry'),
+    path('sessions/<int:session_id>/telemetry/<str:name>/', session_telemetry_channel_view, name='session_telemetry_channel'),
+    path('project/<int:project_id>/spec-impact/', project_spec_impact_view, name='project_spec_impact'),
+    path('vehicle/<int:vehicle_id>/spec-impact/', vehicle_spec_impact_view, name='vehicle_spec_impact'),
+    path('project/<int:project_id>/summary/', project_summary_view, name='project_summary'),
+    path('project/<int:project_id>/questionnaire/', get_questionnaire_bundle_view, name='get_questionnaire_bundle'),
+    path('project/<int:project_id>/location-search/', project_location_search_view, name='project_location_search'),
+    path('vehicle/<int:vehicle_id>/location-search/', vehicle_location_search_view, name='vehicle_location_search'),
+    path('vehicle/<int:vehicle_id>/heatmap/<str:tile>/', vehicle_heatmap_tile_view, name='vehicle_heatmap_tile'),
 ]
 
 # Serve media files in development